@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DocuSpace.settings')
+# Sous ASGI, les vues d'entrées/sorties utilisent leur version asynchrone
+os.environ.setdefault('FILES_ASYNC_VIEWS', 'True')
+# Pas de connexions persistantes : sous ASGI, elles ne seraient jamais réutilisées
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
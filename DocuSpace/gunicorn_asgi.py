@@ -0,0 +1,19 @@
+"""
+Profil de déploiement ASGI : gunicorn supervise des workers uvicorn.
+
+    gunicorn DocuSpace.asgi:application -c DocuSpace/gunicorn_asgi.py
+
+Chaque worker sert de nombreuses requêtes à la fois (vues asynchrones de
+files/async_views.py) : un téléversement ou un téléchargement lent
+n'immobilise plus un worker entier.
+"""
+import multiprocessing
+import os
+
+worker_class = 'uvicorn_worker.UvicornWorker'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Les téléversements par morceaux peuvent être longs sur une connexion lente
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
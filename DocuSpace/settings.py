@@ -63,12 +63,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Mesures par requête, en premier pour inclure le coût des autres middlewares
+    'files.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, utilisable aussi par les vues asynchrones sous ASGI
+    'files.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware avec l'utilisateur en cache (voir files/user_cache.py)
+    'files.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,16 +101,84 @@ WSGI_APPLICATION = 'DocuSpace.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connexions persistantes (secondes, 0 : une connexion par requête), vérifiées
+# avant réutilisation. Sous ASGI, DocuSpace/asgi.py les désactive : chaque
+# requête y tourne dans un thread différent et ne réutiliserait pas la sienne.
+CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+
+# SQLite : moteur qui accepte OPTIONS['transaction_mode'] (voir files/backends/sqlite3)
+SQLITE_ENGINE = 'files.backends.sqlite3'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': SQLITE_ENGINE,
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Verrou d'écriture pris dès le BEGIN : attente plutôt qu'un refus
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
 database_url = os.environ.get('DATABASE_URL')
 if database_url:
-    DATABASES['default'] = dj_database_url.parse(database_url)
+    DATABASES['default'] = dj_database_url.parse(
+        database_url, conn_max_age=CONN_MAX_AGE, conn_health_checks=True,
+    )
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES['default']['ENGINE'] = SQLITE_ENGINE
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+
+# Pragmas SQLite posés à chaque nouvelle connexion (voir files/database.py) :
+# lectures non bloquées par les écritures (WAL), attente du verrou plutôt
+# qu'une erreur « database is locked », lectures par projection mémoire.
+FILES_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Cache : mémoire locale par défaut (un cache par processus, suffisant en
+# développement). Avec plusieurs workers, utiliser un cache partagé, par exemple
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache et CACHE_LOCATION=redis://...
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'docuspace'),
+    }
+}
+
+# Cache vu par tous les processus (Redis, Memcached, base...). Les sessions,
+# l'utilisateur connecté et le tableau de bord n'y sont gardés qu'à cette
+# condition : une entrée effacée dans la mémoire locale d'un worker
+# (déconnexion, mot de passe changé, document ajouté) resterait servie par les autres.
+# Avec le cache par défaut (mémoire locale) :
+# - serveur de développement (DEBUG) : un seul processus, sessions cached_db,
+#   utilisateur et tableau de bord en cache ;
+# - déploiement (DEBUG=False, plusieurs workers) : sessions en base,
+#   utilisateur relu et tableau de bord recalculé à chaque requête.
+# benchmark mesure la première configuration, benchmark --without-shared-cache la seconde.
+FILES_SHARED_CACHE = os.environ.get('FILES_SHARED_CACHE', str(CACHE_BACKEND not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+))) == 'True'
+
+# Sessions lues dans le cache partagé (ou local sous DEBUG), la base n'étant interrogée qu'en cas
+# d'absence (et écrite seulement quand la session change) ; en base sinon.
+# 'signed_cookies' supprime aussi ces écritures, mais une session ne peut alors
+# plus être révoquée côté serveur : un cookie copié reste valable jusqu'à son expiration.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', (
+    'django.contrib.sessions.backends.cached_db' if FILES_SHARED_CACHE or DEBUG
+    else 'django.contrib.sessions.backends.db'
+))
+
+# Durée de vie (secondes) de l'utilisateur connecté en cache (avec FILES_SHARED_CACHE ou DEBUG)
+FILES_USER_CACHE_TIMEOUT = int(os.environ.get('FILES_USER_CACHE_TIMEOUT', '300'))
 
 
 # Password validation
@@ -175,8 +247,24 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': os.environ.get('CLOUDINARY_API_SECRET'),
 }
 
+# Stockage à deux niveaux (voir files/storage.py) : cache local sur disque devant
+# Cloudinary, ou devant un stockage distant simulé en développement
+FILES_TIERED_STORAGE = {
+    'REMOTE': os.environ.get('FILES_REMOTE_STORAGE', (
+        'cloudinary_storage.storage.MediaCloudinaryStorage' if not DEBUG
+        else 'files.storage.SimulatedRemoteStorage'
+    )),
+    'CACHE_DIR': os.environ.get('FILES_STORAGE_CACHE_DIR', os.path.join(BASE_DIR, 'storage_cache')),
+    'CACHE_MAX_SIZE': int(os.environ.get('FILES_STORAGE_CACHE_MAX_SIZE', str(1024 ** 3))),
+    # Stockage distant simulé : dossier et latence (secondes) par appel
+    'SIMULATED_REMOTE_DIR': os.environ.get('FILES_SIMULATED_REMOTE_DIR', os.path.join(BASE_DIR, 'remote_media')),
+    'SIMULATED_LATENCY': float(os.environ.get('FILES_SIMULATED_LATENCY', '0.05')),
+}
+
+if os.environ.get('FILES_TIERED_STORAGE', 'False') == 'True':
+    DEFAULT_FILE_STORAGE = 'files.storage.TieredStorage'
 # Utiliser Cloudinary uniquement en production
-if not DEBUG:
+elif not DEBUG:
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 else:
     # En développement, utiliser le stockage local
@@ -185,6 +273,56 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Gestionnaires de téléversement : quota vérifié avant de lire le fichier, puis
+# empreinte calculée pendant sa réception
+FILE_UPLOAD_HANDLERS = [
+    'files.upload_handlers.QuotaUploadHandler',
+    'files.upload_handlers.ChecksumMemoryFileUploadHandler',
+    'files.upload_handlers.ChecksumTemporaryFileUploadHandler',
+]
+
+# Téléversement par morceaux : fichiers partiels stockés localement (hors MEDIA_ROOT,
+# pour ne jamais être servis) jusqu'à leur transfert vers le stockage
+FILES_UPLOAD_STAGING_DIR = os.environ.get('FILES_UPLOAD_STAGING_DIR', os.path.join(BASE_DIR, 'upload_staging'))
+# Avec FILES_TASK_BACKEND='database', les workers tournent souvent sur une autre
+# machine que le serveur web : le processus web envoie alors lui-même le fichier
+# reçu au stockage, dans un thread d'arrière-plan, et les workers ne font que
+# créer le document. True si le dossier de transit est partagé (même machine,
+# volume commun), pour que les workers se chargent aussi de l'envoi.
+FILES_UPLOAD_STAGING_SHARED = os.environ.get('FILES_UPLOAD_STAGING_SHARED', 'False') == 'True'
+FILES_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Taille conseillée aux clients
+FILES_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024  # Taille maximale acceptée par requête
+
+# Traitements en arrière-plan (voir files/tasks.py) : 'thread' en développement,
+# 'database' en production avec le processus worker du Procfile (manage.py run_workers)
+FILES_TASK_BACKEND = os.environ.get('FILES_TASK_BACKEND', 'thread' if DEBUG else 'database')
+FILES_TASK_THREADS = int(os.environ.get('FILES_TASK_THREADS', '2'))
+
+# Durée de validité (secondes) des URL de téléchargement sur un stockage distant
+FILES_DOWNLOAD_URL_EXPIRES = 300
+
+# Vues asynchrones pour les listes, téléversements et téléchargements (voir
+# files/async_views.py). Activé par DocuSpace/asgi.py : sous WSGI, les vues
+# synchrones restent plus efficaces.
+FILES_ASYNC_VIEWS = os.environ.get('FILES_ASYNC_VIEWS', 'False') == 'True'
+
+# Durée de vie (secondes) des données du tableau de bord en cache, avec
+# FILES_SHARED_CACHE (voir files/caching.py)
+FILES_DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('FILES_DASHBOARD_CACHE_TIMEOUT', '600'))
+
+# Quota d'espace par utilisateur en octets (voir files/usage.py), modifiable
+# utilisateur par utilisateur dans l'admin (StorageUsage) ; None (variable
+# d'environnement vide, FILES_DEFAULT_QUOTA=) : pas de limite
+FILES_DEFAULT_QUOTA = os.environ.get('FILES_DEFAULT_QUOTA', str(5 * 1024 ** 3)).strip()
+FILES_DEFAULT_QUOTA = int(FILES_DEFAULT_QUOTA) if FILES_DEFAULT_QUOTA else None
+
+# Mesures par requête (voir files/instrumentation.py) : en-tête Server-Timing,
+# seuil (ms) de journalisation des requêtes lentes avec leurs requêtes SQL, et
+# jeton attendu par /metrics (Authorization: Bearer ...) en plus des comptes staff
+FILES_SERVER_TIMING = os.environ.get('FILES_SERVER_TIMING', str(DEBUG)) == 'True'
+FILES_SLOW_REQUEST_MS = int(os.environ.get('FILES_SLOW_REQUEST_MS', '500'))
+FILES_METRICS_TOKEN = os.environ.get('FILES_METRICS_TOKEN')
+
 # Configuration pour les icônes Font Awesome
 FONTAWESOME_5_CSS = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css'
 FONTAWESOME_5_PREFIX = 'fa'
@@ -8,4 +8,4 @@ pip install -r requirements.txt
 python manage.py collectstatic --no-input
 
 # Migration de la base de données
-python manage.py migrate        
\ No newline at end of file
+python manage.py migrate
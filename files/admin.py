@@ -2,7 +2,12 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Folder, Document
+from .models import Blob, Folder, FolderTree, Document, DocumentVersion, Job, StorageUsage
 
 admin.site.register(Folder)
 admin.site.register(Document)
+admin.site.register(DocumentVersion)
+admin.site.register(Blob)
+admin.site.register(Job)
+admin.site.register(StorageUsage)
+admin.site.register(FolderTree)
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class FilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'files'
+
+    def ready(self):
+        # Connexion des récepteurs de signaux
+        from . import signals  # noqa: F401
+        # Vérifications de la configuration (voir checks.py)
+        from . import checks  # noqa: F401
+        # Points de mesure des requêtes (voir instrumentation.py)
+        from . import instrumentation
+        instrumentation.install()
+        # Pragmas SQLite des nouvelles connexions (voir database.py)
+        from . import database
+        database.install()
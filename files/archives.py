@@ -0,0 +1,207 @@
+"""
+Archive ZIP d'un dossier et de ses sous-dossiers, produite à la volée.
+
+L'archive est écrite par zipfile dans un tampon non positionnable
+(StreamBuffer) vidé après chaque bloc : la réponse commence dès le premier
+fichier et la mémoire utilisée ne dépend pas de la taille de l'archive
+(seul le répertoire central, quelques dizaines d'octets par entrée, est
+gardé jusqu'à la fin). Sans retour en arrière possible, zipfile place la
+taille et le CRC de chaque fichier dans un descripteur qui suit ses données.
+
+Les formats déjà compressés (images, vidéos, archives, PDF, documents
+Office) sont stockés tels quels : les recompresser coûte du temps
+processeur sans réduire leur taille.
+"""
+import logging
+import os
+import zipfile
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .downloads import STREAM_CHUNK_SIZE, download_filename
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+# Types de contenu stockés sans compression
+STORED_CONTENT_TYPES = {
+    'application/pdf',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-bzip2',
+    'application/x-xz',
+    'application/x-7z-compressed',
+    'application/x-rar-compressed',
+    'application/vnd.rar',
+    'application/epub+zip',
+    'application/java-archive',
+}
+STORED_CONTENT_TYPE_PREFIXES = (
+    'image/', 'video/', 'audio/',
+    # Formats Office et OpenDocument : des archives ZIP
+    'application/vnd.openxmlformats-officedocument.',
+    'application/vnd.oasis.opendocument.',
+)
+# Exceptions : formats d'image ou de son non compressés
+DEFLATED_CONTENT_TYPES = {'image/bmp', 'image/svg+xml', 'image/tiff', 'audio/wav', 'audio/x-wav'}
+
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp3', '.m4a', '.ogg', '.flac', '.mp4', '.mov', '.mkv', '.webm', '.avi',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.pdf', '.epub', '.jar',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp',
+}
+
+# Les en-têtes ZIP64 précèdent les données : ils sont écrits d'emblée pour
+# les gros fichiers et ceux dont la taille n'a pas été mémorisée
+ZIP64_THRESHOLD = int(zipfile.ZIP64_LIMIT * 0.9)
+
+DOCUMENT_BATCH_SIZE = 500
+
+
+class StreamBuffer:
+    """
+    Sortie de zipfile : garde les octets écrits jusqu'à ce qu'on les retire.
+    Sans méthode seek, zipfile écrit l'archive d'un seul tenant.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def compression_for(document):
+    """
+    ZIP_STORED pour un contenu déjà compressé, ZIP_DEFLATED sinon.
+    """
+    content_type = (document.content_type or '').split(';')[0].strip().lower()
+    if content_type in DEFLATED_CONTENT_TYPES:
+        return zipfile.ZIP_DEFLATED
+    if content_type in STORED_CONTENT_TYPES or content_type.startswith(STORED_CONTENT_TYPE_PREFIXES):
+        return zipfile.ZIP_STORED
+    if os.path.splitext(document.file.name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def safe_name(name):
+    # Un nom d'entrée ne doit ni créer de niveau ni remonter l'arborescence
+    name = name.replace('/', '_').replace('\\', '_').strip()
+    return '_' if name in ('', '.', '..') else name
+
+
+def unique_name(name, taken):
+    """
+    `name`, ou « nom (2).ext »... s'il est déjà pris dans `taken` (qui est complété).
+    """
+    candidate = name
+    stem, extension = os.path.splitext(name)
+    n = 2
+    while candidate.lower() in taken:
+        candidate = f'{stem} ({n}){extension}'
+        n += 1
+    taken.add(candidate.lower())
+    return candidate
+
+
+def folder_paths(folder):
+    """
+    Chemin dans l'archive de chaque dossier du sous-arbre de `folder`
+    ({id: "Dossier/Sous-dossier/"}), en une requête. Les parents
+    précèdent leurs enfants (tri sur le chemin matérialisé).
+    """
+    paths = {folder.pk: safe_name(folder.name) + '/'}
+    taken = {}
+    for subfolder in folder.descendants().order_by('path').only('id', 'name', 'parent_id'):
+        parent_path = paths.get(subfolder.parent_id)
+        if parent_path is None:
+            continue
+        name = unique_name(safe_name(subfolder.name), taken.setdefault(subfolder.parent_id, set()))
+        paths[subfolder.pk] = f'{parent_path}{name}/'
+    return paths, taken
+
+
+def zip_info(arcname, moment, compression):
+    info = zipfile.ZipInfo(arcname, date_time=timezone.localtime(moment).timetuple()[:6])
+    info.compress_type = compression
+    # Droits du fichier une fois extrait (rw-r--r--)
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def iter_folder_zip(folder):
+    """
+    Contenu de l'archive ZIP du sous-arbre de `folder`, par morceaux.
+    """
+    buffer = StreamBuffer()
+    paths, taken = folder_paths(folder)
+    documents = (
+        Document.objects.filter(owner_id=folder.owner_id, folder__path__startswith=folder.path)
+        .order_by('folder__path', 'title', 'id')
+        .only('id', 'title', 'file', 'folder_id', 'size', 'content_type', 'uploaded_at')
+    )
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        # Dossiers, y compris vides
+        for path in paths.values():
+            info = zip_info(path, folder.created_at, zipfile.ZIP_STORED)
+            info.external_attr = 0o40755 << 16 | 0x10
+            archive.writestr(info, b'')
+        yield buffer.drain()
+
+        # Documents, lus par lots depuis la base et par blocs depuis le stockage
+        for document in documents.iterator(chunk_size=DOCUMENT_BATCH_SIZE):
+            try:
+                source = document.file.open('rb')
+            except (OSError, ValueError):
+                # Fichier absent du stockage : l'archive reste utilisable sans lui
+                logger.exception("Fichier introuvable pour le document %s", document.pk)
+                continue
+            name = unique_name(safe_name(download_filename(document)), taken.setdefault(document.folder_id, set()))
+            info = zip_info(paths[document.folder_id] + name, document.uploaded_at, compression_for(document))
+            try:
+                with archive.open(info, 'w', force_zip64=document.size > ZIP64_THRESHOLD or not document.size) as entry:
+                    for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+                        entry.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            finally:
+                source.close()
+            data = buffer.drain()
+            if data:
+                yield data
+    # Répertoire central
+    yield buffer.drain()
+
+
+def folder_zip_response(folder, stream=None):
+    """
+    Réponse qui transmet l'archive de `folder` au fil de sa production.
+    `stream` adapte le générateur (version asynchrone, voir async_storage.py).
+    """
+    content = iter_folder_zip(folder)
+    response = StreamingHttpResponse(stream(content) if stream else content, content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'{safe_name(folder.name)}.zip')
+    response['Cache-Control'] = 'private, no-store'
+    # Pas de mise en tampon par un proxy nginx : le téléchargement démarre aussitôt
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,66 @@
+"""
+Accès au stockage depuis les vues asynchrones.
+
+Les backends de stockage Django sont synchrones (Cloudinary passe par
+requests) : chaque appel est déporté dans un thread avec sync_to_async,
+pour que la boucle d'événements continue de servir les autres requêtes
+pendant les entrées/sorties. Aucun de ces appels ne touche à la base de
+données, ils peuvent donc tourner hors du thread principal
+(thread_sensitive=False) et en parallèle.
+"""
+from asgiref.sync import sync_to_async
+
+from .downloads import STREAM_CHUNK_SIZE
+
+
+def offload(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def aiter_range(f, start, length, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Équivalent asynchrone de downloads.iter_range : `length` octets de `f`
+    à partir de `start`, chaque lecture se faisant dans un thread.
+    """
+    try:
+        await offload(f.seek)(start)
+        while length > 0:
+            chunk = await offload(f.read)(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await offload(f.close)()
+
+
+async def aiter_file(f, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Contenu complet de `f`, lu par blocs dans un thread.
+    """
+    try:
+        while True:
+            chunk = await offload(f.read)(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await offload(f.close)()
+
+
+async def aiter_sync(iterator):
+    """
+    Parcourt un générateur synchrone qui interroge la base (archives.py) :
+    chaque élément est produit dans le thread de la requête
+    (thread_sensitive), les lectures ne bloquent pas la boucle d'événements.
+    """
+    next_item = sync_to_async(next)
+    done = object()
+    try:
+        while True:
+            item = await next_item(iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        await sync_to_async(iterator.close)()
@@ -0,0 +1,203 @@
+"""
+Versions asynchrones des vues d'entrées/sorties (listes, téléversement,
+téléchargement), utilisées quand l'application tourne sous ASGI
+(réglage FILES_ASYNC_VIEWS, activé par DocuSpace/asgi.py).
+
+Un worker uvicorn sert alors de nombreux téléversements et téléchargements
+lents en parallèle : les requêtes passent par l'ORM asynchrone et les
+accès au stockage ou au disque sont déportés dans des threads
+(async_storage.py), au lieu de monopoliser un worker chacun.
+
+Django 4.2 n'offre pas encore de version asynchrone de login_required,
+require_http_methods, du rendu des gabarits ni des prefetch : ces parties
+passent par sync_to_async.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import redirect, render, resolve_url
+from django.template.loader import render_to_string
+
+from . import uploads, usage
+from .archives import folder_zip_response
+from .async_storage import aiter_range, aiter_sync, offload
+from .caching import acached_dashboard
+from .downloads import document_response
+from .listings import amove_targets, folder_listing
+from .models import Document, Folder, StorageUsage, UploadSession
+from .pagination import InvalidCursor, akeyset_page
+from .views import upload_session_payload
+
+
+def async_login_required(view):
+    """
+    Équivalent de login_required(login_url='login') pour une vue asynchrone.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # L'utilisateur est chargé (session puis base) hors de la boucle d'événements
+        authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not authenticated:
+            return redirect_to_login(request.get_full_path(), resolve_url('login'))
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def allowed_methods(request, methods):
+    if request.method not in methods:
+        return HttpResponseNotAllowed(methods)
+    return None
+
+
+@async_login_required
+async def home(request):
+    """
+    Tableau de bord (voir views.home).
+    """
+    user = request.user
+    cursor = request.GET.get('cursor')
+
+    async def build():
+        # Prefetch non disponible en itération asynchrone avec Django 4.2
+        folders = await sync_to_async(list)(folder_listing(user))
+        root_documents = Document.objects.filter(owner=user, folder__isnull=True).select_related('blob')
+        page = await akeyset_page(root_documents, cursor)
+        return {
+            'folders': folders,
+            'documents_without_folder': page.documents,
+            'documents_count': await root_documents.acount(),
+            'next_cursor': page.next_cursor,
+            'move_targets': await amove_targets(user),
+            'usage': await StorageUsage.objects.filter(user=user).afirst() or StorageUsage(user=user),
+        }
+
+    try:
+        context = await build() if cursor else await acached_dashboard(user.pk, build)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur de pagination invalide.")
+
+    return await sync_to_async(render)(request, 'files/home.html', context)
+
+
+@async_login_required
+async def document_rows(request):
+    """
+    Fragment JSON pour le chargement progressif (voir views.document_rows).
+    """
+    folder = None
+    folder_id = request.GET.get('folder')
+    if folder_id:
+        folder = await Folder.objects.filter(id=folder_id, owner=request.user).afirst() if folder_id.isdigit() else None
+        if folder is None:
+            raise Http404("Dossier introuvable.")
+
+    documents = Document.objects.filter(owner=request.user, folder=folder).select_related('blob')
+    try:
+        page = await akeyset_page(documents, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur de pagination invalide.")
+
+    html = await sync_to_async(render_to_string)(
+        'files/partials/document_rows.html', {'documents': page.documents}, request=request,
+    )
+    return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+
+@async_login_required
+async def upload_document(request):
+    """
+    Téléversement classique (voir views.upload_document). Sous ASGI, le
+    corps de la requête est reçu sans bloquer de worker ; son analyse et le
+    déplacement du fichier se font dans un thread.
+    """
+    if request.method == 'POST':
+        files = await sync_to_async(lambda: request.FILES)()
+        # Fichier refusé pendant sa réception : il dépasse l'espace restant
+        if getattr(request, 'upload_quota_exceeded', False):
+            return await upload_form(request, quota_exceeded=True)
+        if files.get('file'):
+            title = request.POST['title']
+            folder_id = request.POST.get('folder')
+            # Vérification de sécurité : s'assurer que le dossier appartient bien à l'utilisateur
+            folder = None
+            if folder_id and folder_id.isdigit():
+                folder = await Folder.objects.filter(owner=request.user, id=folder_id).afirst()
+            try:
+                await sync_to_async(usage.check_quota)(
+                    request.user, files['file'].size, getattr(request, 'storage_usage', None),
+                )
+            except usage.QuotaExceeded:
+                return await upload_form(request, quota_exceeded=True)
+
+            await sync_to_async(uploads.stage_upload)(request.user, title, files['file'], folder=folder)
+            await sync_to_async(messages.success)(request, "Document reçu, il apparaîtra dans quelques instants.")
+            return redirect('home')
+
+    return await upload_form(request)
+
+
+async def upload_form(request, quota_exceeded=False):
+    folders = [folder async for folder in Folder.objects.filter(owner=request.user).order_by('path')]
+    context = {'folders': folders, 'usage': await sync_to_async(usage.get_usage)(request.user)}
+    if quota_exceeded:
+        await sync_to_async(messages.error)(request, "Espace de stockage insuffisant pour ce fichier.")
+    return await sync_to_async(render)(request, 'files/upload.html', context, status=413 if quota_exceeded else 200)
+
+
+@async_login_required
+async def upload_session_detail(request, session_id):
+    """
+    GET : position atteinte ; PUT : ajoute un morceau (voir views.upload_session_detail).
+    L'écriture du morceau sur disque se fait hors de la boucle d'événements.
+    """
+    not_allowed = allowed_methods(request, ['GET', 'PUT'])
+    if not_allowed:
+        return not_allowed
+    session = await UploadSession.objects.filter(id=session_id, owner=request.user).afirst()
+    if session is None:
+        raise Http404("Session de téléversement introuvable.")
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': "En-tête Upload-Offset manquant."}, status=400)
+        try:
+            uploads.check_chunk(session, offset, length)
+            await offload(uploads.write_chunk)(session, offset, request, length)
+            await sync_to_async(uploads.record_chunk)(session, offset, length)
+        except uploads.UploadError as e:
+            await session.arefresh_from_db()
+            return JsonResponse(dict(upload_session_payload(session), error=str(e)), status=e.status)
+
+    return JsonResponse(upload_session_payload(session))
+
+
+@async_login_required
+async def download_document(request, document_id):
+    """
+    Téléchargement (voir views.download_document) : le fichier est envoyé
+    par un générateur asynchrone qui lit le disque dans un thread.
+    """
+    document = await Document.objects.filter(id=document_id, owner=request.user).afirst()
+    if document is None:
+        raise Http404("Document introuvable.")
+    return await offload(document_response)(
+        request, document, as_attachment='download' in request.GET, stream=aiter_range,
+    )
+
+
+@async_login_required
+async def download_folder(request, folder_id):
+    """
+    Archive ZIP d'un dossier (voir views.download_folder), produite dans
+    un thread morceau par morceau.
+    """
+    folder = await Folder.objects.filter(id=folder_id, owner=request.user).afirst()
+    if folder is None:
+        raise Http404("Dossier introuvable.")
+    return folder_zip_response(folder, stream=aiter_sync)
@@ -0,0 +1,36 @@
+"""
+Moteur SQLite de Django avec l'option OPTIONS['transaction_mode'] de
+Django 5.1 : 'IMMEDIATE' fait prendre le verrou d'écriture dès l'ouverture
+des transactions (BEGIN IMMEDIATE).
+
+Avec le BEGIN par défaut (DEFERRED), une transaction qui lit puis écrit
+doit convertir son verrou de lecture en verrou d'écriture ; si une autre
+connexion a écrit entre-temps, SQLite refuse aussitôt (« database is
+locked ») sans tenir compte de busy_timeout. En prenant le verrou dès le
+BEGIN, la transaction attend son tour (busy_timeout) puis ne peut plus
+échouer pour cette raison. En mode WAL, les lectures hors transaction ne
+sont jamais bloquées.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = (None, 'DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Option propre à ce moteur, inconnue de sqlite3.connect
+        mode = params.pop('transaction_mode', None)
+        mode = mode.upper() if mode else None
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode doit valoir DEFERRED, EXCLUSIVE ou IMMEDIATE (reçu {mode!r})."
+            )
+        self.transaction_mode = mode
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}' if self.transaction_mode else 'BEGIN')
@@ -0,0 +1,296 @@
+"""
+Outils de génération de données synthétiques pour les benchmarks.
+
+Les données sont insérées avec bulk_create, sans écrire de fichier sur le
+stockage : les documents pointent tous vers un nom de fichier fictif.
+
+Mesures (latences, requêtes SQL, mémoire), génération de charge HTTP
+concurrente et comparaison à une référence : voir la commande benchmark.
+"""
+import random
+import statistics
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections
+
+from .models import Document, Folder
+
+# Préfixe des comptes créés par les benchmarks, pour pouvoir les purger
+BENCH_USER_PREFIX = 'bench-'
+
+# Nom de fichier fictif partagé par tous les documents générés
+BENCH_FILE_NAME = 'documents/benchmark.txt'
+
+
+def seed_users(count, prefix=BENCH_USER_PREFIX):
+    """
+    Crée `count` utilisateurs sans mot de passe utilisable.
+    """
+    users = [User(username=f'{prefix}{i}') for i in range(count)]
+    for user in users:
+        user.set_unusable_password()
+    User.objects.bulk_create(users, batch_size=1000)
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def seed_folders(owner, count, parent=None):
+    """
+    Crée `count` dossiers pour `owner` sous `parent`.
+    """
+    folders = Folder.objects.bulk_create(
+        [Folder(name=f'Dossier {i}', owner=owner, parent=parent) for i in range(count)],
+        batch_size=1000,
+    )
+    # bulk_create ne passe pas par save() : chemins matérialisés renseignés ici
+    for folder in folders:
+        folder.path = folder.build_path()
+        folder.depth = folder.path.count('/') - 1
+    Folder.objects.bulk_update(folders, ['path', 'depth'], batch_size=1000)
+    return folders
+
+
+def seed_documents(owner, count, folders=(), root_ratio=0.2, batch_size=5000):
+    """
+    Crée `count` documents pour `owner`, répartis au hasard entre les
+    `folders` donnés et la racine (proportion `root_ratio`).
+    """
+    folders = list(folders)
+    batch = []
+    for i in range(count):
+        in_root = not folders or random.random() < root_ratio
+        batch.append(Document(
+            title=f'Document {i}',
+            file=BENCH_FILE_NAME,
+            folder=None if in_root else random.choice(folders),
+            owner=owner,
+            size=random.randint(1_000, 5_000_000),
+            content_type='application/pdf',
+        ))
+        if len(batch) >= batch_size:
+            Document.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Document.objects.bulk_create(batch)
+
+
+def seed_tree(owner, depth, fan_out, parent=None):
+    """
+    Crée une arborescence de `depth` niveaux, `fan_out` sous-dossiers par
+    dossier, et retourne tous les dossiers créés (niveau par niveau).
+    """
+    created = []
+    level = [parent]
+    for _ in range(depth):
+        next_level = []
+        for folder in level:
+            next_level.extend(seed_folders(owner, fan_out, parent=folder))
+        created.extend(next_level)
+        level = next_level
+    return created
+
+
+def purge(prefix=BENCH_USER_PREFIX):
+    """
+    Supprime les utilisateurs de benchmark et toutes leurs données.
+    """
+    users = User.objects.filter(username__startswith=prefix)
+    Document.objects.filter(owner__in=users).delete()
+    Folder.objects.filter(owner__in=users).delete()
+    users.delete()
+
+
+def analyze():
+    """
+    Met à jour les statistiques du planificateur (SQLite et PostgreSQL).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def measure(func, repeat):
+    """
+    Exécute `func` `repeat` fois et retourne les latences en millisecondes.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, pct):
+    """
+    Percentile `pct` (0-100) d'une liste de latences.
+    """
+    if len(timings) < 2:
+        return timings[0] if timings else 0.0
+    return statistics.quantiles(timings, n=100, method='inclusive')[pct - 1]
+
+
+def profile(func):
+    """
+    Exécute `func` une fois et retourne le nombre de requêtes SQL, dont
+    les écritures (sous SQLite, chacune prend le verrou de toute la base
+    et bloque les autres workers), et le pic de mémoire allouée en Kio.
+    """
+    counts = {'queries': 0, 'writes': 0}
+
+    def count(execute, sql, params, many, context):
+        counts['queries'] += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            counts['writes'] += 1
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(count):
+            func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(counts, peak_kb=peak / 1024)
+
+
+def summarize(timings):
+    return {
+        'p50': percentile(timings, 50),
+        'p99': percentile(timings, 99),
+        'mean': statistics.fmean(timings) if timings else 0.0,
+    }
+
+
+def fetch(url, headers):
+    """
+    GET `url` ; retourne (latence en ms, statut HTTP).
+    """
+    request = urllib.request.Request(url, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return (time.perf_counter() - start) * 1000, status
+
+
+def load(urls, headers, total, concurrency):
+    """
+    Envoie `total` requêtes GET réparties sur `urls` avec `concurrency`
+    clients simultanés. Retourne latences, débit et nombre d'erreurs.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: fetch(urls[i % len(urls)], headers), range(total)))
+    elapsed = time.perf_counter() - start
+    timings = [latency for latency, _status in results]
+    return dict(
+        summarize(timings),
+        requests=total,
+        concurrency=concurrency,
+        throughput=total / elapsed if elapsed else 0.0,
+        errors=sum(1 for _latency, status in results if status is None or status >= 400),
+    )
+
+
+def concurrent_load(workers, duration):
+    """
+    Exécute chaque `worker(n)` en boucle dans son propre thread (donc avec
+    sa propre connexion à la base) pendant `duration` secondes.
+    Retourne, par nom de worker, latences, débit et nombre d'opérations
+    refusées par la base (« database is locked »).
+    """
+    deadline = time.perf_counter() + duration
+
+    def run(worker):
+        timings, errors = [], 0
+        try:
+            n = 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    worker(n)
+                except OperationalError:
+                    errors += 1
+                else:
+                    timings.append((time.perf_counter() - start) * 1000)
+                n += 1
+        finally:
+            connections.close_all()
+        return timings, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        results = list(executor.map(run, [worker for _name, worker in workers]))
+    elapsed = time.perf_counter() - start
+
+    totals = {}
+    for (name, _worker), (timings, errors) in zip(workers, results):
+        total = totals.setdefault(name, {'timings': [], 'errors': 0, 'threads': 0})
+        total['timings'].extend(timings)
+        total['errors'] += errors
+        total['threads'] += 1
+    return {
+        name: dict(
+            summarize(total['timings']),
+            threads=total['threads'],
+            operations=len(total['timings']),
+            throughput=len(total['timings']) / elapsed if elapsed else 0.0,
+            errors=total['errors'],
+        )
+        for name, total in totals.items()
+    }
+
+
+def compare(results, baseline):
+    """
+    Régressions de `results` par rapport à `baseline` : requêtes SQL (ou
+    écritures) plus nombreuses, ou référence mesurée avec d'autres sessions
+    ou caches. Ces comptes ne dépendent pas de la machine, contrairement aux
+    latences (voir slowdowns). Retourne la liste des messages.
+    """
+    regressions = []
+    # Référence mesurée avec d'autres caches : les comptes ne sont pas comparables
+    for key in ('session_engine', 'user_cache', 'dashboard_cache'):
+        expected = baseline.get('config', {}).get(key)
+        current = results.get('config', {}).get(key)
+        if expected is not None and current != expected:
+            regressions.append(f"configuration : {key}={current} (référence {expected})")
+    for name, reference in baseline.get('scenarios', {}).items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            continue
+        if current['queries'] > reference['queries']:
+            regressions.append(f"{name} : {current['queries']} requêtes SQL (référence {reference['queries']})")
+        if 'writes' in reference and current['writes'] > reference['writes']:
+            regressions.append(f"{name} : {current['writes']} écritures SQL (référence {reference['writes']})")
+    return regressions
+
+
+def slowdowns(results, baseline, threshold):
+    """
+    Latences p50/p99 de `results` plus de `threshold` (fraction) au-dessus
+    de `baseline`. Signalées sans faire échouer la commande : elles varient
+    d'une machine à l'autre. Retourne la liste des messages.
+    """
+    messages = []
+    for name, reference in baseline.get('scenarios', {}).items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            continue
+        for key in ('p50', 'p99'):
+            limit = reference[key] * (1 + threshold)
+            if current[key] > limit:
+                messages.append(
+                    f"{name} : {key} {current[key]:.2f} ms (référence {reference[key]:.2f} ms, "
+                    f"limite {limit:.2f} ms)"
+                )
+    return messages
@@ -0,0 +1,219 @@
+"""
+Stockage adressé par le contenu, avec comptage de références.
+
+Chaque contenu distinct (identifié par son empreinte SHA-256) est stocké une
+seule fois dans un Blob ; les documents identiques pointent vers le même
+blob. Le fichier n'est supprimé du stockage que lorsque plus aucun document
+ne le référence.
+"""
+import logging
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef
+
+from . import caching, tasks
+from .models import Blob, Document, DocumentVersion
+
+logger = logging.getLogger(__name__)
+
+# Nombre de blobs supprimés par transaction lors du ramasse-miettes
+GC_BATCH_SIZE = 100
+
+# Références libérées en attente, par thread (voir deferred_release)
+_pending = threading.local()
+
+
+def acquire_blob(content, checksum, content_type=''):
+    """
+    Retourne le blob du contenu `content` en incrémentant son compteur de
+    références. Le fichier n'est envoyé au stockage que si ce contenu n'y
+    est pas encore.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(checksum=checksum).first()
+        if blob is not None:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            blob.ref_count += 1
+            return blob
+
+    # Envoi au stockage hors transaction : il peut être long (Cloudinary)
+    blob = Blob(checksum=checksum, size=content.size, content_type=content_type, ref_count=1)
+    blob.file.save(os.path.basename(content.name or checksum), content, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Le même contenu a été stocké en parallèle : on garde l'autre copie
+        blob.file.storage.delete(blob.file.name)
+        return acquire_blob(content, checksum, content_type)
+    return blob
+
+
+def release_blobs(blob_ids):
+    """
+    Décrémente le compteur de références des blobs donnés (un identifiant
+    par document supprimé ou détaché). Les blobs qui ne sont plus référencés
+    sont supprimés en arrière-plan par collect_garbage_task.
+    """
+    blob_ids = [pk for pk in blob_ids if pk]
+    if getattr(_pending, 'blob_ids', None) is not None:
+        _pending.blob_ids.extend(blob_ids)
+        return
+
+    counts = Counter(blob_ids)
+    # Un UPDATE par nombre de références libérées, et non par blob
+    by_count = {}
+    for blob_id, count in counts.items():
+        by_count.setdefault(count, []).append(blob_id)
+    for count, ids in by_count.items():
+        Blob.objects.filter(pk__in=ids).update(ref_count=F('ref_count') - count)
+    if counts:
+        tasks.enqueue(collect_garbage_task, list(counts))
+
+
+@contextmanager
+def deferred_release():
+    """
+    Regroupe les références libérées dans le bloc (suppressions en masse)
+    et les décrémente en une seule fois à la sortie.
+    """
+    if getattr(_pending, 'blob_ids', None) is not None:
+        # Déjà dans un bloc différé : c'est lui qui libérera
+        yield
+        return
+    _pending.blob_ids = []
+    try:
+        yield
+        released = _pending.blob_ids
+    finally:
+        _pending.blob_ids = None
+    release_blobs(released)
+
+
+@tasks.task
+def collect_garbage_task(blob_ids=None):
+    return collect_garbage(blob_ids)
+
+
+def collect_garbage(blob_ids=None, batch_size=GC_BATCH_SIZE):
+    """
+    Supprime les blobs sans référence, par lots : les lignes d'abord, puis
+    les fichiers correspondants (et leurs aperçus) sur le stockage.
+    Retourne le nombre de blobs supprimés.
+    """
+    candidates = Blob.objects.filter(
+        ~Exists(Document.objects.filter(blob=OuterRef('pk'))),
+        ~Exists(DocumentVersion.objects.filter(blob=OuterRef('pk'))),
+        ref_count__lte=0,
+    ).order_by('pk')
+    if blob_ids is not None:
+        candidates = candidates.filter(pk__in=blob_ids)
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            # Verrouillage des candidats : acquire_blob ne peut pas les
+            # réutiliser pendant leur suppression
+            batch = list(candidates.select_for_update().values_list('pk', 'file', 'thumbnail', 'preview')[:batch_size])
+            if not batch:
+                break
+            Blob.objects.filter(pk__in=[row[0] for row in batch]).delete()
+        # Contenu d'origine et images dérivées
+        delete_files([name for row in batch for name in row[1:] if name])
+        deleted += len(batch)
+    return deleted
+
+
+def delete_files(names):
+    """
+    Supprime des fichiers du stockage, en un appel groupé quand le
+    stockage le permet (méthode delete_many), sinon un par un.
+    """
+    storage = Blob._meta.get_field('file').storage
+    if hasattr(storage, 'delete_many'):
+        storage.delete_many(names)
+        return
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception("Impossible de supprimer le fichier %s", name)
+
+
+def reconcile_owner(owner_id, dry_run=False, batch_size=500):
+    """
+    Rattache à des blobs les documents de `owner_id` qui n'en ont pas encore
+    (documents antérieurs à la déduplication), en requêtes groupées :
+
+    - un blob est créé par empreinte inconnue, en adoptant le fichier déjà
+      stocké d'un des documents (aucun renvoi de données) ;
+    - tous les documents de même contenu pointent ensuite vers ce fichier ;
+    - les fichiers devenus inutiles sont supprimés du stockage.
+
+    Retourne un dictionnaire de statistiques.
+    """
+    documents = list(
+        Document.objects.filter(owner_id=owner_id, blob__isnull=True)
+        .exclude(checksum='').exclude(file='')
+        .order_by('id')
+        .values('id', 'checksum', 'file', 'size', 'content_type')
+    )
+    stats = {'documents': len(documents), 'blobs_created': 0, 'files_freed': 0}
+    if not documents:
+        return stats
+
+    checksums = {doc['checksum'] for doc in documents}
+    blobs = {blob.checksum: blob for blob in Blob.objects.filter(checksum__in=checksums)}
+    adopted = {}
+    for doc in documents:
+        if doc['checksum'] not in blobs and doc['checksum'] not in adopted:
+            adopted[doc['checksum']] = Blob(
+                checksum=doc['checksum'], file=doc['file'], size=doc['size'],
+                content_type=doc['content_type'],
+            )
+    stats['blobs_created'] = len(adopted)
+
+    kept_names = {blob.file.name for blob in blobs.values()} | {blob.file.name for blob in adopted.values()}
+    freed_names = {doc['file'] for doc in documents} - kept_names
+    if dry_run:
+        stats['files_freed'] = len(freed_names)
+        return stats
+
+    with transaction.atomic():
+        Blob.objects.bulk_create(adopted.values(), batch_size=batch_size, ignore_conflicts=True)
+        blobs = {blob.checksum: blob for blob in Blob.objects.filter(checksum__in=checksums)}
+
+        updates = []
+        for doc in documents:
+            blob = blobs[doc['checksum']]
+            updates.append(Document(id=doc['id'], blob=blob, file=blob.file.name, url=blob.file.url))
+        Document.objects.bulk_update(updates, ['blob', 'file', 'url'], batch_size=batch_size)
+
+        # Compteurs recalculés par agrégat, tous propriétaires confondus : les
+        # documents et leurs versions archivées retiennent chacun une référence
+        counts = Counter()
+        for model in (Document, DocumentVersion):
+            for row in model.objects.filter(blob__in=blobs.values()).values('blob').annotate(total=Count('id')).order_by():
+                counts[row['blob']] += row['total']
+        refreshed = [Blob(pk=blob_id, ref_count=total) for blob_id, total in counts.items()]
+        Blob.objects.bulk_update(refreshed, ['ref_count'], batch_size=batch_size)
+
+        # bulk_update n'envoie pas de signal : URLs modifiées, cache à invalider
+        caching.invalidate(owner_id)
+
+    # Fichiers qui ne sont plus référencés par aucun document ni blob
+    still_used = set(Document.objects.filter(file__in=freed_names).values_list('file', flat=True))
+    still_used |= set(Blob.objects.filter(file__in=freed_names).values_list('file', flat=True))
+    still_used |= set(DocumentVersion.objects.filter(file__in=freed_names).values_list('file', flat=True))
+    storage = Document._meta.get_field('file').storage
+    for name in freed_names - still_used:
+        try:
+            storage.delete(name)
+            stats['files_freed'] += 1
+        except Exception:
+            logger.exception("Impossible de supprimer le fichier %s", name)
+    return stats
@@ -0,0 +1,117 @@
+"""
+Opérations groupées sur les documents d'un utilisateur.
+
+Chaque opération traite les identifiants par lots, avec une seule requête
+UPDATE ou DELETE par lot (filtrée sur le propriétaire), le tout dans une
+transaction. Le résultat indique le sort de chaque identifiant demandé.
+"""
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+
+from . import caching, search, tasks, usage
+from .blobs import deferred_release
+from .models import Document
+
+# Nombre de documents traités par requête
+BULK_BATCH_SIZE = 500
+
+# Nombre maximal de documents par appel
+MAX_BULK_ITEMS = 5000
+
+OK = 'ok'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+
+def batches(ids, size=None):
+    size = size or BULK_BATCH_SIZE
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def owned_ids(owner, ids):
+    """
+    Parmi `ids`, ceux des documents appartenant à `owner` (verrouillés
+    jusqu'à la fin de la transaction).
+    """
+    found = set()
+    for batch in batches(ids):
+        found.update(
+            Document.objects.select_for_update()
+            .filter(owner=owner, pk__in=batch).values_list('pk', flat=True)
+        )
+    return found
+
+
+def summary(ids, statuses):
+    """
+    Résultat par document, dans l'ordre de la demande, et totaux par statut.
+    """
+    results = [{'id': pk, 'status': statuses.get(pk, NOT_FOUND)} for pk in ids]
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return {'results': results, 'counts': counts}
+
+
+def after_update(owner, ids):
+    # Les UPDATE groupés n'envoient pas de signal : cache et index à jour ici
+    caching.invalidate(owner.pk)
+    for batch in batches(ids):
+        tasks.enqueue(search.index_documents, batch)
+
+
+def move_documents(owner, ids, folder):
+    """
+    Déplace les documents `ids` de `owner` dans `folder` (None : racine).
+    Le dossier doit appartenir à `owner`.
+    """
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic(), usage.deferred_usage():
+        found = owned_ids(owner, ids)
+        for batch in batches(found):
+            usage.documents_moved(owner.pk, batch, folder.pk if folder else None)
+            Document.objects.filter(owner=owner, pk__in=batch).update(folder=folder)
+        after_update(owner, found)
+    return summary(ids, dict.fromkeys(found, OK))
+
+
+def delete_documents(owner, ids):
+    """
+    Supprime les documents `ids` de `owner`. Les contenus qui ne sont plus
+    référencés sont supprimés du stockage en arrière-plan.
+    """
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic(), deferred_release(), usage.deferred_usage(), search.deferred_removal():
+        found = owned_ids(owner, ids)
+        for batch in batches(found):
+            Document.objects.filter(owner=owner, pk__in=batch).delete()
+    return summary(ids, dict.fromkeys(found, OK))
+
+
+def rename_documents(owner, titles):
+    """
+    Renomme les documents de `owner` : `titles` associe un identifiant à
+    son nouveau titre. Les titres vides ou trop longs sont refusés.
+    """
+    max_length = Document._meta.get_field('title').max_length
+    statuses = {}
+    valid = {}
+    for pk, title in titles.items():
+        title = (title or '').strip()
+        if title and len(title) <= max_length:
+            valid[pk] = title
+        else:
+            statuses[pk] = INVALID
+
+    with transaction.atomic():
+        found = owned_ids(owner, valid)
+        for batch in batches(found):
+            Document.objects.filter(owner=owner, pk__in=batch).update(title=Case(
+                *[When(pk=pk, then=Value(valid[pk])) for pk in batch],
+                output_field=CharField(),
+            ))
+        after_update(owner, found)
+    statuses.update(dict.fromkeys(found, OK))
+    return summary(list(titles), statuses)
@@ -0,0 +1,99 @@
+"""
+Cache par utilisateur des données du tableau de bord (vue home).
+
+Chaque utilisateur a un numéro de version en cache ; les données sont
+rangées sous une clé qui contient ce numéro. Toute écriture sur ses
+dossiers ou documents incrémente la version (voir signals.py) : les
+anciennes entrées ne sont plus jamais lues et expirent d'elles-mêmes.
+
+Le cache utilisé est celui de settings.CACHES, à condition qu'il soit
+partagé entre les processus (settings.FILES_SHARED_CACHE) : en mémoire
+locale, la version n'est incrémentée que dans le worker qui a fait
+l'écriture et les autres serviraient des données périmées. Le serveur de
+développement (DEBUG) n'a qu'un processus : la mémoire locale y suffit.
+Sinon, sans cache partagé, le tableau de bord est recalculé à chaque requête.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def enabled():
+    return settings.DEBUG or getattr(settings, 'FILES_SHARED_CACHE', False)
+
+
+def version_key(user_id):
+    return f'files:dashboard-version:{user_id}'
+
+
+def dashboard_timeout():
+    return getattr(settings, 'FILES_DASHBOARD_CACHE_TIMEOUT', 600)
+
+
+def get_version(user_id):
+    """
+    Version courante des données de `user_id`.
+    """
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # Valeur initiale horodatée : une version évincée du cache puis
+        # recréée ne retombe jamais sur une ancienne entrée encore présente
+        cache.add(version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+def bump_version(user_id):
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        # Version absente : la prochaine lecture en créera une nouvelle
+        pass
+
+
+def invalidate(user_id):
+    """
+    Invalide le cache de `user_id` une fois la transaction validée : avant,
+    les autres requêtes lisent encore les anciennes données.
+    """
+    if user_id and enabled():
+        transaction.on_commit(lambda: bump_version(user_id))
+
+
+def cached_dashboard(user_id, build):
+    """
+    Données du tableau de bord de `user_id`, calculées par `build()` en
+    cas d'absence dans le cache.
+    """
+    if not enabled():
+        return build()
+    key = f'files:dashboard:{user_id}:{get_version(user_id)}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=dashboard_timeout())
+    return data
+
+
+async def aget_version(user_id):
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        await cache.aadd(version_key(user_id), time.time_ns(), timeout=None)
+        version = await cache.aget(version_key(user_id))
+    return version
+
+
+async def acached_dashboard(user_id, build):
+    """
+    Version asynchrone de cached_dashboard : `build` est une coroutine.
+    """
+    if not enabled():
+        return await build()
+    key = f'files:dashboard:{user_id}:{await aget_version(user_id)}'
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout=dashboard_timeout())
+    return data
@@ -0,0 +1,29 @@
+"""
+Vérifications de la configuration (python manage.py check).
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Moteurs de sessions qui lisent le cache
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    # Sessions en cache local : chaque worker garde sa copie, une session
+    # supprimée (déconnexion) reste valable dans les autres processus
+    if settings.DEBUG or getattr(settings, 'FILES_SHARED_CACHE', False):
+        return []
+    if settings.SESSION_ENGINE not in CACHED_SESSION_ENGINES:
+        return []
+    return [Warning(
+        f"SESSION_ENGINE={settings.SESSION_ENGINE} avec un cache propre à chaque processus.",
+        hint=(
+            "Configurer un cache partagé (CACHE_BACKEND, CACHE_LOCATION) ou "
+            "utiliser django.contrib.sessions.backends.db."
+        ),
+        id='files.W001',
+    )]
@@ -0,0 +1,57 @@
+"""
+Réglages SQLite appliqués à chaque nouvelle connexion.
+
+Avec plusieurs workers gunicorn sur un même fichier SQLite, le mode de
+journalisation par défaut (DELETE) bloque toute lecture pendant une
+écriture et les téléversements ou suppressions échouent sur « database is
+locked ». Les pragmas de settings.FILES_SQLITE_PRAGMAS corrigent cela :
+
+- journal_mode=WAL : les lectures ne sont plus bloquées par l'écriture en cours ;
+- synchronous=NORMAL : pas de synchronisation disque à chaque validation
+  (sûr en WAL : une coupure ne peut perdre que les dernières transactions) ;
+- busy_timeout : une écriture attend le verrou au lieu d'échouer aussitôt ;
+- mmap_size : lectures par projection mémoire du fichier.
+
+Django 4.2 n'offre pas d'option d'initialisation pour SQLite : les pragmas
+sont posés par un récepteur de connection_created (installé par
+FilesConfig.ready). Les connexions persistantes (CONN_MAX_AGE) évitent de
+les rejouer à chaque requête.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'FILES_SQLITE_PRAGMAS', {})
+
+
+def configure_connection(sender, connection, **kwargs):
+    # Récepteur de connection_created
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+            if name == 'journal_mode':
+                # SQLite renvoie le mode obtenu, qui peut différer du mode
+                # demandé (ex. système de fichiers réseau sans mémoire partagée)
+                mode = cursor.fetchone()[0]
+                if mode.lower() != str(value).lower():
+                    logger.warning("Mode de journalisation SQLite %s au lieu de %s", mode, value)
+
+
+def install():
+    """
+    Applique les pragmas aux connexions futures et déjà ouvertes.
+    """
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(configure_connection, dispatch_uid='files.database')
+    # Connexions déjà établies (sans en ouvrir de nouvelle)
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            configure_connection(None, connection)
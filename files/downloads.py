@@ -0,0 +1,164 @@
+"""
+Réponses de téléchargement des documents.
+
+- Stockage local : le fichier est envoyé par FileResponse (le serveur WSGI
+  peut alors utiliser sendfile), avec prise en charge des requêtes Range
+  (reprise, lecture partielle des PDF) et des ETag issus de l'empreinte
+  du contenu (If-None-Match, If-Range).
+- Stockage distant (Cloudinary, S3...) : redirection vers l'URL du fichier,
+  signée et de courte durée quand le stockage le permet.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+from .utils import DEFAULT_CONTENT_TYPE
+
+# Taille des blocs lus sur le disque pour une réponse partielle
+STREAM_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Intervalle (début, fin incluse) demandé par l'en-tête Range, ou None
+    pour envoyer le fichier entier (en-tête absent, invalide ou à plusieurs
+    intervalles, ce que la RFC 9110 autorise à ignorer).
+    Lève RangeNotSatisfiable si l'intervalle est hors du fichier.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            raise RangeNotSatisfiable()
+    else:
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+
+def iter_range(f, start, length, chunk_size=STREAM_CHUNK_SIZE):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def is_local(storage):
+    # Stockage distant avec cache local (storage.TieredStorage) : lecture via le cache
+    if getattr(storage, 'serves_locally', False):
+        return True
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+def signed_url(storage, name):
+    """
+    URL du fichier sur un stockage distant, limitée dans le temps quand le
+    stockage accepte un paramètre d'expiration (django-storages).
+    """
+    expires = getattr(settings, 'FILES_DOWNLOAD_URL_EXPIRES', 300)
+    try:
+        return storage.url(name, expire=expires)
+    except TypeError:
+        return storage.url(name)
+
+
+def download_filename(document):
+    # Titre du document, avec l'extension du fichier stocké
+    extension = os.path.splitext(document.file.name)[1]
+    title = document.title
+    return title if title.lower().endswith(extension.lower()) else f'{title}{extension}'
+
+
+def document_response(request, document, as_attachment=False, stream=None):
+    """
+    Réponse HTTP qui transmet le contenu de `document`.
+
+    `stream(f, début, longueur)` remplace le générateur de lecture : les vues
+    asynchrones y passent un générateur asynchrone (voir async_storage.py),
+    le contenu n'est alors jamais lu depuis la boucle d'événements.
+    """
+    storage = document.file.storage
+    if not is_local(storage):
+        return HttpResponseRedirect(signed_url(storage, document.file.name))
+
+    etag = quote_etag(document.checksum) if document.checksum else None
+    if etag and etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    size = document.size or document.file.size
+    filename = download_filename(document)
+    byte_range = None
+    # If-Range : l'intervalle n'est valable que si le contenu n'a pas changé
+    if_range = request.headers.get('If-Range')
+    if not if_range or (etag and if_range == etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = document.file.open('rb')
+    if byte_range is None and stream is None:
+        response = FileResponse(f, as_attachment=as_attachment, filename=filename)
+    else:
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            (stream or iter_range)(f, start, end - start + 1),
+            status=206 if byte_range else 200, content_type=DEFAULT_CONTENT_TYPE,
+        )
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+
+    if document.content_type:
+        response['Content-Type'] = document.content_type
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    # Contenu privé, mais identique tant que l'ETag ne change pas
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def derived_file_response(field_file):
+    """
+    Réponse pour une image dérivée (vignette, aperçu). Son nom dépend du
+    contenu d'origine : elle peut être gardée en cache un an.
+    """
+    storage = field_file.storage
+    if is_local(storage):
+        response = FileResponse(field_file.open('rb'), content_type='image/jpeg')
+    else:
+        response = HttpResponseRedirect(storage.url(field_file.name))
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,142 @@
+"""
+Arborescence des dossiers d'un utilisateur, servie en JSON compact et
+mise à jour par différences.
+
+Chaque écriture sur un dossier (voir signals.py) incrémente la version de
+l'arborescence (FolderTree) et note la version dans la ligne du dossier
+(FolderChange, une par dossier, marquée à la suppression). Un client qui
+garde l'arborescence en cache avec sa version N ne demande ensuite que :
+
+- rien, si la version n'a pas changé (ETag, réponse 304) ;
+- les dossiers modifiés et supprimés depuis N, sinon.
+
+Format : chaque dossier est une liste [id, parent, nom], les parents avant
+leurs enfants ; `parent` vaut null pour un dossier racine.
+
+Les écritures qui contournent les signaux (bulk_create, update) doivent
+appeler record elles-mêmes ; les déplacements ne modifient que le dossier
+déplacé, le parent de ses descendants ne change pas.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Folder, FolderChange, FolderTree
+
+# Changements en attente, par thread (voir deferred_changes)
+_pending = threading.local()
+
+
+def get_version(owner_id):
+    """
+    Version courante de l'arborescence de `owner_id` (0 avant tout changement).
+    """
+    return FolderTree.objects.filter(owner_id=owner_id).values_list('version', flat=True).first() or 0
+
+
+def next_version(owner_id):
+    """
+    Incrémente et retourne la version de `owner_id`. La ligne reste
+    verrouillée jusqu'à la fin de la transaction : les versions sont
+    validées dans l'ordre où elles sont attribuées.
+    """
+    if not FolderTree.objects.filter(owner_id=owner_id).update(version=F('version') + 1):
+        try:
+            with transaction.atomic():
+                FolderTree.objects.create(owner_id=owner_id, version=1)
+            return 1
+        except IntegrityError:
+            # Créée en parallèle
+            FolderTree.objects.filter(owner_id=owner_id).update(version=F('version') + 1)
+    return get_version(owner_id)
+
+
+def record(owner_id, folder_ids, deleted=False):
+    """
+    Note la modification (ou la suppression) des dossiers `folder_ids` de `owner_id`.
+    """
+    pending = getattr(_pending, 'changes', None)
+    if pending is not None:
+        pending[owner_id].update(dict.fromkeys(folder_ids, deleted))
+        return
+    apply({owner_id: dict.fromkeys(folder_ids, deleted)})
+
+
+def apply(changes):
+    """
+    Enregistre les changements regroupés {owner_id: {folder_id: supprimé}} :
+    une version par utilisateur et un seul INSERT ... ON CONFLICT.
+    """
+    for owner_id, folders in changes.items():
+        if not folders:
+            continue
+        with transaction.atomic():
+            version = next_version(owner_id)
+            FolderChange.objects.bulk_create(
+                [
+                    FolderChange(owner_id=owner_id, folder_id=folder_id, version=version, deleted=deleted)
+                    for folder_id, deleted in folders.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['owner', 'folder_id'],
+                update_fields=['version', 'deleted'],
+            )
+
+
+@contextmanager
+def deferred_changes():
+    """
+    Regroupe les changements du bloc (suppression d'un sous-arbre) en une
+    seule version par utilisateur, enregistrée à la sortie.
+    """
+    if getattr(_pending, 'changes', None) is not None:
+        # Déjà dans un bloc différé : c'est lui qui enregistrera
+        yield
+        return
+    _pending.changes = defaultdict(dict)
+    try:
+        yield
+        changes = _pending.changes
+    finally:
+        _pending.changes = None
+    apply(changes)
+
+
+def tree_etag(version):
+    return f'"tree-{version}"'
+
+
+def folder_rows(folders):
+    return [[pk, parent_id, name] for pk, parent_id, name in folders.order_by('path').values_list('id', 'parent_id', 'name')]
+
+
+def tree_payload(owner_id, since=None, version=None):
+    """
+    Arborescence complète de `owner_id`, ou ses changements depuis la
+    version `since` quand elle est connue. `version` évite de relire la
+    version courante.
+
+    La version est lue avant les dossiers : une écriture concurrente peut
+    apparaître en avance dans la réponse, mais sera simplement renvoyée à
+    la demande suivante, jamais perdue.
+    """
+    version = get_version(owner_id) if version is None else version
+    if since is None or since > version:
+        # Version inconnue (plus récente que la base) : tout renvoyer
+        return {'version': version, 'folders': folder_rows(Folder.objects.filter(owner_id=owner_id))}
+
+    changed, deleted = [], []
+    for folder_id, is_deleted in (
+        FolderChange.objects.filter(owner_id=owner_id, version__gt=since, version__lte=version)
+        .values_list('folder_id', 'deleted')
+    ):
+        (deleted if is_deleted else changed).append(folder_id)
+    return {
+        'version': version,
+        'since': since,
+        'changed': folder_rows(Folder.objects.filter(owner_id=owner_id, pk__in=changed)) if changed else [],
+        'deleted': deleted,
+    }
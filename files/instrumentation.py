@@ -0,0 +1,269 @@
+"""
+Mesures par requête : requêtes SQL, appels au stockage, rendu des gabarits
+et latence totale, agrégées par nom de vue.
+
+Le middleware (middleware.InstrumentationMiddleware) ouvre une mesure pour
+chaque requête dans une variable de contexte ; les points de mesure y
+ajoutent leur durée :
+
+- SQL : enveloppe d'exécution posée sur chaque connexion à sa création ;
+- stockage : méthodes de la classe du stockage par défaut (open, save,
+  delete, exists, size, url...) ;
+- gabarits : Template.render du moteur Django.
+
+Hors requête (tâches, commandes), la variable est vide et chaque point de
+mesure se limite à une lecture de contexte.
+
+Les totaux sont exposés au format Prometheus (vue metrics) et dans l'en-tête
+Server-Timing ; les requêtes lentes sont journalisées avec leurs requêtes
+SQL les plus coûteuses. Les compteurs sont propres à chaque processus.
+"""
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger('files.slow_requests')
+
+# Bornes (secondes) de l'histogramme des latences
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Nombre de requêtes SQL citées dans le journal des requêtes lentes
+SLOW_SQL_LOGGED = 5
+
+STORAGE_METHODS = ('open', 'save', 'delete', 'exists', 'size', 'url', 'listdir', 'path', 'get_modified_time')
+
+current = contextvars.ContextVar('files_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Mesures d'une requête en cours.
+    """
+    __slots__ = ('start', 'db_count', 'db_time', 'queries', 'storage_count', 'storage_time',
+                 'storage_depth', 'template_time', 'template_depth')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.queries = []  # (durée, SQL), pour le journal des requêtes lentes
+        self.storage_count = 0
+        self.storage_time = 0.0
+        self.storage_depth = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} SQL"',
+            f'storage;dur={self.storage_time * 1000:.1f};desc="{self.storage_count} appels"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def slowest_queries(self, limit=SLOW_SQL_LOGGED):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:limit]
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Enveloppe d'exécution SQL (connection.execute_wrappers).
+    """
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.db_count += 1
+        metrics.db_time += duration
+        metrics.queries.append((duration, sql))
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # Récepteur de connection_created
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed(method, count_attr, time_attr, depth_attr):
+    """
+    Enveloppe `method` pour ajouter sa durée à la mesure en cours. Les
+    appels imbriqués (save qui appelle exists...) ne sont comptés qu'une fois.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        metrics = current.get()
+        if metrics is None or getattr(metrics, depth_attr):
+            return method(*args, **kwargs)
+        setattr(metrics, depth_attr, 1)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            setattr(metrics, depth_attr, 0)
+            if count_attr:
+                setattr(metrics, count_attr, getattr(metrics, count_attr) + 1)
+            setattr(metrics, time_attr, getattr(metrics, time_attr) + time.perf_counter() - start)
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_storage(storage_class):
+    """
+    Mesure les appels aux méthodes de `storage_class` (une seule fois par classe).
+    """
+    for name in STORAGE_METHODS:
+        method = getattr(storage_class, name, None)
+        if method is not None and not getattr(method, 'instrumented', False):
+            setattr(storage_class, name, timed(method, 'storage_count', 'storage_time', 'storage_depth'))
+
+
+def instrument_templates():
+    from django.template.backends.django import Template
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = timed(Template.render, None, 'template_time', 'template_depth')
+
+
+def install():
+    """
+    Pose les points de mesure (appelé par FilesConfig.ready).
+    """
+    from django.core.files.storage import storages
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from django.utils.module_loading import import_string
+
+    connection_created.connect(install_query_wrapper, dispatch_uid='files.instrumentation')
+    # Connexions déjà ouvertes
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(None, connection)
+    instrument_storage(import_string(storages.backends['default']['BACKEND']))
+    instrument_templates()
+
+
+class Registry:
+    """
+    Totaux par vue depuis le démarrage du processus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(lambda: {
+            'requests': 0,
+            'seconds': 0.0,
+            'db_queries': 0,
+            'db_seconds': 0.0,
+            'storage_calls': 0,
+            'storage_seconds': 0.0,
+            'template_seconds': 0.0,
+            'buckets': [0] * len(LATENCY_BUCKETS),
+        })
+
+    def record(self, view, metrics, total):
+        with self.lock:
+            stats = self.views[view]
+            stats['requests'] += 1
+            stats['seconds'] += total
+            stats['db_queries'] += metrics.db_count
+            stats['db_seconds'] += metrics.db_time
+            stats['storage_calls'] += metrics.storage_count
+            stats['storage_seconds'] += metrics.storage_time
+            stats['template_seconds'] += metrics.template_time
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if total <= bound:
+                    stats['buckets'][i] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {view: dict(stats, buckets=list(stats['buckets'])) for view, stats in self.views.items()}
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+registry = Registry()
+
+
+def slow_request_threshold():
+    return getattr(settings, 'FILES_SLOW_REQUEST_MS', 500) / 1000
+
+
+def finish(request, metrics):
+    """
+    Clôt la mesure de `request` : totaux, journal des requêtes lentes.
+    Retourne la durée totale en secondes.
+    """
+    total = metrics.elapsed()
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unresolved'
+    registry.record(view, metrics, total)
+    if total >= slow_request_threshold():
+        logger.warning(
+            "Requête lente %s %s (%s) : %.0f ms, %d requêtes SQL (%.0f ms), "
+            "%d appels au stockage (%.0f ms), gabarits %.0f ms%s",
+            request.method, request.path, view, total * 1000, metrics.db_count, metrics.db_time * 1000,
+            metrics.storage_count, metrics.storage_time * 1000, metrics.template_time * 1000,
+            ''.join(f'\n  {duration * 1000:.1f} ms : {sql}' for duration, sql in metrics.slowest_queries()),
+        )
+    return total
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(storage_stats=None):
+    """
+    Totaux au format d'exposition texte de Prometheus.
+    """
+    views = registry.snapshot()
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+
+    def per_view(key, fmt='{:.6f}'):
+        return [f'{{view="{escape_label(view)}"}} {fmt.format(stats[key])}' for view, stats in sorted(views.items())]
+
+    histogram = []
+    for view, stats in sorted(views.items()):
+        label = escape_label(view)
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            histogram.append(f'files_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {count}')
+        histogram.append(f'files_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {stats["requests"]}')
+        histogram.append(f'files_request_duration_seconds_sum{{view="{label}"}} {stats["seconds"]:.6f}')
+        histogram.append(f'files_request_duration_seconds_count{{view="{label}"}} {stats["requests"]}')
+    family('files_request_duration_seconds', 'histogram', 'Latence totale des requêtes.', histogram)
+
+    for key, name, help_text, fmt in (
+        ('db_queries', 'files_db_queries_total', 'Requêtes SQL exécutées.', '{}'),
+        ('db_seconds', 'files_db_seconds_total', 'Temps passé dans les requêtes SQL.', '{:.6f}'),
+        ('storage_calls', 'files_storage_calls_total', 'Appels au stockage de fichiers.', '{}'),
+        ('storage_seconds', 'files_storage_seconds_total', 'Temps passé dans le stockage de fichiers.', '{:.6f}'),
+        ('template_seconds', 'files_template_seconds_total', 'Temps de rendu des gabarits.', '{:.6f}'),
+    ):
+        family(name, 'counter', help_text, [name + sample for sample in per_view(key, fmt)])
+
+    if storage_stats:
+        # Cache local du stockage à deux niveaux (storage.TieredStorage)
+        family('files_storage_cache_hits_total', 'counter', 'Lectures servies par le cache local.',
+               [f'files_storage_cache_hits_total {storage_stats["hits"]}'])
+        family('files_storage_cache_misses_total', 'counter', 'Lectures absentes du cache local.',
+               [f'files_storage_cache_misses_total {storage_stats["misses"]}'])
+        family('files_storage_cache_bytes', 'gauge', 'Taille du cache local.',
+               [f'files_storage_cache_bytes {storage_stats["size"]}'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,197 @@
+"""
+File de tâches persistée dans la base de données, sans courtier externe.
+
+enqueue() (FILES_TASK_BACKEND='database') insère une ligne Job dans la
+transaction en cours : la tâche n'existe que si l'écriture qui l'a
+déclenchée est validée. Les workers (manage.py run_workers) réservent
+les tâches prêtes, les exécutent et les reprogramment en cas d'échec avec
+un délai croissant, jusqu'à max_attempts tentatives. Une tâche en cours
+rafraîchit régulièrement son verrou (locked_at) : celles dont le verrou
+n'est plus rafraîchi, parce que leur worker a disparu, sont remises en file.
+
+Réservation :
+
+- PostgreSQL : SELECT ... FOR UPDATE SKIP LOCKED, les workers ne
+  s'attendent jamais les uns les autres ;
+- SQLite : UPDATE conditionnel ligne par ligne (status='queued'), un seul
+  worker réussit à passer une tâche à 'running'.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import tasks
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Délai avant la 1re nouvelle tentative, doublé à chaque échec, plafonné
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+# Tâche 'running' dont le verrou n'a pas été rafraîchi depuis plus longtemps :
+# son worker est considéré comme mort
+STALE_AFTER = timedelta(minutes=30)
+
+# Rafraîchissement du verrou d'une tâche en cours (voir heartbeat)
+HEARTBEAT_INTERVAL = timedelta(minutes=5)
+
+# Recherche des tâches abandonnées, par worker : une écriture de temps en
+# temps plutôt qu'à chaque interrogation de la file
+SWEEP_INTERVAL = STALE_AFTER / 2
+
+# Attente entre deux interrogations d'une file vide
+POLL_INTERVAL = 1.0
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def submit(name, args=()):
+    """
+    Ajoute la tâche `name(*args)` à la file.
+    """
+    return Job.objects.create(name=name, args=list(args))
+
+
+def ready_jobs():
+    return Job.objects.filter(status=Job.QUEUED, run_after__lte=timezone.now()).order_by('run_after', 'id')
+
+
+def claim(worker, limit=1):
+    """
+    Réserve jusqu'à `limit` tâches prêtes pour `worker` et les retourne.
+    """
+    claim_fields = {
+        'status': Job.RUNNING,
+        'locked_by': worker,
+        'locked_at': timezone.now(),
+        'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(ready_jobs().select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claim_fields)
+    else:
+        ids = []
+        # Quelques candidats de plus : d'autres workers peuvent en prendre
+        for pk in ready_jobs().values_list('pk', flat=True)[:limit * 4]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**claim_fields):
+                ids.append(pk)
+                if len(ids) == limit:
+                    break
+    return list(Job.objects.filter(pk__in=ids).order_by('run_after', 'id'))
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+
+
+def execute(job):
+    """
+    Exécute une tâche réservée et enregistre son résultat.
+    Retourne True si elle a réussi.
+    """
+    try:
+        with heartbeat(job), tasks.attempt(final=job.attempts >= job.max_attempts):
+            tasks.get_task(job.name)(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Échec de la tâche %s (tentative %s/%s)", job.name, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error, finished_at=timezone.now())
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, last_error=error, run_after=timezone.now() + retry_delay(job.attempts),
+            )
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now())
+    return True
+
+
+def refresh_lock(job):
+    # Seulement tant que la tâche est encore réservée par ce worker
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+        locked_at=timezone.now(),
+    )
+
+
+@contextmanager
+def heartbeat(job, interval=HEARTBEAT_INTERVAL):
+    """
+    Rafraîchit le verrou de `job` pendant son exécution, depuis un thread :
+    une tâche longue (gros fichier envoyé au stockage) n'est jamais remise
+    en file, seules celles d'un worker disparu cessent d'être rafraîchies.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval.total_seconds()):
+                refresh_lock(job)
+        except Exception:
+            logger.exception("Verrou de la tâche %s non rafraîchi", job.pk)
+        finally:
+            # Connexions propres à ce thread
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """
+    Remet en file les tâches dont le worker a disparu en cours d'exécution.
+    """
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - older_than).update(
+        status=Job.QUEUED, run_after=timezone.now(),
+    )
+
+
+def work(batch_size=1, once=False, poll_interval=POLL_INTERVAL):
+    """
+    Boucle d'un worker : réserve et exécute les tâches prêtes. Avec
+    `once`, s'arrête dès que la file est vide. Retourne le nombre de
+    tâches exécutées.
+    """
+    worker = worker_name()
+    executed = 0
+    next_sweep = 0
+    while True:
+        close_old_connections()
+        if time.monotonic() >= next_sweep:
+            requeue_stale()
+            next_sweep = time.monotonic() + SWEEP_INTERVAL.total_seconds()
+        jobs = claim(worker, batch_size)
+        if not jobs:
+            if once:
+                return executed
+            time.sleep(poll_interval)
+            continue
+        for job in jobs:
+            execute(job)
+            executed += 1
+
+
+def purge_finished(older_than=timedelta(days=7)):
+    """
+    Supprime les tâches terminées depuis plus de `older_than`.
+    """
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
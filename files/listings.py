@@ -0,0 +1,51 @@
+"""
+Couche de listage des dossiers pour les vues home et view_folder.
+
+Chaque listage s'exécute en un nombre constant de requêtes, quel que soit
+le nombre de dossiers : une requête pour les dossiers annotés avec leur
+nombre de documents, et une seule requête de prefetch (bornée par dossier)
+pour l'aperçu des premiers documents.
+"""
+from django.db.models import Count, Prefetch
+
+from .models import Document, Folder
+
+# Nombre de documents affichés en aperçu dans chaque carte de dossier
+FOLDER_PREVIEW_SIZE = 5
+
+
+def folder_listing(owner, parent=None, preview=FOLDER_PREVIEW_SIZE):
+    """
+    Retourne les dossiers de `owner` dont le parent est `parent`
+    (None pour les dossiers racine).
+
+    Chaque dossier porte l'attribut `document_count` et, si `preview` est
+    non nul, la liste `preview_documents` avec ses `preview` documents
+    les plus récents.
+    """
+    folders = (
+        Folder.objects.filter(owner=owner, parent=parent)
+        .annotate(document_count=Count('documents'))
+        .order_by('id')
+    )
+    if preview:
+        # Prefetch découpé : Django le traduit en une fenêtre ROW_NUMBER()
+        # par dossier, donc une seule requête pour tous les aperçus.
+        recent_documents = Document.objects.order_by('-uploaded_at', '-id')[:preview]
+        folders = folders.prefetch_related(
+            Prefetch('documents', queryset=recent_documents, to_attr='preview_documents')
+        )
+    return folders
+
+
+def move_targets(owner):
+    """
+    Tous les dossiers de `owner`, dans l'ordre de l'arborescence, pour les
+    listes de destinations (déplacement groupé).
+    """
+    return list(Folder.objects.filter(owner=owner).only('id', 'name', 'depth').order_by('path'))
+
+
+async def amove_targets(owner):
+    # Version asynchrone de move_targets (vues ASGI)
+    return [folder async for folder in Folder.objects.filter(owner=owner).only('id', 'name', 'depth').order_by('path')]
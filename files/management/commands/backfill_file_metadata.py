@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from files.models import Document
+from files.utils import file_checksum, guess_content_type
+
+
+class Command(BaseCommand):
+    help = 'Renseigner la taille, le type MIME, l\'empreinte et l\'URL des documents existants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Nombre de documents enregistrés par requête UPDATE',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recalculer aussi les documents déjà renseignés',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        documents = Document.objects.exclude(file='').order_by('id')
+        if not options['all']:
+            documents = documents.filter(Q(checksum='') | Q(url=''))
+
+        total = documents.count()
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Toutes les métadonnées sont déjà à jour.'))
+            return
+
+        self.stdout.write(f"Mise à jour des métadonnées de {total} document(s)...")
+
+        batch, updated, errors = [], 0, 0
+        for doc in documents.iterator(chunk_size=batch_size):
+            try:
+                # Lecture du fichier depuis le stockage (appel distant sur Cloudinary)
+                doc.size = doc.file.size
+                doc.content_type = guess_content_type(doc.file.name)
+                doc.checksum = file_checksum(doc.file)
+                doc.url = doc.file.url
+            except Exception as e:
+                errors += 1
+                self.stdout.write(self.style.ERROR(f"  - Erreur pour {doc.file.name}: {e}"))
+                continue
+            finally:
+                doc.file.close()
+
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                updated += self.flush(batch)
+
+        updated += self.flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{updated} document(s) mis à jour, {errors} erreur(s)."
+        ))
+
+    def flush(self, batch):
+        if not batch:
+            return 0
+        count = len(batch)
+        Document.objects.bulk_update(batch, ['size', 'content_type', 'checksum', 'url'])
+        batch.clear()
+        return count
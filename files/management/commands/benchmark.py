@@ -0,0 +1,287 @@
+import json
+import random
+import resource
+import shutil
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from files import benchmarks, caching, usage, user_cache
+from files.models import Document
+
+BENCH_PASSWORD = 'benchmark-mot-de-passe'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mesurer les vues principales (latences p50/p99, requêtes SQL, mémoire) sur des '
+        'données synthétiques, dans une base de test jetable, puis sous une charge HTTP '
+        'concurrente ; échoue si les requêtes SQL augmentent par rapport à une référence'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5,
+                            help='Nombre d\'utilisateurs générés')
+        parser.add_argument('--depth', type=int, default=4,
+                            help='Profondeur de l\'arborescence de chaque utilisateur')
+        parser.add_argument('--fan-out', type=int, default=3,
+                            help='Nombre de sous-dossiers par dossier')
+        parser.add_argument('--documents', type=int, default=2000,
+                            help='Nombre de documents par utilisateur')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Nombre de requêtes mesurées par vue')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Clients HTTP simultanés pendant la charge (0 : pas de charge)')
+        parser.add_argument('--load-requests', type=int, default=400,
+                            help='Nombre total de requêtes HTTP pendant la charge')
+        parser.add_argument('--storage-latency', type=float, default=0.0,
+                            help='Latence (secondes) ajoutée à chaque appel au stockage simulé')
+        parser.add_argument('--session-engine',
+                            help='Moteur de sessions à mesurer (par défaut celui des réglages), '
+                                 'ex. django.contrib.sessions.backends.db')
+        parser.add_argument('--without-shared-cache', action='store_true',
+                            help='Mesurer un déploiement à plusieurs workers sans cache partagé '
+                                 '(DEBUG=False) : sessions en base, utilisateur et tableau de bord hors cache')
+        parser.add_argument('--output', help='Écrire les résultats dans ce fichier JSON')
+        parser.add_argument('--baseline', help='Fichier JSON de référence (résultat d\'un précédent --output)')
+        parser.add_argument('--threshold', type=float, default=0.3,
+                            help='Hausse de latence signalée (sans échec) par rapport à la référence (0.3 = 30 %%)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Graine du générateur aléatoire, pour des données reproductibles')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        workdir = tempfile.mkdtemp(prefix='docuspace-bench-')
+        # Stockage simulé à latence réglable, fichiers et tâches isolés dans
+        # un dossier temporaire ; tâches exécutées dans la requête, pour que
+        # leur coût (stockage compris) soit mesuré
+        session_engine = options['session_engine'] or settings.SESSION_ENGINE
+        cache_settings = {}
+        if options['without_shared_cache']:
+            # Valeurs par défaut d'un déploiement sans CACHE_BACKEND partagé
+            session_engine = options['session_engine'] or 'django.contrib.sessions.backends.db'
+            cache_settings = {'DEBUG': False, 'FILES_SHARED_CACHE': False}
+        bench_settings = override_settings(
+            STORAGES={
+                'default': {
+                    'BACKEND': 'files.storage.SimulatedRemoteStorage',
+                    'OPTIONS': {'location': workdir, 'latency': options['storage_latency']},
+                },
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            FILES_UPLOAD_STAGING_DIR=f'{workdir}/staging',
+            FILES_TASK_BACKEND='eager',
+            SESSION_ENGINE=session_engine,
+            # Hachage rapide : le scénario de connexion mesure les sessions, pas PBKDF2
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            **cache_settings,
+        )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with bench_settings:
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            for message in benchmarks.slowdowns(results, baseline, options['threshold']):
+                self.stderr.write(self.style.WARNING(f'  Plus lent : {message}'))
+            regressions = benchmarks.compare(results, baseline)
+            if regressions:
+                for message in regressions:
+                    self.stderr.write(f'  {message}')
+                raise CommandError(f'{len(regressions)} régression(s) par rapport à {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('Aucune régression par rapport à la référence.'))
+
+    def run(self, options):
+        self.stdout.write(
+            f"Base : {connection.vendor}, {options['users']} utilisateurs, profondeur {options['depth']}, "
+            f"{options['fan_out']} sous-dossiers par dossier, {options['documents']} documents par utilisateur"
+        )
+        users = benchmarks.seed_users(options['users'])
+        trees = {}
+        for owner in users:
+            trees[owner.pk] = benchmarks.seed_tree(owner, options['depth'], options['fan_out'])
+            benchmarks.seed_documents(owner, options['documents'], trees[owner.pk])
+        # bulk_create ne passe pas par les signaux : compteurs d'usage recalculés
+        usage.recompute()
+        benchmarks.analyze()
+
+        owner = users[0]
+        # Mot de passe pour le scénario de connexion (avant force_login, qui
+        # lie la session à l'empreinte du mot de passe)
+        owner.set_password(BENCH_PASSWORD)
+        owner.save(update_fields=['password'])
+        client = Client()
+        client.force_login(owner)
+        results = {
+            'config': dict({key: options[key] for key in (
+                'users', 'depth', 'fan_out', 'documents', 'repeat', 'storage_latency',
+            )}, session_engine=settings.SESSION_ENGINE, user_cache=user_cache.enabled(),
+                dashboard_cache=caching.enabled()),
+            'scenarios': {},
+        }
+        for name, (prepare, request) in self.scenarios(client, owner, trees[owner.pk], options).items():
+            measures = benchmarks.profile(lambda: request(prepare()))
+            timings = []
+            for _ in range(options['repeat']):
+                # Préparation hors mesure (ex. arborescence à supprimer)
+                args = prepare()
+                timings.extend(benchmarks.measure(lambda: request(args), 1))
+            results['scenarios'][name] = dict(benchmarks.summarize(timings), **measures)
+
+        if options['concurrency'] > 0:
+            results['load'] = self.load(client, owner, trees[owner.pk], options)
+        results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return results
+
+    def scenarios(self, client, owner, folders, options):
+        """
+        Vues mesurées : {nom: (préparation, requête)}. La requête reçoit le
+        résultat de la préparation et vérifie le statut de la réponse.
+        """
+        top_folders = [folder for folder in folders if folder.parent_id is None]
+        counter = iter(range(sys.maxsize))
+
+        def check(response, status):
+            if response.status_code != status:
+                raise CommandError(f'{response.request["PATH_INFO"]} : statut {response.status_code}')
+
+        def nothing():
+            return None
+
+        def home(_):
+            check(client.get(reverse('home')), 200)
+
+        def view_folder(_):
+            check(client.get(reverse('view_folder', args=[random.choice(top_folders).id])), 200)
+
+        def upload_file():
+            return SimpleUploadedFile(f'bench-{next(counter)}.txt', b'contenu de benchmark\n' * 100)
+
+        def upload_document(file):
+            check(client.post(reverse('upload_document'), {'title': file.name, 'file': file}), 302)
+
+        def pick_document():
+            document = Document.objects.filter(owner=owner).order_by('?').only('id').first()
+            return document.id, random.choice(folders).id
+
+        def move_document(args):
+            document_id, folder_id = args
+            check(client.post(reverse('move_document', args=[document_id]), {'folder': folder_id}), 302)
+
+        def seed_subtree():
+            # Petite arborescence neuve à chaque suppression
+            root = benchmarks.seed_folders(owner, 1)[0]
+            subfolders = benchmarks.seed_tree(owner, 2, options['fan_out'], parent=root)
+            benchmarks.seed_documents(owner, 20, [root] + subfolders, root_ratio=0)
+            return root.id
+
+        def delete_folder(folder_id):
+            check(client.post(reverse('delete_folder', args=[folder_id])), 302)
+
+        def folder_tree(_):
+            check(client.get(reverse('folder_tree')), 200)
+
+        def tree_etag():
+            return client.get(reverse('folder_tree'))['ETag']
+
+        def folder_tree_cached(etag):
+            # Client qui a déjà l'arborescence à jour : réponse 304 sans corps
+            check(client.get(reverse('folder_tree'), HTTP_IF_NONE_MATCH=etag), 304)
+
+        def new_client():
+            return Client()
+
+        def login_flow(visitor):
+            # Parcours complet : connexion, tableau de bord, puis un dossier
+            check(visitor.post(reverse('login'), {'username': owner.username, 'password': BENCH_PASSWORD}), 302)
+            check(visitor.get(reverse('home')), 200)
+            check(visitor.get(reverse('view_folder', args=[random.choice(top_folders).id])), 200)
+
+        return {
+            'home': (nothing, home),
+            'view_folder': (nothing, view_folder),
+            'upload_document': (upload_file, upload_document),
+            'move_document': (pick_document, move_document),
+            'delete_folder': (seed_subtree, delete_folder),
+            'login_flow': (new_client, login_flow),
+            'folder_tree': (nothing, folder_tree),
+            'folder_tree_cached': (tree_etag, folder_tree_cached),
+        }
+
+    def load(self, client, owner, folders, options):
+        """
+        Charge concurrente sur un vrai serveur HTTP multithread (celui de
+        LiveServerTestCase), en lecture : tableau de bord et dossiers.
+        """
+        # Base SQLite en mémoire : les threads du serveur partagent la connexion
+        connections_override = {
+            conn.alias: conn for conn in connections.all()
+            if conn.vendor == 'sqlite' and conn.is_in_memory_db()
+        }
+        for conn in connections_override.values():
+            conn.inc_thread_sharing()
+        server = LiveServerThread('localhost', _StaticFilesHandler, connections_override=connections_override)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        try:
+            if server.error:
+                raise server.error
+            base = f'http://localhost:{server.port}'
+            urls = [base + reverse('home')] + [
+                base + reverse('view_folder', args=[folder.id])
+                for folder in folders if folder.parent_id is None
+            ]
+            headers = {'Cookie': f'sessionid={client.cookies["sessionid"].value}'}
+            self.stdout.write(
+                f"Charge HTTP : {options['load_requests']} requêtes, {options['concurrency']} clients simultanés..."
+            )
+            return benchmarks.load(urls, headers, options['load_requests'], options['concurrency'])
+        finally:
+            server.terminate()
+            for conn in connections_override.values():
+                conn.dec_thread_sharing()
+
+    def report(self, results):
+        self.stdout.write(self.style.MIGRATE_HEADING('\n== Vues (client de test)'))
+        config = results['config']
+        self.stdout.write(
+            f"Sessions : {config['session_engine']}, utilisateur en cache : {'oui' if config['user_cache'] else 'non'}, "
+            f"tableau de bord en cache : {'oui' if config['dashboard_cache'] else 'non'}"
+        )
+        self.stdout.write(
+            f"  {'vue':<18}{'p50 ms':>10}{'p99 ms':>10}{'requêtes':>10}{'écritures':>11}{'mémoire Kio':>14}"
+        )
+        for name, result in results['scenarios'].items():
+            self.stdout.write(
+                f"  {name:<18}{result['p50']:>10.2f}{result['p99']:>10.2f}"
+                f"{result['queries']:>10}{result['writes']:>11}{result['peak_kb']:>14.0f}"
+            )
+        load = results.get('load')
+        if load:
+            self.stdout.write(self.style.MIGRATE_HEADING('\n== Charge HTTP'))
+            self.stdout.write(
+                f"  {load['throughput']:.1f} requêtes/s, p50 {load['p50']:.2f} ms, "
+                f"p99 {load['p99']:.2f} ms, {load['errors']} erreur(s)"
+            )
+        self.stdout.write(f"\nMémoire maximale du processus : {results['max_rss_kb']} Kio")
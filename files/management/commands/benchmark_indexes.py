@@ -0,0 +1,134 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from files import benchmarks
+from files.models import Document, Folder
+
+
+class Command(BaseCommand):
+    help = (
+        'Comparer plans de requête et latences des listages avec et sans les index '
+        'composites, sur la base configurée (SQLite ou PostgreSQL via DATABASE_URL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1_000_000,
+                            help='Nombre total de documents générés')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Nombre d\'utilisateurs entre lesquels répartir les documents')
+        parser.add_argument('--folders', type=int, default=20,
+                            help='Nombre de dossiers racine par utilisateur')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Nombre d\'exécutions de chaque requête')
+        parser.add_argument('--keep', action='store_true',
+                            help='Conserver les données générées à la fin')
+        parser.add_argument('--reuse', action='store_true',
+                            help='Réutiliser les données d\'un précédent --keep')
+        parser.add_argument('--force', action='store_true',
+                            help='Lancer malgré DEBUG=False : les index de la base configurée '
+                                 'sont supprimés le temps de la mesure')
+
+    def handle(self, *args, **options):
+        # La mesure supprime puis recrée les index de la base configurée :
+        # jamais sur une base de production par mégarde
+        if not settings.DEBUG and not options['force']:
+            raise CommandError(
+                "DEBUG=False : la base configurée est peut-être celle de production. "
+                "Lancer sur une base de développement, ou ajouter --force."
+            )
+        self.stdout.write(f"Base : {connection.vendor}")
+
+        if not options['reuse']:
+            benchmarks.purge()
+            self.seed(options['documents'], options['users'], options['folders'])
+        benchmarks.analyze()
+
+        users = list(Document.objects.filter(
+            owner__username__startswith=benchmarks.BENCH_USER_PREFIX
+        ).values_list('owner_id', flat=True).distinct()[:options['users']])
+        folders = list(Folder.objects.filter(owner_id__in=users).values_list('owner_id', 'id'))
+        if not users or not folders:
+            self.stderr.write('Aucune donnée de benchmark : relancez sans --reuse.')
+            return
+
+        scenarios = self.scenarios(users, folders)
+        with_indexes = self.run(scenarios, options['repeat'])
+
+        self.stdout.write('\nSuppression temporaire des index composites...')
+        self.toggle_indexes(drop=True)
+        try:
+            without_indexes = self.run(scenarios, options['repeat'])
+        finally:
+            self.toggle_indexes(drop=False)
+
+        self.report(with_indexes, without_indexes)
+
+        if not options['keep']:
+            benchmarks.purge()
+
+    def seed(self, documents, users, folders_per_user):
+        self.stdout.write(f"Génération de {documents} documents pour {users} utilisateurs...")
+        per_user = max(documents // max(users, 1), 1)
+        for owner in benchmarks.seed_users(users):
+            folders = benchmarks.seed_folders(owner, folders_per_user)
+            for parent in folders[:2]:
+                benchmarks.seed_folders(owner, folders_per_user // 4, parent=parent)
+            benchmarks.seed_documents(owner, per_user, folders)
+
+    def scenarios(self, users, folders):
+        # Mêmes prédicats et tris que les vues home et view_folder
+        def root_documents():
+            owner = random.choice(users)
+            return Document.objects.filter(owner_id=owner, folder__isnull=True).order_by('-uploaded_at', '-id')[:50]
+
+        def folder_documents():
+            owner, folder = random.choice(folders)
+            return Document.objects.filter(owner_id=owner, folder_id=folder).order_by('-uploaded_at', '-id')[:50]
+
+        def root_folders():
+            return Folder.objects.filter(owner_id=random.choice(users), parent__isnull=True)
+
+        def subfolders():
+            owner, folder = random.choice(folders)
+            return Folder.objects.filter(owner_id=owner, parent_id=folder)
+
+        return {
+            'documents racine': root_documents,
+            'documents d\'un dossier': folder_documents,
+            'dossiers racine': root_folders,
+            'sous-dossiers': subfolders,
+        }
+
+    def run(self, scenarios, repeat):
+        results = {}
+        for name, build in scenarios.items():
+            plan = build().explain()
+            timings = benchmarks.measure(lambda: list(build()), repeat)
+            results[name] = {
+                'plan': plan,
+                'p50': benchmarks.percentile(timings, 50),
+                'p95': benchmarks.percentile(timings, 95),
+            }
+        return results
+
+    def toggle_indexes(self, drop):
+        with connection.schema_editor() as editor:
+            for model in (Document, Folder):
+                for index in model._meta.indexes:
+                    if drop:
+                        editor.remove_index(model, index)
+                    else:
+                        editor.add_index(model, index)
+        benchmarks.analyze()
+
+    def report(self, with_indexes, without_indexes):
+        for name, result in with_indexes.items():
+            before = without_indexes[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {name}"))
+            self.stdout.write(f"  sans index : p50 {before['p50']:.2f} ms, p95 {before['p95']:.2f} ms")
+            self.stdout.write(f"    {before['plan']}".replace('\n', '\n    '))
+            self.stdout.write(f"  avec index : p50 {result['p50']:.2f} ms, p95 {result['p95']:.2f} ms")
+            self.stdout.write(f"    {result['plan']}".replace('\n', '\n    '))
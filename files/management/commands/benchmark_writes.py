@@ -0,0 +1,117 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from files import benchmarks, usage
+from files.models import Folder
+
+# Profils comparés : (pragmas, mode de transaction). SQLite tel que livré
+# par Django, puis les réglages du projet (None : valeur des réglages)
+PROFILES = {
+    'defaut': ({}, 'DEFERRED'),
+    'projet': (None, None),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mesurer le débit d\'écriture de SQLite sous plusieurs connexions concurrentes '
+        '(comme plusieurs workers gunicorn), avec et sans les pragmas de FILES_SQLITE_PRAGMAS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8,
+                            help='Nombre de threads qui écrivent, chacun avec sa connexion')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Nombre de threads qui lisent pendant les écritures')
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Durée (secondes) de la charge pour chaque profil')
+        parser.add_argument('--output', help='Écrire les résultats dans ce fichier JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'Base {connection.vendor} : ce benchmark ne concerne que SQLite.')
+            return
+
+        results = {}
+        for name, (pragmas, transaction_mode) in PROFILES.items():
+            pragmas = settings.FILES_SQLITE_PRAGMAS if pragmas is None else pragmas
+            transaction_mode = transaction_mode or connection.settings_dict['OPTIONS'].get('transaction_mode')
+            self.stdout.write(
+                f"Profil {name} : {pragmas or 'pragmas par défaut'}, transactions {transaction_mode or 'DEFERRED'}"
+            )
+            results[name] = self.run_profile(pragmas, transaction_mode, options)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    def run_profile(self, pragmas, transaction_mode, options):
+        """
+        Base SQLite jetable sur disque (les connexions de chaque thread
+        partagent le fichier, et donc ses verrous), puis charge concurrente.
+        """
+        workdir = tempfile.mkdtemp(prefix='docuspace-writes-')
+        # Réglages partagés par les connexions de tous les threads
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        db_options = connection.settings_dict['OPTIONS']
+        old_test_name, old_options = test_settings.get('NAME'), dict(db_options)
+        test_settings['NAME'] = str(Path(workdir) / 'bench.sqlite3')
+        db_options['transaction_mode'] = transaction_mode
+        setup_test_environment()
+        try:
+            with override_settings(FILES_SQLITE_PRAGMAS=pragmas, FILES_TASK_BACKEND='eager'):
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    owners = benchmarks.seed_users(options['writers'])
+                    benchmarks.seed_tree(owners[0], 2, 10)
+                    return benchmarks.concurrent_load(
+                        [('écriture', self.writer(owner)) for owner in owners]
+                        + [('lecture', self.reader(owners[0]))] * options['readers'],
+                        options['duration'],
+                    )
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+            test_settings['NAME'] = old_test_name
+            db_options.clear()
+            db_options.update(old_options)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def writer(self, owner):
+        def write(n):
+            # Lecture puis écritures dans une même transaction, comme un
+            # téléversement : le verrou de lecture doit devenir verrou d'écriture
+            with transaction.atomic():
+                current = usage.get_usage(owner)
+                folder = Folder.objects.create(name=f'Écriture {n}', owner=owner)
+                usage.record(owner.pk, None, current.used_bytes % 7 + 1, 1)
+            if n % 2:
+                folder.delete()
+        return write
+
+    def reader(self, owner):
+        def read(n):
+            list(Folder.objects.filter(owner=owner).order_by('path')[:200])
+        return read
+
+    def report(self, results):
+        self.stdout.write(self.style.MIGRATE_HEADING('\n== Charge concurrente'))
+        self.stdout.write(
+            f"  {'profil':<10}{'opération':<12}{'threads':>8}{'op/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'refus':>8}"
+        )
+        for profile, operations in results.items():
+            for name, result in operations.items():
+                self.stdout.write(
+                    f"  {profile:<10}{name:<12}{result['threads']:>8}{result['throughput']:>10.1f}"
+                    f"{result['p50']:>10.2f}{result['p99']:>10.2f}{result['errors']:>8}"
+                )
@@ -1,50 +1,57 @@
-import os
 from django.core.management.base import BaseCommand
+
+from files.blobs import collect_garbage, reconcile_owner
 from files.models import Document
-from django.db.models import Count
+
 
 class Command(BaseCommand):
-    help = 'Nettoyer les documents en double en conservant la version la plus récente'
+    help = (
+        'Dédupliquer le stockage par contenu : les documents identiques (même empreinte) '
+        'partagent un seul fichier, les copies inutiles sont supprimées'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Afficher ce qui serait fait sans rien modifier')
+        parser.add_argument('--owner', type=int,
+                            help='Limiter le traitement à un utilisateur (id)')
 
     def handle(self, *args, **options):
-        # Trouver les titres qui apparaissent plus d'une fois
-        duplicates = (
-            Document.objects.values('title')
-            .annotate(count=Count('id'))
-            .filter(count__gt=1)
-        )
-
-        if not duplicates:
-            self.stdout.write(self.style.SUCCESS('Aucun doublon trouvé.'))
-            return
-
-        self.stdout.write(f"Traitement de {len(duplicates)} documents en double...")
-
-        for dup in duplicates:
-            title = dup['title']
-            self.stdout.write(f"\nTraitement des doublons pour: {title}")
-            
-            # Récupérer tous les documents avec ce titre, triés par date (du plus récent au plus ancien)
-            docs = Document.objects.filter(title=title).order_by('-uploaded_at')
-            
-            # Le premier document est le plus récent, on le conserve
-            keeper = docs.first()
-            self.stdout.write(f"  - Conservation du document le plus récent: {keeper.file.name} (uploadé le {keeper.uploaded_at})")
-            
-            # Supprimer les doublons (tous sauf le plus récent)
-            for doc in docs[1:]:
-                file_path = doc.file.path
-                self.stdout.write(f"  - Suppression du doublon: {doc.file.name}")
-                
-                # Supprimer le fichier physique s'il existe
-                if os.path.isfile(file_path):
-                    try:
-                        os.remove(file_path)
-                        self.stdout.write(f"    - Fichier supprimé: {file_path}")
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"    - Erreur lors de la suppression du fichier {file_path}: {e}"))
-                
-                # Supprimer l'entrée de la base de données
-                doc.delete()
-        
-        self.stdout.write(self.style.SUCCESS('\nNettoyage des doublons terminé avec succès !'))
+        dry_run = options['dry_run']
+        pending = Document.objects.filter(blob__isnull=True).exclude(file='')
+        if options['owner']:
+            pending = pending.filter(owner_id=options['owner'])
+
+        missing_checksum = pending.filter(checksum='').count()
+        if missing_checksum:
+            self.stdout.write(self.style.WARNING(
+                f"{missing_checksum} document(s) sans empreinte ignoré(s) : "
+                f"lancez d'abord 'manage.py backfill_file_metadata'."
+            ))
+
+        owner_ids = list(pending.exclude(checksum='').values_list('owner_id', flat=True).distinct().order_by())
+        if not owner_ids:
+            self.stdout.write(self.style.SUCCESS('Aucun document à dédupliquer.'))
+        else:
+            self.stdout.write(f"Traitement des documents de {len(owner_ids)} utilisateur(s)...")
+
+        totals = {'documents': 0, 'blobs_created': 0, 'files_freed': 0}
+        for owner_id in owner_ids:
+            stats = reconcile_owner(owner_id, dry_run=dry_run)
+            self.stdout.write(
+                f"  - Utilisateur {owner_id} : {stats['documents']} document(s), "
+                f"{stats['blobs_created']} contenu(s) distinct(s) ajouté(s), "
+                f"{stats['files_freed']} fichier(s) en double supprimé(s)"
+            )
+            for key in totals:
+                totals[key] += stats[key]
+
+        if not dry_run:
+            totals['orphans'] = collect_garbage()
+            self.stdout.write(f"{totals['orphans']} contenu(s) sans référence supprimé(s).")
+
+        prefix = '[simulation] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{prefix}Déduplication terminée : {totals['documents']} document(s) rattaché(s), "
+            f"{totals['files_freed']} fichier(s) libéré(s)."
+        ))
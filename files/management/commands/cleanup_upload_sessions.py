@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from files.uploads import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Supprimer les téléversements par morceaux abandonnés ou bloqués en cours '
+        'de finalisation, et leurs fichiers partiels'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help='Âge minimal (en heures depuis la dernière activité) des sessions à supprimer',
+        )
+
+    def handle(self, *args, **options):
+        count = purge_stale_sessions(max_age=timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"{count} session(s) de téléversement supprimée(s)."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from files.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Supprimer du stockage les contenus qui ne sont plus référencés par aucun document'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Nombre de contenus supprimés par lot')
+
+    def handle(self, *args, **options):
+        deleted = collect_garbage(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} contenu(s) sans référence supprimé(s)."))
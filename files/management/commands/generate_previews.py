@@ -0,0 +1,47 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from files.models import Blob
+from files.previews import generate_previews
+from files.tasks import worker_init
+
+
+class Command(BaseCommand):
+    help = 'Générer les vignettes et aperçus des contenus qui n\'en ont pas encore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Nombre de processus de génération (par défaut : nombre de CPU)')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Retenter les contenus en échec ou restés en cours de traitement')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            Blob.objects.filter(
+                preview_status__in=[Blob.PREVIEW_FAILED, Blob.PREVIEW_PROCESSING],
+            ).update(preview_status=Blob.PREVIEW_PENDING)
+
+        blob_ids = list(
+            Blob.objects.filter(preview_status=Blob.PREVIEW_PENDING).order_by('pk').values_list('pk', flat=True)
+        )
+        self.stdout.write(f"{len(blob_ids)} contenu(s) à traiter.")
+
+        workers = max(1, min(options['workers'], len(blob_ids)))
+        if workers == 1:
+            statuses = Counter(generate_previews(pk) for pk in blob_ids)
+        else:
+            # Travail surtout CPU (décodage, rendu PDF) : un processus par cœur.
+            # Chaque worker ouvre ses propres connexions à la base.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                                     initializer=worker_init) as pool:
+                statuses = Counter(pool.map(generate_previews, blob_ids, chunksize=8))
+
+        for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+            self.stdout.write(f"  {status or 'déjà traité'} : {count}")
+        self.stdout.write(self.style.SUCCESS("Génération des aperçus terminée."))
@@ -0,0 +1,125 @@
+import argparse
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from files.models import Blob
+from files.storage_migration import (
+    Checkpoint, MigrationError, load_storage, migrate, referenced_files, scan,
+)
+
+# Nombre de noms affichés par catégorie dans le rapport d'intégrité
+REPORT_LIMIT = 20
+
+
+def json_options(value):
+    try:
+        options = json.loads(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"options JSON invalides : {e}")
+    if not isinstance(options, dict):
+        raise argparse.ArgumentTypeError("les options doivent être un objet JSON")
+    return options
+
+
+class Command(BaseCommand):
+    help = (
+        "Copier les fichiers référencés en base d'un stockage vers un autre "
+        "(après un changement de DEFAULT_FILE_STORAGE), ou contrôler leur intégrité"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', required=True,
+            help="Classe du stockage d'origine (ex. django.core.files.storage.FileSystemStorage)",
+        )
+        parser.add_argument('--source-options', type=json_options, default={},
+                            help='Arguments du stockage d\'origine en JSON (ex. {"location": "/srv/media"})')
+        parser.add_argument('--destination', default=None,
+                            help='Classe du stockage de destination (défaut : DEFAULT_FILE_STORAGE)')
+        parser.add_argument('--destination-options', type=json_options, default={},
+                            help='Arguments du stockage de destination en JSON')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Nombre de fichiers copiés en parallèle')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Nombre de fichiers par lot (une transaction par lot)')
+        parser.add_argument('--checkpoint', default='storage_migration.jsonl',
+                            help='Fichier de reprise, à supprimer une fois la migration terminée')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Contrôler la source sans rien copier : fichiers manquants et orphelins')
+        parser.add_argument('--verify', action='store_true',
+                            help='Avec --dry-run, recalculer aussi l\'empreinte de chaque fichier')
+
+    def handle(self, *args, **options):
+        label = {
+            'source': [options['source'], options['source_options']],
+            'destination': [options['destination'] or settings.DEFAULT_FILE_STORAGE, options['destination_options']],
+        }
+        if label['source'] == label['destination']:
+            raise CommandError("La source et la destination sont le même stockage.")
+        source = load_storage(*label['source'])
+        files = referenced_files()
+
+        if options['dry_run']:
+            self.check_integrity(source, files, options)
+            return
+
+        destination = load_storage(*label['destination'])
+        try:
+            checkpoint = Checkpoint(options['checkpoint'], label)
+        except MigrationError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"{len(files)} fichier(s) référencé(s), {len(files) - len(checkpoint.done & set(files))} à migrer "
+            f"({options['workers']} threads, lots de {options['batch_size']})..."
+        )
+
+        totals = [0, 0, 0]
+
+        def progress(copied, present, failed):
+            for i, count in enumerate((copied, present, failed)):
+                totals[i] += count
+            self.stdout.write(f"  {totals[0]} copié(s), {totals[1]} déjà présent(s), {totals[2]} erreur(s)")
+
+        errors = migrate(
+            source, destination, files, checkpoint,
+            workers=options['workers'], batch_size=options['batch_size'], progress=progress,
+        )
+        for name, error in errors[:REPORT_LIMIT]:
+            self.stdout.write(self.style.ERROR(f"  - {name} : {error}"))
+        if errors:
+            raise CommandError(
+                f"{len(errors)} fichier(s) non migré(s). Relancer la commande reprend la migration "
+                f"(fichier de reprise {options['checkpoint']})."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Migration terminée : {totals[0]} fichier(s) copié(s), {totals[1]} déjà présent(s). "
+            f"Les fichiers d'origine sont conservés ; le fichier de reprise {options['checkpoint']} peut être supprimé."
+        ))
+
+    def check_integrity(self, source, files, options):
+        self.stdout.write(f"Contrôle de {len(files)} fichier(s) référencé(s) dans {options['source']}...")
+        report = scan(source, files, verify=options['verify'], workers=options['workers'])
+
+        sections = [('missing', 'absent(s) du stockage')]
+        if options['verify']:
+            sections.append(('corrupt', 'dont le contenu a changé'))
+        if report['orphaned'] is None:
+            self.stdout.write(self.style.WARNING("Ce stockage ne sait pas lister ses fichiers : orphelins non recherchés."))
+        else:
+            sections.append(('orphaned', 'présent(s) mais référencé(s) par aucun document'))
+        for key, description in sections:
+            names = report[key]
+            style = self.style.ERROR if names and key != 'orphaned' else self.style.WARNING if names else self.style.SUCCESS
+            self.stdout.write(style(f"{len(names)} fichier(s) {description}"))
+            for name in names[:REPORT_LIMIT]:
+                self.stdout.write(f"  - {name}")
+            if len(names) > REPORT_LIMIT:
+                self.stdout.write(f"  ... et {len(names) - REPORT_LIMIT} autre(s)")
+
+        unreferenced = Blob.objects.filter(ref_count__lte=0).count()
+        if unreferenced:
+            self.stdout.write(self.style.WARNING(
+                f"{unreferenced} contenu(s) sans référence en base, à supprimer avec collect_garbage"
+            ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from files.models import Document
+from files.search import INDEX_BATCH_SIZE, extract_document_text, index_documents
+
+
+class Command(BaseCommand):
+    help = "Reconstruire l'index de recherche plein texte des documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--extract', action='store_true',
+                            help="Extraire aussi le texte des documents qui n'en ont pas encore")
+        parser.add_argument('--batch-size', type=int, default=INDEX_BATCH_SIZE,
+                            help='Nombre de documents indexés par lot')
+
+    def handle(self, *args, **options):
+        if options['extract']:
+            missing = Document.objects.filter(text__isnull=True).values_list('pk', flat=True)
+            extracted = 0
+            for pk in missing.iterator():
+                extract_document_text(pk)
+                extracted += 1
+            self.stdout.write(f"Texte extrait pour {extracted} document(s).")
+
+        ids = list(Document.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            index_documents(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"{len(ids)} document(s) indexé(s)."))
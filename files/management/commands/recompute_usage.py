@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from files.usage import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculer l'espace utilisé par utilisateur et par dossier à partir des "
+        "documents, par requêtes d'agrégat (correction d'une éventuelle dérive des compteurs)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Identifiant d\'utilisateur à recalculer (répétable ; tous par défaut)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Nombre de lignes mises à jour par requête')
+
+    def handle(self, *args, **options):
+        stats = recompute(options['users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Usage recalculé pour {stats['users']} utilisateur(s) et {stats['folders']} dossier(s)."
+        ))
@@ -0,0 +1,49 @@
+import os
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from files import jobs
+from files.tasks import worker_init
+
+
+class Command(BaseCommand):
+    help = "Exécuter les tâches d'arrière-plan de la file en base (FILES_TASK_BACKEND='database')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Nombre de processus workers (par défaut : nombre de CPU)')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Nombre de tâches réservées à la fois par chaque worker')
+        parser.add_argument('--poll-interval', type=float, default=jobs.POLL_INTERVAL,
+                            help="Attente (secondes) quand la file est vide")
+        parser.add_argument('--once', action='store_true',
+                            help="S'arrêter quand la file est vide (tâche planifiée, cron)")
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Supprimer au démarrage les tâches terminées depuis ce nombre de jours')
+
+    def handle(self, *args, **options):
+        purged = jobs.purge_finished(timedelta(days=options['purge_days']))
+        if purged:
+            self.stdout.write(f"{purged} tâche(s) terminée(s) supprimée(s).")
+
+        work_options = {
+            'batch_size': options['batch_size'],
+            'once': options['once'],
+            'poll_interval': options['poll_interval'],
+        }
+        processes = max(1, options['processes'])
+        self.stdout.write(f"Démarrage de {processes} worker(s).")
+        if processes == 1:
+            executed = jobs.work(**work_options)
+        else:
+            # Chaque processus ouvre ses propres connexions à la base
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                                     initializer=worker_init) as pool:
+                futures = [pool.submit(jobs.work, **work_options) for _ in range(processes)]
+                executed = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f"{executed} tâche(s) exécutée(s)."))
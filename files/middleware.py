@@ -0,0 +1,108 @@
+"""
+Middlewares de l'application files.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import instrumentation, user_cache
+from .async_storage import aiter_file
+
+
+class InstrumentationMiddleware:
+    """
+    Mesure chaque requête (voir instrumentation.py) : requêtes SQL, appels
+    au stockage, rendu des gabarits et latence totale, agrégés par vue.
+    Ajoute l'en-tête Server-Timing si FILES_SERVER_TIMING est activé.
+    À placer en tête de MIDDLEWARE pour inclure le coût des autres.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'FILES_SERVER_TIMING', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation.current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation.current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = instrumentation.finish(request, metrics)
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise utilisable sous ASGI sans repasser toute la chaîne en mode
+    synchrone : un middleware uniquement synchrone obligerait Django à
+    exécuter les vues asynchrones dans un thread, une requête à la fois.
+    Sous WSGI, le comportement est celui de WhiteNoise.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+
+        response = self.serve(static_file, request)
+        if response.file_to_stream is not None:
+            # Lecture du fichier par blocs dans un thread
+            response.streaming_content = aiter_file(response.file_to_stream)
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware dont l'utilisateur est lu dans le cache
+    (voir user_cache.py) : une requête authentifiée n'interroge plus la
+    table des utilisateurs. Chargé à la première lecture de request.user.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: cached_user(request))
+
+
+def cached_user(request):
+    # Une seule lecture par requête, comme django.contrib.auth.middleware.get_user
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = user_cache.get_user(request)
+    return request._cached_user
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_document_file_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['owner', 'folder', '-uploaded_at', '-id'], name='document_owner_folder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('folder__isnull', True)), fields=['owner', '-uploaded_at', '-id'], name='document_owner_root_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['owner', 'parent'], name='folder_owner_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['owner', 'id'], name='folder_owner_root_idx'),
+        ),
+    ]
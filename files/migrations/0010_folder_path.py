@@ -0,0 +1,46 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # Parcours en largeur : le chemin d'un parent est connu avant celui de ses enfants
+    Folder = apps.get_model('files', 'Folder')
+    paths = {}
+    level = list(Folder.objects.filter(parent__isnull=True).values_list('id', flat=True))
+    depth = 0
+    while level:
+        updates = []
+        for folder in Folder.objects.filter(id__in=level).only('id', 'parent_id'):
+            prefix = paths.get(folder.parent_id, '')
+            folder.path = paths[folder.id] = f'{prefix}{folder.id}/'
+            folder.depth = depth
+            updates.append(folder)
+        Folder.objects.bulk_update(updates, ['path', 'depth'], batch_size=500)
+        level = list(Folder.objects.filter(parent_id__in=level).values_list('id', flat=True))
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=1000),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Index plein texte propre à chaque base : FTS5 sous SQLite, tsvector + GIN
+# sous PostgreSQL. Les autres bases se contentent d'une recherche sur le titre.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE files_search USING fts5(
+        title, folder, content, owner_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+POSTGRESQL_FORWARD = [
+    """
+    CREATE TABLE files_search (
+        document_id bigint PRIMARY KEY
+            REFERENCES files_document (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        owner_id integer NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX files_search_document_idx ON files_search USING GIN (document)",
+    "CREATE INDEX files_search_owner_idx ON files_search (owner_id)",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_FORWARD,
+        'postgresql': POSTGRESQL_FORWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS files_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_folder_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='files.document')),
+                ('content', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
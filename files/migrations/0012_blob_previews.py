@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:24
+
+from django.db import migrations, models
+import files.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='preview',
+            field=models.FileField(blank=True, max_length=255, upload_to=files.models.preview_upload_path),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='preview_status',
+            field=models.CharField(choices=[('pending', 'En attente'), ('processing', 'En cours'), ('ready', 'Disponible'), ('unsupported', 'Type non pris en charge'), ('failed', 'Échec')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='thumbnail',
+            field=models.FileField(blank=True, max_length=255, upload_to=files.models.preview_upload_path),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def fill_usage(apps, schema_editor):
+    # Totaux initiaux par agrégats (voir usage.recompute)
+    Document = apps.get_model('files', 'Document')
+    Folder = apps.get_model('files', 'Folder')
+    StorageUsage = apps.get_model('files', 'StorageUsage')
+    StorageUsage.objects.bulk_create([
+        StorageUsage(user_id=row['owner_id'], used_bytes=row['size'] or 0, document_count=row['count'])
+        for row in Document.objects.values('owner_id').annotate(size=Sum('size'), count=Count('id')).order_by()
+    ], batch_size=500)
+    Folder.objects.bulk_update([
+        Folder(pk=row['folder_id'], used_bytes=row['size'] or 0)
+        for row in Document.objects.filter(folder__isnull=False)
+        .values('folder_id').annotate(size=Sum('size')).order_by()
+    ], ['used_bytes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('files', '0013_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('used_bytes', models.BigIntegerField(default=0)),
+                ('document_count', models.IntegerField(default=0)),
+                ('quota', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='used_bytes',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+# L'index de recherche est restreint par utilisateur dans l'index lui-même :
+# - SQLite : la colonne owner_id de FTS5 devient indexée, le filtre sur
+#   l'utilisateur fait partie de l'expression MATCH ;
+# - PostgreSQL : un seul index GIN composite (owner_id, document), grâce à
+#   l'extension btree_gin, remplace les deux index séparés.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE files_search_new USING fts5(
+        title, folder, content, owner_id,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO files_search_new (rowid, title, folder, content, owner_id)
+    SELECT rowid, title, folder, content, owner_id FROM files_search
+    """,
+    "DROP TABLE files_search",
+    "ALTER TABLE files_search_new RENAME TO files_search",
+]
+SQLITE_BACKWARD = [
+    """
+    CREATE VIRTUAL TABLE files_search_old USING fts5(
+        title, folder, content, owner_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO files_search_old (rowid, title, folder, content, owner_id)
+    SELECT rowid, title, folder, content, owner_id FROM files_search
+    """,
+    "DROP TABLE files_search",
+    "ALTER TABLE files_search_old RENAME TO files_search",
+]
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    "CREATE INDEX files_search_owner_document_idx ON files_search USING GIN (owner_id, document)",
+    "DROP INDEX files_search_document_idx",
+    "DROP INDEX files_search_owner_idx",
+]
+POSTGRESQL_BACKWARD = [
+    "CREATE INDEX files_search_document_idx ON files_search USING GIN (document)",
+    "CREATE INDEX files_search_owner_idx ON files_search (owner_id)",
+    "DROP INDEX files_search_owner_document_idx",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_folder_tree_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def count_archived_versions(apps, schema_editor):
+    # Versions déjà archivées : ajoutées au document, à son dossier et à l'usage de son propriétaire
+    Document = apps.get_model('files', 'Document')
+    DocumentVersion = apps.get_model('files', 'DocumentVersion')
+    StorageUsage = apps.get_model('files', 'StorageUsage')
+    Folder = apps.get_model('files', 'Folder')
+    rows = (
+        DocumentVersion.objects.values('document_id', 'document__owner_id', 'document__folder_id')
+        .annotate(size=Sum('size')).order_by()
+    )
+    for row in rows.iterator():
+        size = row['size'] or 0
+        Document.objects.filter(pk=row['document_id']).update(archived_size=size)
+        StorageUsage.objects.filter(user_id=row['document__owner_id']).update(used_bytes=F('used_bytes') + size)
+        if row['document__folder_id']:
+            Folder.objects.filter(pk=row['document__folder_id']).update(used_bytes=F('used_bytes') + size)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_uploadsession_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='archived_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_archived_versions, migrations.RunPython.noop),
+    ]
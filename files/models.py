@@ -1,5 +1,16 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .utils import file_checksum, guess_content_type
 
 class Folder(models.Model):
     name = models.CharField(max_length=100)
@@ -7,22 +18,167 @@ class Folder(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Chemin matérialisé : identifiants des ancêtres puis du dossier, ex. "3/17/42/".
+    # Ancêtres, descendants et comptages de sous-arbre se lisent en une requête.
+    path = models.CharField(max_length=1000, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Octets des documents placés directement dans ce dossier, tenus à jour
+    # à chaque écriture (voir files/usage.py)
+    used_bytes = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Sous-dossiers d'un dossier : filter(owner=..., parent=...)
+            models.Index(fields=['owner', 'parent'], name='folder_owner_parent_idx'),
+            # Descendants : filter(path__startswith=...) ; l'opclass permet à
+            # PostgreSQL d'utiliser l'index pour LIKE 'préfixe%' (ignorée ailleurs)
+            models.Index(fields=['path'], name='folder_path_idx', opclasses=['varchar_pattern_ops']),
+            # Dossiers racine du tableau de bord : filter(owner=..., parent__isnull=True)
+            models.Index(
+                fields=['owner', 'id'], name='folder_owner_root_idx',
+                condition=models.Q(parent__isnull=True),
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Refuser les cycles : un dossier ne peut pas descendre dans son propre sous-arbre
+        if self.path and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError("Un dossier ne peut pas être déplacé dans lui-même ou l'un de ses sous-dossiers.")
+
+        super().save(*args, **kwargs)
+
+        # Le chemin n'est recalculé qu'à la création et au déplacement
+        if self.path_parent_id() != self.parent_id or not self.path:
+            self.update_path()
+
+    def path_parent_id(self):
+        """
+        Parent tel qu'enregistré dans le chemin (None pour un dossier racine).
+        """
+        ids = self.ancestor_ids
+        return ids[-1] if ids else None
+
+    @property
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.split('/')[:-2]] if self.path else []
+
+    def build_path(self):
+        prefix = self.parent.path if self.parent_id else ''
+        return f'{prefix}{self.pk}/'
+
+    def update_path(self):
+        """
+        Recalcule le chemin du dossier et, s'il a été déplacé, celui de tous
+        ses descendants en une seule requête UPDATE.
+        """
+        old_path, old_depth = self.path, self.depth
+        self.path = self.build_path()
+        self.depth = self.path.count('/') - 1
+        Folder.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+
+        if old_path and old_path != self.path:
+            self.descendants(old_path).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (self.depth - old_depth),
+            )
+
+    def ancestors(self):
+        """
+        Ancêtres du dossier, de la racine au parent direct.
+        """
+        return Folder.objects.filter(pk__in=self.ancestor_ids).order_by('depth')
+
+    def descendants(self, path=None):
+        """
+        Tous les sous-dossiers, à toutes les profondeurs.
+        """
+        return Folder.objects.filter(owner_id=self.owner_id, path__startswith=path or self.path).exclude(pk=self.pk)
+
+    def subtree_used_bytes(self):
+        """
+        Octets utilisés par le dossier et tous ses sous-dossiers, sommés sur
+        les compteurs des dossiers (aucun document n'est parcouru).
+        """
+        total = Folder.objects.filter(owner_id=self.owner_id, path__startswith=self.path).aggregate(
+            total=models.Sum('used_bytes'),
+        )['total']
+        return total or 0
+
+    def subtree_document_count(self):
+        """
+        Nombre de documents du dossier et de tous ses sous-dossiers.
+        """
+        return Document.objects.filter(owner_id=self.owner_id, folder__path__startswith=self.path).count()
+
+    @property
+    def indented_name(self):
+        # Libellé indenté pour les listes déroulantes de dossiers
+        if not self.depth:
+            return self.name
+        return '\u00a0\u00a0\u00a0' * self.depth + '└ ' + self.name
+
+
+def blob_upload_path(instance, filename):
+    # Nom adressé par le contenu : deux fichiers identiques ont le même nom,
+    # et deux fichiers différents ne peuvent pas entrer en collision
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join('blobs', instance.checksum[:2], f'{instance.checksum}{ext}')
+
+
+def preview_upload_path(instance, filename):
+    # Aperçus rangés comme les blobs, sous l'empreinte du contenu d'origine
+    return os.path.join('previews', instance.checksum[:2], filename)
+
+
+class Blob(models.Model):
+    """
+    Contenu stocké une seule fois, partagé par tous les documents identiques.
+
+    ref_count compte les documents qui pointent vers ce blob ; à zéro, le
+    fichier peut être supprimé du stockage (voir files/blobs.py).
+
+    Les images dérivées (vignette et aperçu, voir files/previews.py) ne
+    dépendent que du contenu : elles sont aussi partagées.
+    """
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_PROCESSING = 'processing'
+    PREVIEW_READY = 'ready'
+    PREVIEW_UNSUPPORTED = 'unsupported'
+    PREVIEW_FAILED = 'failed'
+    PREVIEW_STATUS_CHOICES = [
+        (PREVIEW_PENDING, 'En attente'),
+        (PREVIEW_PROCESSING, 'En cours'),
+        (PREVIEW_READY, 'Disponible'),
+        (PREVIEW_UNSUPPORTED, 'Type non pris en charge'),
+        (PREVIEW_FAILED, 'Échec'),
+    ]
+
+    checksum = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_path, max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    thumbnail = models.FileField(upload_to=preview_upload_path, max_length=255, blank=True)
+    preview = models.FileField(upload_to=preview_upload_path, max_length=255, blank=True)
+    preview_status = models.CharField(max_length=20, choices=PREVIEW_STATUS_CHOICES, default=PREVIEW_PENDING)
+
+    def __str__(self):
+        return self.checksum
+
 
 def document_upload_path(instance, filename):
-    # Cette fonction génère un chemin unique pour chaque fichier
-    import os
-    from django.utils.text import slugify
-    from time import time
-    
-    # Récupère l'extension du fichier
-    ext = filename.split('.')[-1]
-    # Crée un nom de fichier unique avec un timestamp
-    filename = f"{slugify(instance.title)}_{int(time())}.{ext}"
-    # Retourne le chemin complet avec le sous-dossier 'documents'
-    return os.path.join('documents', filename)
+    # Nom adressé par le contenu, comme les blobs : deux envois du même
+    # titre au même instant ne peuvent plus entrer en collision. En pratique
+    # le fichier d'un document est celui de son blob (voir Document.save).
+    ext = os.path.splitext(filename)[1].lower()
+    key = instance.checksum or uuid.uuid4().hex
+    return os.path.join('documents', key[:2], f'{key}{ext}')
+
 
 class Document(models.Model):
     title = models.CharField(max_length=200)
@@ -30,6 +186,294 @@ class Document(models.Model):
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='documents', null=True, blank=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
+
+    # Métadonnées mémorisées au téléversement : les templates les lisent
+    # directement, sans interroger le stockage (Cloudinary en production)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    url = models.CharField(max_length=500, blank=True)
+
+    # Numéro de la version courante. Le document porte toujours le contenu
+    # de sa dernière version : les listes ne lisent jamais l'historique
+    # (DocumentVersion), qui ne contient que les versions remplacées.
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Octets des versions archivées, toujours stockés et comptés dans l'usage
+    # de l'utilisateur (voir files/usage.py)
+    archived_size = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Documents d'un dossier, du plus récent au plus ancien
+            models.Index(
+                fields=['owner', 'folder', '-uploaded_at', '-id'], name='document_owner_folder_idx',
+            ),
+            # Documents sans dossier du tableau de bord, du plus récent au plus ancien
+            models.Index(
+                fields=['owner', '-uploaded_at', '-id'], name='document_owner_root_idx',
+                condition=models.Q(folder__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Emplacement et taille tels qu'enregistrés, pour reporter un
+        # déplacement sur les compteurs d'usage (voir files/usage.py)
+        size, archived_size = instance.__dict__.get('size'), instance.__dict__.get('archived_size')
+        instance._saved_usage = (
+            instance.__dict__.get('folder_id'),
+            None if size is None or archived_size is None else size + archived_size,
+        )
+        return instance
+
+    @property
+    def stored_size(self):
+        # Octets occupés : contenu courant et versions archivées
+        return self.size + self.archived_size
+
+    def save(self, *args, **kwargs):
+        # Un fichier non encore envoyé au stockage est encore lisible localement :
+        # c'est le moment de relever sa taille, son type et son empreinte
+        new_file = bool(self.file) and not self.file._committed
+        previous_blob_id = self.blob_id
+        if new_file:
+            self.read_file_metadata()
+            # Contenu déjà stocké : on réutilise le blob au lieu de renvoyer le fichier
+            from .blobs import acquire_blob
+            self.blob = acquire_blob(self.file.file, self.checksum, self.content_type)
+            self.file = self.blob.file.name
+
+        # Le fichier est déjà sur le stockage (blob) : son URL est connue avant
+        # l'enregistrement, qui se fait donc en une seule écriture
+        if self.file and (new_file or not self.url):
+            self.url = self.file.url
+
+        super().save(*args, **kwargs)
+
+        if previous_blob_id and previous_blob_id != self.blob_id:
+            from .blobs import release_blobs
+            release_blobs([previous_blob_id])
+
+    def read_file_metadata(self):
+        """
+        Renseigne size, content_type et checksum à partir du fichier.
+        """
+        announced_type = getattr(self.file.file, 'content_type', None)
+        self.size = self.file.size
+        self.content_type = guess_content_type(self.file.name, fallback=announced_type)
+        # Empreinte déjà calculée pendant la réception (voir upload_handlers.py)
+        self.checksum = getattr(self.file.file, 'checksum', None) or file_checksum(self.file)
+
+
+class DocumentVersion(models.Model):
+    """
+    Version remplacée d'un document (voir files/versions.py).
+
+    La version archivée garde la référence de son blob : le contenu reste
+    stocké tant que la version existe, et est libéré avec elle.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField()
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='versions')
+    file = models.FileField(upload_to=document_upload_path, max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    # Date à laquelle cette version a été remplacée par la suivante
+    replaced_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'number'], name='unique_document_version'),
+        ]
+
+    def __str__(self):
+        return f'{self.document_id} v{self.number}'
+
+    @property
+    def title(self):
+        # Nom de téléchargement (voir downloads.download_filename)
+        return f'{self.document.title} (v{self.number})'
+
+
+class StorageUsage(models.Model):
+    """
+    Espace utilisé par un utilisateur, tenu à jour à chaque écriture (voir
+    files/usage.py) : le total se lit en une requête, sans parcourir les
+    documents ni interroger le stockage.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    used_bytes = models.BigIntegerField(default=0)
+    document_count = models.IntegerField(default=0)
+    # Quota propre à l'utilisateur ; vide : settings.FILES_DEFAULT_QUOTA
+    quota = models.PositiveBigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} : {self.used_bytes} octets"
+
+    @property
+    def quota_bytes(self):
+        """
+        Quota applicable en octets, ou None sans limite.
+        """
+        if self.quota is not None:
+            return self.quota
+        return getattr(settings, 'FILES_DEFAULT_QUOTA', None)
+
+    @property
+    def remaining_bytes(self):
+        quota = self.quota_bytes
+        return None if quota is None else max(quota - self.used_bytes, 0)
+
+    @property
+    def percent_used(self):
+        quota = self.quota_bytes
+        return min(round(self.used_bytes * 100 / quota), 100) if quota else 0
+
+
+class UploadSession(models.Model):
+    """
+    Téléversement découpé en morceaux, reprenable après une coupure.
+
+    Les morceaux sont ajoutés au fur et à mesure dans un fichier partiel
+    local ; une fois complet, il est transmis au stockage en arrière-plan.
+    """
+    UPLOADING = 'uploading'
+    PROCESSING = 'processing'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'En cours'),
+        (PROCESSING, 'En traitement'),
+        (COMPLETE, 'Terminé'),
+        (FAILED, 'Échec'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    title = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UPLOADING)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Contenu déjà envoyé au stockage, en attendant la création du document
+    # (voir uploads.finalize_session) : la session en retient une référence
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    error = models.TextField(blank=True)
+    # Empreinte calculée pendant la réception (téléversement classique), sinon vide
+    checksum = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.FILES_UPLOAD_STAGING_DIR, f'{self.id}.part')
+
+    @property
+    def is_complete(self):
+        return self.received_size >= self.total_size
+
+
+class DocumentText(models.Model):
+    """
+    Texte extrait du contenu d'un document (PDF, texte brut), alimentant
+    l'index de recherche plein texte (voir files/search.py).
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    content = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Texte de {self.document_id}"
+
+
+class Job(models.Model):
+    """
+    Tâche d'arrière-plan en attente ou exécutée, pour le mode
+    FILES_TASK_BACKEND='database' (voir files/jobs.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminée'),
+        (FAILED, 'Échec'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # File d'attente : seules les tâches prêtes à partir sont indexées
+            models.Index(
+                fields=['run_after', 'id'], name='job_queued_idx',
+                condition=models.Q(status='queued'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class FolderTree(models.Model):
+    """
+    Version de l'arborescence des dossiers d'un utilisateur, incrémentée à
+    chaque création, modification ou suppression d'un dossier (voir
+    files/folder_tree.py).
+    """
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='folder_tree')
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Arborescence de {self.owner} (v{self.version})"
+
+
+class FolderChange(models.Model):
+    """
+    Dernière modification de chaque dossier, avec la version de
+    l'arborescence qui l'a produite. Une ligne par dossier (réécrite à
+    chaque modification) : les changements depuis la version N se lisent
+    en une requête, et le journal ne grossit pas avec les renommages.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folder_changes')
+    # Pas de clé étrangère : la ligne survit au dossier supprimé
+    folder_id = models.IntegerField()
+    version = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'folder_id'], name='unique_folder_change'),
+        ]
+        indexes = [
+            # Changements depuis une version : filter(owner=..., version__gt=N)
+            models.Index(fields=['owner', 'version'], name='folder_change_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"Dossier {self.folder_id} (v{self.version})"
@@ -0,0 +1,76 @@
+"""
+Pagination par curseur (keyset) des listes de documents.
+
+Les documents sont triés par (uploaded_at, id) décroissants. Le curseur
+encode la clé du dernier document affiché et la page suivante commence
+strictement après lui : chaque page coûte une seule requête indexée, quelle
+que soit la profondeur de défilement (pas d'OFFSET).
+"""
+import base64
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from django.db.models import Q
+
+# Nombre de documents rendus par page
+PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    """
+    Curseur mal formé ou falsifié.
+    """
+
+
+class Page(NamedTuple):
+    documents: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(document):
+    raw = f'{document.uploaded_at.isoformat()}|{document.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        uploaded_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_page(queryset, cursor=None, page_size=None):
+    """
+    Retourne la page de `queryset` qui suit `cursor` (la première si None).
+
+    Lève InvalidCursor si le curseur ne peut pas être décodé.
+    """
+    page_size = page_size or PAGE_SIZE
+    return make_page(list(page_queryset(queryset, cursor, page_size)), page_size)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=None):
+    """
+    Version asynchrone de keyset_page (vues ASGI).
+    """
+    page_size = page_size or PAGE_SIZE
+    return make_page([row async for row in page_queryset(queryset, cursor, page_size)], page_size)
+
+
+def page_queryset(queryset, cursor, page_size):
+    queryset = queryset.order_by('-uploaded_at', '-id')
+    if cursor:
+        uploaded_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk)
+        )
+    # Un élément de plus que la taille de page indique s'il reste des documents
+    return queryset[:page_size + 1]
+
+
+def make_page(rows, page_size):
+    documents = rows[:page_size]
+    next_cursor = encode_cursor(documents[-1]) if len(rows) > page_size else None
+    return Page(documents, next_cursor)
@@ -0,0 +1,166 @@
+"""
+Génération des vignettes et aperçus des documents (PDF et images).
+
+Les images dérivées sont calculées une fois par contenu (Blob), en
+arrière-plan après le téléversement, et stockées sous l'empreinte du
+contenu d'origine : previews/<sha[:2]>/<sha>-thumbnail.jpg. Leur nom ne
+change jamais pour un même contenu, elles peuvent donc être mises en
+cache longtemps par les navigateurs.
+
+Pillow est nécessaire pour les images, PyMuPDF en plus pour les PDF ;
+sans eux, les documents gardent une icône selon leur type.
+"""
+import io
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+
+from . import tasks
+from .models import Blob
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale (largeur, hauteur) de chaque image dérivée
+VARIANTS = {
+    'thumbnail': (128, 128),
+    'preview': (640, 640),
+}
+
+JPEG_QUALITY = 80
+
+# Résolution de rendu de la première page d'un PDF (la page est ensuite réduite)
+PDF_RENDER_DPI = 110
+
+# Images plus grandes refusées (protection contre les « bombes » de décompression)
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+def is_supported(content_type):
+    return content_type == 'application/pdf' or (content_type or '').startswith('image/')
+
+
+def open_source_image(blob):
+    """
+    Image Pillow de la première page (PDF) ou de l'image d'origine, ou None
+    si les bibliothèques nécessaires ne sont pas installées.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+    if blob.content_type == 'application/pdf':
+        try:
+            import pymupdf
+        except ImportError:
+            return None
+        # Ouvert depuis un fichier : PyMuPDF ne lit que les objets de la première page
+        with source_path(blob.file) as path, pymupdf.open(path, filetype='pdf') as pdf:
+            if not pdf.page_count:
+                return None
+            pixmap = pdf[0].get_pixmap(dpi=PDF_RENDER_DPI)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    # Pillow lit le fichier au fur et à mesure du décodage
+    with blob.file.open('rb') as f:
+        image = Image.open(f)
+        image.draft('RGB', VARIANTS['preview'])  # Décodage JPEG réduit, bien plus rapide
+        image.load()
+    return image
+
+
+@contextmanager
+def source_path(field_file):
+    """
+    Chemin local du fichier : le sien sur un stockage local, sinon celui
+    d'une copie temporaire écrite morceau par morceau.
+    """
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        path = None
+    if path:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(field_file.name)[1]) as copy:
+        with field_file.open('rb') as f:
+            for chunk in f.chunks():
+                copy.write(chunk)
+        copy.flush()
+        yield copy.name
+
+
+def render_variant(image, size):
+    from PIL import ImageOps
+
+    variant = ImageOps.exif_transpose(image)
+    variant.thumbnail(size)
+    if variant.mode != 'RGB':
+        # Transparence aplatie sur fond blanc (le JPEG n'a pas de canal alpha)
+        from PIL import Image
+        background = Image.new('RGB', variant.size, 'white')
+        background.paste(variant, mask=variant.getchannel('A') if 'A' in variant.getbands() else None)
+        variant = background
+    output = io.BytesIO()
+    variant.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def save_variant(field_file, name, data):
+    # Nom fixe : une version laissée par une tentative précédente est remplacée
+    path = field_file.field.generate_filename(field_file.instance, name)
+    if field_file.storage.exists(path):
+        field_file.storage.delete(path)
+    field_file.save(name, ContentFile(data), save=False)
+
+
+def generate_previews(blob_id):
+    """
+    Calcule les images dérivées du blob `blob_id` s'il est en attente.
+    Retourne le nouveau statut du blob, ou None s'il était déjà traité
+    (ou en cours de traitement par un autre worker).
+    """
+    # Réservation du blob : un seul worker le traite
+    claimed = Blob.objects.filter(pk=blob_id, preview_status=Blob.PREVIEW_PENDING).update(
+        preview_status=Blob.PREVIEW_PROCESSING,
+    )
+    if not claimed:
+        return None
+    blob = Blob.objects.get(pk=blob_id)
+
+    if not is_supported(blob.content_type):
+        status = Blob.PREVIEW_UNSUPPORTED
+    else:
+        try:
+            image = open_source_image(blob)
+            if image is None:
+                status = Blob.PREVIEW_UNSUPPORTED
+            else:
+                for field, size in VARIANTS.items():
+                    save_variant(getattr(blob, field), f'{blob.checksum}-{field}.jpg', render_variant(image, size))
+                status = Blob.PREVIEW_READY
+        except Exception:
+            logger.warning("Aperçu impossible pour le blob %s", blob_id, exc_info=True)
+            status = Blob.PREVIEW_FAILED
+
+    Blob.objects.filter(pk=blob_id).update(
+        preview_status=status, thumbnail=blob.thumbnail.name or '', preview=blob.preview.name or '',
+    )
+    return status
+
+
+@tasks.task
+def generate_previews_task(blob_id):
+    return generate_previews(blob_id)
+
+
+def schedule(blob):
+    """
+    Programme la génération des aperçus d'un nouveau contenu.
+    """
+    if blob.preview_status == Blob.PREVIEW_PENDING:
+        tasks.enqueue(generate_previews_task, blob.pk)
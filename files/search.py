@@ -0,0 +1,251 @@
+"""
+Recherche plein texte sur les titres, noms de dossier et contenus extraits.
+
+L'index est la table `files_search`, créée par la migration 0011 :
+
+- SQLite : table virtuelle FTS5 (rowid = id du document), classement bm25 ;
+  l'utilisateur est une colonne indexée, filtrée dans l'expression MATCH ;
+- PostgreSQL : colonne tsvector pondérée avec index GIN composite
+  (owner_id, document), classement ts_rank.
+
+Les autres bases retombent sur une recherche non indexée dans les titres.
+L'extraction du texte (PDF, texte brut) et la mise à jour de l'index se
+font en arrière-plan, après le téléversement.
+"""
+import logging
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from . import tasks
+from .models import Document, DocumentText
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'files_search'
+
+# Limite du texte extrait par document (un tsvector PostgreSQL est limité à 1 Mo)
+MAX_TEXT_CHARS = 200_000
+
+# Nombre de documents réindexés par lot
+INDEX_BATCH_SIZE = 500
+
+# Types de contenu lus directement comme du texte
+TEXT_CONTENT_TYPES = ('application/json', 'application/xml', 'application/csv')
+
+# Documents à retirer de l'index, par thread (voir deferred_removal)
+_pending = threading.local()
+
+
+def backend():
+    vendor = connection.vendor
+    return vendor if vendor in ('sqlite', 'postgresql') else None
+
+
+def search_config():
+    # Configuration PostgreSQL de découpage en mots
+    return getattr(settings, 'FILES_SEARCH_CONFIG', 'simple')
+
+
+# --- Extraction -----------------------------------------------------------
+
+def extract_text(document):
+    """
+    Texte brut du contenu du document, ou chaîne vide si son type n'est pas
+    pris en charge ou si la lecture échoue.
+    """
+    content_type = document.content_type or ''
+    try:
+        if content_type == 'application/pdf':
+            with document.file.open('rb') as f:
+                return extract_pdf_text(f)
+        if content_type.startswith('text/') or content_type in TEXT_CONTENT_TYPES:
+            with document.file.open('rb') as f:
+                return f.read(MAX_TEXT_CHARS * 4).decode('utf-8', errors='replace')[:MAX_TEXT_CHARS]
+    except Exception:
+        logger.warning("Extraction impossible pour le document %s", document.pk, exc_info=True)
+    return ''
+
+
+def extract_pdf_text(f):
+    # pypdf est facultatif : sans lui, seuls le titre et le dossier sont indexés
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ''
+
+    parts, length = [], 0
+    for page in PdfReader(f).pages:
+        text = page.extract_text() or ''
+        parts.append(text)
+        length += len(text)
+        if length >= MAX_TEXT_CHARS:
+            break
+    return '\n'.join(parts)[:MAX_TEXT_CHARS]
+
+
+@tasks.task
+def extract_document_text(document_id):
+    """
+    Extrait le texte d'un document fraîchement téléversé puis l'indexe.
+    """
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None:
+        return
+    DocumentText.objects.update_or_create(document=document, defaults={'content': extract_text(document)})
+    index_documents([document_id])
+
+
+# --- Indexation -------------------------------------------------------------
+
+@tasks.task
+def index_documents(document_ids):
+    """
+    (Ré)indexe les documents donnés à partir de leur titre, du nom de leur
+    dossier et du texte déjà extrait.
+    """
+    if backend() is None:
+        return
+    rows = list(
+        Document.objects.filter(pk__in=document_ids)
+        .values_list('id', 'owner_id', 'title', 'folder__name', 'text__content')
+    )
+    rows = [(pk, owner_id, title, folder or '', content or '') for pk, owner_id, title, folder, content in rows]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        if backend() == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", [row[0] for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, owner_id, title, folder, content) VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+        else:
+            config = search_config()
+            cursor.executemany(
+                f"""
+                INSERT INTO {SEARCH_TABLE} (document_id, owner_id, document)
+                VALUES (%s, %s,
+                    setweight(to_tsvector(%s::regconfig, %s), 'A')
+                    || setweight(to_tsvector(%s::regconfig, %s), 'B')
+                    || setweight(to_tsvector(%s::regconfig, %s), 'C'))
+                ON CONFLICT (document_id) DO UPDATE
+                SET owner_id = EXCLUDED.owner_id, document = EXCLUDED.document
+                """,
+                [
+                    (pk, owner_id, config, title, config, folder, config, content)
+                    for pk, owner_id, title, folder, content in rows
+                ],
+            )
+
+
+@tasks.task
+def index_folder(folder_id):
+    """
+    Réindexe les documents d'un dossier (après un renommage par exemple).
+    """
+    ids = list(Document.objects.filter(folder_id=folder_id).values_list('pk', flat=True))
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        index_documents(ids[start:start + INDEX_BATCH_SIZE])
+
+
+def remove_documents(document_ids):
+    """
+    Retire des documents de l'index, par lots. Sous PostgreSQL, la clé
+    étrangère en cascade s'en charge déjà.
+    """
+    if backend() != 'sqlite' or not document_ids:
+        return
+    if getattr(_pending, 'document_ids', None) is not None:
+        _pending.document_ids.extend(document_ids)
+        return
+    document_ids = list(document_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(document_ids), INDEX_BATCH_SIZE):
+            batch = document_ids[start:start + INDEX_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+
+@contextmanager
+def deferred_removal():
+    """
+    Regroupe les documents supprimés dans le bloc (suppressions en masse)
+    et les retire de l'index en une fois à la sortie, au lieu d'une
+    requête par document.
+    """
+    if getattr(_pending, 'document_ids', None) is not None:
+        # Déjà dans un bloc différé : c'est lui qui retirera
+        yield
+        return
+    _pending.document_ids = []
+    try:
+        yield
+        removed = _pending.document_ids
+    finally:
+        _pending.document_ids = None
+    remove_documents(removed)
+
+
+# --- Recherche --------------------------------------------------------------
+
+def tokenize(query):
+    return re.findall(r'\w+', query or '')
+
+
+def match_expression(owner_id, words):
+    """
+    Expression FTS5 : documents de `owner_id` dont le titre, le dossier ou
+    le contenu contient chaque mot en préfixe. Les mots sont entre
+    guillemets (pas d'opérateur FTS5 injecté) et ne portent pas sur la
+    colonne owner_id.
+    """
+    terms = ' '.join(f'"{word}"*' for word in words)
+    return f'owner_id : "{int(owner_id)}" AND {{title folder content}} : ({terms})'
+
+
+def search_documents(owner, query, limit=50):
+    """
+    Documents de `owner` correspondant à `query`, du plus pertinent au
+    moins pertinent. Chaque mot de la requête doit apparaître (en préfixe)
+    dans le titre, le nom du dossier ou le contenu.
+    """
+    words = tokenize(query)
+    if not words:
+        return []
+
+    if backend() == 'sqlite':
+        sql = f"""
+            SELECT rowid FROM {SEARCH_TABLE}
+            WHERE {SEARCH_TABLE} MATCH %s
+            ORDER BY bm25({SEARCH_TABLE}, 10.0, 4.0, 1.0, 0.0)
+            LIMIT %s
+        """
+        params = [match_expression(owner.pk, words), limit]
+    elif backend() == 'postgresql':
+        sql = f"""
+            SELECT document_id FROM {SEARCH_TABLE}, to_tsquery(%s::regconfig, %s) query
+            WHERE owner_id = %s AND document @@ query
+            ORDER BY ts_rank(document, query) DESC
+            LIMIT %s
+        """
+        params = [search_config(), ' & '.join(f'{word}:*' for word in words), owner.pk, limit]
+    else:
+        documents = Document.objects.filter(owner=owner).select_related('folder', 'blob')
+        for word in words:
+            documents = documents.filter(title__icontains=word)
+        return list(documents.order_by('-uploaded_at', '-id')[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+
+    documents = Document.objects.filter(owner=owner, pk__in=ids).select_related('folder', 'blob').in_bulk()
+    return [documents[pk] for pk in ids if pk in documents]
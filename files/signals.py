@@ -0,0 +1,103 @@
+"""
+Récepteurs de signaux de l'application files.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, folder_tree, previews, search, tasks, usage, user_cache
+from .blobs import release_blobs
+from .models import Document, DocumentVersion, Folder, UploadSession
+
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    # Un document supprimé libère sa référence sur le contenu partagé
+    if instance.blob_id:
+        release_blobs([instance.blob_id])
+
+
+@receiver(post_delete, sender=DocumentVersion)
+def release_version_blob(sender, instance, **kwargs):
+    # Version supprimée (avec son document) : son contenu n'est plus retenu
+    if instance.blob_id:
+        release_blobs([instance.blob_id])
+
+
+@receiver(post_delete, sender=UploadSession)
+def release_session_blob(sender, instance, **kwargs):
+    # Session supprimée avant la création de son document : contenu envoyé pour rien
+    if instance.blob_id:
+        release_blobs([instance.blob_id])
+
+
+@receiver(post_save, sender=Document)
+def count_document_usage(sender, instance, created, **kwargs):
+    # Compteurs d'espace utilisé de l'utilisateur et du dossier
+    usage.document_saved(instance, created)
+
+
+@receiver(post_delete, sender=Document)
+def uncount_document_usage(sender, instance, **kwargs):
+    usage.document_deleted(instance)
+
+
+@receiver(post_delete, sender=DocumentVersion)
+def uncount_version_usage(sender, instance, origin=None, **kwargs):
+    # Supprimée avec son document (ou son compte) : déjà retirée avec lui
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is DocumentVersion:
+        usage.version_deleted(instance)
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, created, **kwargs):
+    # Nouveau document : extraction du texte puis indexation, en arrière-plan
+    if created:
+        tasks.enqueue(search.extract_document_text, instance.pk)
+        if instance.blob_id:
+            previews.schedule(instance.blob)
+    else:
+        tasks.enqueue(search.index_documents, [instance.pk])
+
+
+@receiver(post_delete, sender=Document)
+def unindex_document(sender, instance, **kwargs):
+    search.remove_documents([instance.pk])
+
+
+@receiver(post_save, sender=Folder)
+def index_folder_documents(sender, instance, created, **kwargs):
+    # Le nom du dossier fait partie de l'index de ses documents
+    if not created:
+        tasks.enqueue(search.index_folder, instance.pk)
+
+
+@receiver(post_save, sender=Folder)
+def record_folder_change(sender, instance, **kwargs):
+    # Nouvelle version de l'arborescence servie aux clients (voir folder_tree.py)
+    folder_tree.record(instance.owner_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Folder)
+def record_folder_deletion(sender, instance, origin=None, **kwargs):
+    # Suppression du compte : son arborescence et son journal disparaissent avec lui
+    if not isinstance(origin, get_user_model()):
+        folder_tree.record(instance.owner_id, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+def invalidate_dashboard(sender, instance, **kwargs):
+    # Toute écriture sur les dossiers ou documents périme le tableau de bord
+    caching.invalidate(instance.owner_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Utilisateur modifié (mot de passe, compte désactivé...) : plus servi par le cache
+    user_cache.invalidate(instance.pk)
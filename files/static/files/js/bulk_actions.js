@@ -0,0 +1,96 @@
+/* ============================================
+   DocuSpace - Sélection multiple et actions groupées
+   ============================================
+   Chaque carte contenant une barre [data-bulk-toolbar] permet de cocher
+   plusieurs documents ([data-bulk-item], y compris les lignes chargées
+   plus tard) puis de les déplacer ou supprimer en une seule requête. */
+(function () {
+    'use strict';
+
+    function csrfToken() {
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    function setup(toolbar) {
+        var card = toolbar.closest('.card');
+        var selectAll = toolbar.querySelector('[data-bulk-all]');
+        var count = toolbar.querySelector('[data-bulk-count]');
+        var status = toolbar.querySelector('[data-bulk-status]');
+        var buttons = toolbar.querySelectorAll('[data-bulk-action]');
+
+        function items() {
+            return Array.prototype.slice.call(card.querySelectorAll('[data-bulk-item]'));
+        }
+
+        function selectedIds() {
+            return items().filter(function (item) { return item.checked; })
+                .map(function (item) { return Number(item.value); });
+        }
+
+        function refresh() {
+            var selected = selectedIds().length;
+            count.textContent = selected;
+            selectAll.checked = selected > 0 && selected === items().length;
+            buttons.forEach(function (button) { button.disabled = selected === 0; });
+        }
+
+        selectAll.addEventListener('change', function () {
+            items().forEach(function (item) { item.checked = selectAll.checked; });
+            refresh();
+        });
+
+        card.addEventListener('change', function (e) {
+            if (e.target.matches('[data-bulk-item]')) {
+                refresh();
+            }
+        });
+
+        buttons.forEach(function (button) {
+            button.addEventListener('click', function () {
+                if (button.dataset.bulkConfirm && !confirm(button.dataset.bulkConfirm)) {
+                    return;
+                }
+                var action = button.dataset.bulkAction;
+                var body = { ids: selectedIds() };
+                if (action === 'move') {
+                    body.folder = toolbar.querySelector('[data-bulk-folder]').value || null;
+                }
+
+                buttons.forEach(function (b) { b.disabled = true; });
+                status.textContent = 'Traitement en cours...';
+                fetch(toolbar.dataset[action + 'Url'], {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+                    body: JSON.stringify(body),
+                    credentials: 'same-origin'
+                })
+                    .then(function (response) {
+                        return response.json().then(function (data) {
+                            if (!response.ok) {
+                                throw new Error(data.error);
+                            }
+                            return data;
+                        });
+                    })
+                    .then(function (data) {
+                        var failed = body.ids.length - (data.counts.ok || 0);
+                        if (failed) {
+                            alert(failed + ' document(s) n\'ont pas pu être traités.');
+                        }
+                        window.location.reload();
+                    })
+                    .catch(function (error) {
+                        status.textContent = 'Échec' + (error && error.message ? ' : ' + error.message : '');
+                        refresh();
+                    });
+            });
+        });
+
+        refresh();
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('[data-bulk-toolbar]').forEach(setup);
+    });
+})();
@@ -0,0 +1,139 @@
+/* ============================================
+   DocuSpace - Téléversement par morceaux avec reprise
+   ============================================
+   Le fichier est découpé en morceaux envoyés un par un (PUT + Upload-Offset).
+   L'identifiant de session est gardé dans localStorage : si l'utilisateur
+   resélectionne le même fichier après une coupure, l'envoi reprend à la
+   position déjà reçue par le serveur. */
+window.DocuSpaceChunkedUpload = (function () {
+    'use strict';
+
+    var MAX_RETRIES = 5;
+
+    function storageKey(file) {
+        return 'docuspace-upload:' + [file.name, file.size, file.lastModified].join(':');
+    }
+
+    function request(method, url, csrfToken, options) {
+        options = options || {};
+        var headers = Object.assign({ 'X-CSRFToken': csrfToken }, options.headers || {});
+        return fetch(url, {
+            method: method,
+            headers: headers,
+            body: options.body,
+            credentials: 'same-origin'
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                data.httpStatus = response.status;
+                return data;
+            });
+        });
+    }
+
+    function wait(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    function start(form) {
+        var input = form.querySelector('input[type="file"]');
+        var file = input && input.files[0];
+        if (!file || !window.fetch || !file.slice) {
+            return false;
+        }
+
+        var createUrl = form.dataset.chunkedUpload;
+        var csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+        var progress = form.querySelector('[data-upload-progress]');
+        var bar = progress.querySelector('.progress-bar');
+        var status = progress.querySelector('[data-upload-status]');
+        var submit = form.querySelector('[type="submit"]');
+        var key = storageKey(file);
+
+        progress.classList.remove('d-none');
+        submit.disabled = true;
+
+        function show(offset, message) {
+            var percent = file.size ? Math.floor(offset * 100 / file.size) : 100;
+            bar.style.width = percent + '%';
+            status.textContent = message || (percent + ' %');
+        }
+
+        function openSession() {
+            var saved = localStorage.getItem(key);
+            if (saved) {
+                // Reprise : on demande au serveur où il en est
+                return request('GET', saved, csrfToken).then(function (session) {
+                    if (session.httpStatus === 200 && session.status === 'uploading') {
+                        session.url = saved;
+                        return session;
+                    }
+                    localStorage.removeItem(key);
+                    return openSession();
+                });
+            }
+            var body = new FormData();
+            body.append('title', form.querySelector('[name="title"]').value);
+            body.append('folder', form.querySelector('[name="folder"]').value);
+            body.append('filename', file.name);
+            body.append('size', file.size);
+            return request('POST', createUrl, csrfToken, { body: body }).then(function (session) {
+                if (session.httpStatus !== 201) {
+                    throw new Error(session.error);
+                }
+                session.url = createUrl + session.id + '/';
+                localStorage.setItem(key, session.url);
+                return session;
+            });
+        }
+
+        function sendFrom(session, offset, retries) {
+            show(offset);
+            if (offset >= file.size) {
+                return request('POST', session.url + 'complete/', csrfToken);
+            }
+            var chunk = file.slice(offset, offset + session.chunk_size);
+            return request('PUT', session.url, csrfToken, {
+                headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            }).then(function (result) {
+                if (result.httpStatus === 200 || result.httpStatus === 409) {
+                    // 409 : le serveur indique la bonne position, on s'y recale
+                    return sendFrom(session, result.offset, MAX_RETRIES);
+                }
+                throw new Error(result.error);
+            }, function (error) {
+                // Coupure réseau : nouvelle tentative après une pause croissante
+                if (retries <= 0) {
+                    throw error;
+                }
+                show(offset, 'Connexion perdue, nouvelle tentative...');
+                return wait((MAX_RETRIES - retries + 1) * 1000).then(function () {
+                    return request('GET', session.url, csrfToken).then(function (current) {
+                        return sendFrom(session, current.offset, retries - 1);
+                    });
+                });
+            });
+        }
+
+        openSession()
+            .then(function (session) { return sendFrom(session, session.offset, MAX_RETRIES); })
+            .then(function (result) {
+                if (result.httpStatus !== 202) {
+                    throw new Error(result.error);
+                }
+                localStorage.removeItem(key);
+                show(file.size, 'Fichier reçu, traitement en cours...');
+                window.location.href = form.dataset.successUrl;
+            })
+            .catch(function (error) {
+                bar.classList.add('bg-danger');
+                status.textContent = 'Échec du téléversement' + (error && error.message ? ' : ' + error.message : '')
+                    + '. Resélectionnez le fichier pour reprendre.';
+                submit.disabled = false;
+            });
+
+        return true;
+    }
+
+    return { start: start };
+})();
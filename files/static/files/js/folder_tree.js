@@ -0,0 +1,138 @@
+/* ============================================
+   DocuSpace - Arborescence des dossiers gardée en cache
+   ============================================
+   Un <select data-folder-tree="url" data-user="id"> reçoit les dossiers de
+   l'utilisateur, en retrait selon leur profondeur. Options :
+   data-current (dossier affiché mais désactivé), data-selected (dossier
+   présélectionné), data-exclude-subtree (dossier retiré avec ses descendants).
+
+   L'arborescence est gardée dans localStorage avec sa version : les pages
+   suivantes ne demandent que les changements depuis cette version, ou
+   rien du tout (304) si elle n'a pas changé (voir files/folder_tree.py). */
+(function () {
+    'use strict';
+
+    function storageKey(user) {
+        return 'docuspace:folder-tree:' + user;
+    }
+
+    function readCache(user) {
+        try {
+            return JSON.parse(localStorage.getItem(storageKey(user)));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function writeCache(user, tree) {
+        try {
+            localStorage.setItem(storageKey(user), JSON.stringify(tree));
+        } catch (e) {
+            // Stockage plein ou désactivé : l'arborescence sera redemandée
+        }
+    }
+
+    // Applique une réponse, complète ou différentielle, à l'arborescence en cache
+    function merge(cached, data) {
+        if (data.folders) {
+            return { version: data.version, folders: data.folders };
+        }
+        var byId = {};
+        cached.folders.forEach(function (row) { byId[row[0]] = row; });
+        data.changed.forEach(function (row) { byId[row[0]] = row; });
+        data.deleted.forEach(function (id) { delete byId[id]; });
+        return {
+            version: data.version,
+            folders: Object.keys(byId).map(function (id) { return byId[id]; })
+        };
+    }
+
+    // Dossiers dans l'ordre de l'arborescence, avec leur profondeur
+    function ordered(folders) {
+        var children = {};
+        folders.forEach(function (row) {
+            var parent = row[1] === null ? 'root' : row[1];
+            (children[parent] = children[parent] || []).push(row);
+        });
+        var result = [];
+        function walk(parent, depth) {
+            (children[parent] || [])
+                .sort(function (a, b) { return a[0] - b[0]; })
+                .forEach(function (row) {
+                    result.push({ id: row[0], name: row[2], depth: depth });
+                    walk(row[0], depth + 1);
+                });
+        }
+        walk('root', 0);
+        return result;
+    }
+
+    function load(url, user) {
+        var cached = readCache(user);
+        var headers = { 'X-Requested-With': 'XMLHttpRequest' };
+        if (cached) {
+            url += (url.indexOf('?') === -1 ? '?' : '&') + 'since=' + cached.version;
+            headers['If-None-Match'] = '"tree-' + cached.version + '"';
+        }
+        return fetch(url, { headers: headers, credentials: 'same-origin', cache: 'no-store' })
+            .then(function (response) {
+                if (response.status === 304 && cached) {
+                    return cached;
+                }
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json().then(function (data) {
+                    var tree = merge(cached, data);
+                    writeCache(user, tree);
+                    return tree;
+                });
+            });
+    }
+
+    function fill(select, tree) {
+        var current = select.dataset.current;
+        var selected = select.dataset.selected;
+        var excluded = select.dataset.excludeSubtree;
+        var skipBelow = null;
+
+        ordered(tree.folders).forEach(function (folder) {
+            if (skipBelow !== null) {
+                if (folder.depth > skipBelow) {
+                    return;
+                }
+                skipBelow = null;
+            }
+            if (String(folder.id) === excluded) {
+                skipBelow = folder.depth;
+                return;
+            }
+            var option = document.createElement('option');
+            option.value = folder.id;
+            option.dataset.folderName = folder.name.toLowerCase();
+            // Même retrait que Folder.indented_name
+            option.textContent = folder.depth
+                ? '\u00a0\u00a0\u00a0'.repeat(folder.depth) + '└ ' + folder.name
+                : folder.name;
+            if (String(folder.id) === current) {
+                option.disabled = true;
+                option.textContent += ' (dossier actuel)';
+            }
+            option.selected = String(folder.id) === selected;
+            select.appendChild(option);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-folder-tree]').forEach(function (select) {
+            select.disabled = true;
+            load(select.dataset.folderTree, select.dataset.user)
+                .then(function (tree) { fill(select, tree); })
+                .catch(function () {
+                    // Seule la racine reste proposée
+                    localStorage.removeItem(storageKey(select.dataset.user));
+                })
+                .then(function () { select.disabled = false; });
+        });
+    });
+})();
@@ -0,0 +1,90 @@
+/* ============================================
+   DocuSpace - Chargement progressif des listes de documents
+   ============================================
+   Le <tbody data-lazy-rows="url" data-next-cursor="..."> reçoit la page
+   suivante quand la sentinelle [data-lazy-sentinel] devient visible.
+   Sans JavaScript, le lien de la sentinelle reste une pagination classique. */
+(function () {
+    'use strict';
+
+    // Active tooltips et confirmations sur les lignes nouvellement insérées
+    function bindRows(rows) {
+        rows.forEach(function (row) {
+            row.querySelectorAll('[data-bs-toggle="tooltip"]').forEach(function (el) {
+                new bootstrap.Tooltip(el);
+            });
+            row.querySelectorAll('[data-confirm]').forEach(function (el) {
+                el.addEventListener('click', function (e) {
+                    e.preventDefault();
+                    var modalElement = document.getElementById('confirmDeleteModal');
+                    document.getElementById('confirmDeleteModalBody').textContent = el.dataset.confirm;
+                    document.getElementById('confirmDeleteBtn').href = el.href;
+                    bootstrap.Modal.getOrCreateInstance(modalElement).show();
+                });
+            });
+        });
+    }
+
+    function setup(tbody, sentinel) {
+        var loading = false;
+
+        function loadMore() {
+            var cursor = tbody.dataset.nextCursor;
+            if (loading || !cursor) {
+                return;
+            }
+            loading = true;
+
+            var url = tbody.dataset.lazyRows;
+            url += (url.indexOf('?') === -1 ? '?' : '&') + 'cursor=' + encodeURIComponent(cursor);
+
+            fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' }, credentials: 'same-origin' })
+                .then(function (response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(function (data) {
+                    var template = document.createElement('template');
+                    template.innerHTML = data.html.trim();
+                    var rows = Array.prototype.slice.call(template.content.children);
+                    tbody.append.apply(tbody, rows);
+                    bindRows(rows);
+
+                    tbody.dataset.nextCursor = data.next_cursor || '';
+                    if (!data.next_cursor) {
+                        sentinel.remove();
+                    }
+                })
+                .catch(function () {
+                    // En cas d'erreur, le lien de la sentinelle reste utilisable
+                })
+                .finally(function () {
+                    loading = false;
+                });
+        }
+
+        sentinel.querySelector('[data-lazy-more]').addEventListener('click', function (e) {
+            e.preventDefault();
+            loadMore();
+        });
+
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(function (entries) {
+                if (entries.some(function (entry) { return entry.isIntersecting; })) {
+                    loadMore();
+                }
+            }, { rootMargin: '400px' }).observe(sentinel);
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('tbody[data-lazy-rows]').forEach(function (tbody) {
+            var sentinel = tbody.closest('.card').querySelector('[data-lazy-sentinel]');
+            if (sentinel) {
+                setup(tbody, sentinel);
+            }
+        });
+    });
+})();
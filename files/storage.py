@@ -0,0 +1,344 @@
+"""
+Stockage à deux niveaux : un cache local sur disque devant un stockage
+distant (Cloudinary en production).
+
+- Écriture : le fichier est envoyé au stockage distant, puis copié dans le
+  cache (write-through), la lecture suivante ne repasse pas par le réseau.
+- Lecture : servie par le cache ; en cas d'absence, le fichier est
+  téléchargé une fois depuis le stockage distant puis gardé (read-through).
+- Le cache a une taille maximale ; au-delà, les fichiers lus le moins
+  récemment sont supprimés (LRU).
+
+Les fichiers stockés ne changent jamais sous un même nom (blobs et aperçus
+sont nommés d'après leur empreinte, voir models.py) : une entrée du cache
+n'est jamais périmée, seule la suppression doit la retirer.
+
+Réglages (settings.FILES_TIERED_STORAGE) : REMOTE (chemin de la classe du
+stockage distant), REMOTE_OPTIONS, CACHE_DIR et CACHE_MAX_SIZE (octets).
+SimulatedRemoteStorage remplace le stockage distant hors ligne
+(développement, tests).
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils._os import safe_join
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_SIZE = 1024 ** 3  # 1 Gio
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def tiered_settings():
+    return getattr(settings, 'FILES_TIERED_STORAGE', {})
+
+
+class LocalCache:
+    """
+    Copie locale de fichiers du stockage distant, limitée à `max_size`
+    octets. L'ordre d'utilisation est gardé en mémoire et reporté sur la
+    date de modification des fichiers, pour être retrouvé au redémarrage.
+
+    Plusieurs processus peuvent partager le dossier : chacun voit les
+    fichiers des autres au premier accès, la taille totale n'est alors
+    qu'approchée.
+    """
+
+    def __init__(self, location, max_size):
+        self.location = location
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = None  # nom -> taille, du moins au plus récemment utilisé
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, name):
+        return safe_join(self.location, name)
+
+    def load(self):
+        # Inventaire du dossier au premier accès, du plus ancien au plus récent
+        found = []
+        for root, _dirs, filenames in os.walk(self.location):
+            for filename in filenames:
+                if filename.startswith('.tmp'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, os.path.relpath(path, self.location), stat.st_size))
+        found.sort()
+        self.entries = OrderedDict((name.replace(os.sep, '/'), size) for _mtime, name, size in found)
+        self.size = sum(self.entries.values())
+
+    def ensure_loaded(self):
+        if self.entries is None:
+            self.load()
+
+    def get(self, name):
+        """
+        Chemin local de `name` s'il est en cache, sinon None.
+        """
+        path = self.path(name)
+        with self.lock:
+            self.ensure_loaded()
+            if name not in self.entries:
+                # Fichier éventuellement ajouté par un autre processus
+                if not os.path.exists(path):
+                    self.misses += 1
+                    return None
+                self.entries[name] = os.path.getsize(path)
+                self.size += self.entries[name]
+            self.entries.move_to_end(name)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Supprimé entre-temps par un autre processus
+            self.discard(name)
+            return None
+        return path
+
+    def put(self, name, content):
+        """
+        Copie `content` (fichier ouvert) dans le cache sous `name`.
+        Retourne le chemin local, ou None si le fichier est trop gros.
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture dans un fichier temporaire puis renommage : un lecteur ne
+        # voit jamais un fichier partiel
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(path))
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in iter(lambda: content.read(COPY_CHUNK_SIZE), b''):
+                    tmp.write(chunk)
+                    size += len(chunk)
+            if size > self.max_size:
+                os.remove(tmp_path)
+                return None
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self.lock:
+            self.ensure_loaded()
+            self.size += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+            self.evict()
+        return path
+
+    def evict(self):
+        # Appelé avec le verrou : retire les entrées les moins récemment utilisées
+        while self.size > self.max_size and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, name):
+        with self.lock:
+            if self.entries is not None and name in self.entries:
+                self.size -= self.entries.pop(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            shutil.rmtree(self.location, ignore_errors=True)
+            self.entries = OrderedDict()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            self.ensure_loaded()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size,
+            }
+
+
+# Un cache par dossier : toutes les instances du stockage (une par champ
+# FileField) partagent le même inventaire et les mêmes compteurs
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(location, max_size):
+    with _caches_lock:
+        cache = _caches.get(location)
+        if cache is None:
+            cache = _caches[location] = LocalCache(location, max_size)
+        return cache
+
+
+@deconstructible
+class TieredStorage(Storage):
+    """
+    Stockage distant avec cache local en lecture et en écriture.
+    """
+    # Les téléchargements lisent le fichier via le cache au lieu de
+    # rediriger vers l'URL distante (voir downloads.is_local)
+    serves_locally = True
+
+    def __init__(self, remote=None, remote_options=None, cache_dir=None, cache_max_size=None):
+        options = tiered_settings()
+        remote = remote or options.get('REMOTE', 'files.storage.SimulatedRemoteStorage')
+        remote_options = remote_options if remote_options is not None else options.get('REMOTE_OPTIONS', {})
+        self.remote = import_string(remote)(**remote_options) if isinstance(remote, str) else remote
+        self.cache = get_cache(
+            cache_dir or options.get('CACHE_DIR') or os.path.join(settings.BASE_DIR, 'storage_cache'),
+            cache_max_size or options.get('CACHE_MAX_SIZE', DEFAULT_CACHE_MAX_SIZE),
+        )
+
+    def _open(self, name, mode='rb'):
+        path = self.cache.get(name)
+        if path is None:
+            with self.remote.open(name, 'rb') as remote_file:
+                path = self.cache.put(name, remote_file)
+            if path is None:
+                # Trop gros pour le cache : lecture directe
+                return self.remote.open(name, mode)
+        return File(open(path, mode), name=name)
+
+    def _save(self, name, content):
+        name = self.remote.save(name, content)
+        try:
+            self.cache.put(name, content)
+        except OSError:
+            # Le fichier est bien enregistré : seul le cache est en défaut
+            logger.exception("Impossible de copier %s dans le cache local", name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return self.remote.get_available_name(name, max_length=max_length)
+
+    def generate_filename(self, filename):
+        return self.remote.generate_filename(filename)
+
+    def delete(self, name):
+        self.cache.discard(name)
+        self.remote.delete(name)
+
+    def delete_many(self, names):
+        for name in names:
+            self.cache.discard(name)
+        if hasattr(self.remote, 'delete_many'):
+            self.remote.delete_many(names)
+            return
+        for name in names:
+            try:
+                self.remote.delete(name)
+            except Exception:
+                logger.exception("Impossible de supprimer le fichier %s", name)
+
+    def exists(self, name):
+        return os.path.exists(self.cache.path(name)) or self.remote.exists(name)
+
+    def size(self, name):
+        try:
+            return os.path.getsize(self.cache.path(name))
+        except FileNotFoundError:
+            return self.remote.size(name)
+
+    def url(self, name, **kwargs):
+        return self.remote.url(name, **kwargs)
+
+    def listdir(self, path):
+        return self.remote.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.remote.get_modified_time(name)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+@deconstructible
+class SimulatedRemoteStorage(Storage):
+    """
+    Stand-in local d'un stockage distant : des fichiers sur disque, sans
+    chemin local exposé et avec une latence ajoutée à chaque appel.
+    """
+
+    def __init__(self, location=None, base_url=None, latency=None):
+        options = tiered_settings()
+        self.disk = FileSystemStorage(
+            location=location or options.get('SIMULATED_REMOTE_DIR') or os.path.join(settings.BASE_DIR, 'remote_media'),
+            base_url=base_url or '/remote-media/',
+        )
+        self.latency = latency if latency is not None else options.get('SIMULATED_LATENCY', 0.05)
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _open(self, name, mode='rb'):
+        self.wait()
+        return self.disk.open(name, mode)
+
+    def _save(self, name, content):
+        self.wait()
+        return self.disk.save(name, content)
+
+    def delete(self, name):
+        self.wait()
+        self.disk.delete(name)
+
+    def exists(self, name):
+        self.wait()
+        return self.disk.exists(name)
+
+    def size(self, name):
+        self.wait()
+        return self.disk.size(name)
+
+    def url(self, name):
+        return self.disk.url(name)
+
+    def listdir(self, path):
+        self.wait()
+        return self.disk.listdir(path)
+
+    def get_modified_time(self, name):
+        self.wait()
+        return self.disk.get_modified_time(name)
+
+
+def default_storage_stats():
+    """
+    Statistiques du cache local si le stockage par défaut en a un.
+    """
+    from django.core.files.storage import default_storage
+    stats = getattr(default_storage, 'stats', None)
+    return stats() if stats else None
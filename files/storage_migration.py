@@ -0,0 +1,234 @@
+"""
+Migration des fichiers d'un stockage vers un autre (commande migrate_storage).
+
+Les champs FileField ne retiennent que le nom des fichiers : changer
+DEFAULT_FILE_STORAGE (disque local vers Cloudinary, ou l'inverse) laisse
+les documents existants pointer vers des noms absents du nouveau stockage.
+La migration copie chaque fichier référencé en base (contenus, aperçus,
+anciennes versions) de la source vers la destination :
+
+- par un nombre borné de threads, lot par lot ;
+- chaque copie est relue depuis la destination et son empreinte comparée à
+  l'empreinte connue (ou à celle de l'original) avant d'être retenue ;
+- les références (noms renommés par la destination, Document.url) sont
+  mises à jour par lot, en une transaction ;
+- les lots validés sont notés dans un fichier de reprise : une migration
+  interrompue repart du premier lot non terminé.
+
+Les fichiers de la source ne sont jamais supprimés.
+"""
+import json
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import caching
+from .models import Blob, Document, DocumentVersion
+from .utils import file_checksum
+
+# Dossiers du stockage où l'application range ses fichiers (voir models.py)
+STORED_PREFIXES = ('blobs', 'documents', 'previews')
+
+
+class MigrationError(Exception):
+    """
+    Copie différente de l'original, ou fichier de reprise d'une autre migration.
+    """
+
+
+def load_storage(path, options=None):
+    return import_string(path)(**(options or {}))
+
+
+def storage_checksum(storage, name):
+    with storage.open(name, 'rb') as f:
+        return file_checksum(f)
+
+
+def referenced_files():
+    """
+    Fichiers référencés en base : {nom: empreinte SHA-256, ou None si
+    inconnue (aperçus)}.
+    """
+    files = {}
+
+    def add(name, checksum=None):
+        if name and not files.get(name):
+            files[name] = checksum or None
+
+    for name, checksum, thumbnail, preview in Blob.objects.values_list(
+        'file', 'checksum', 'thumbnail', 'preview',
+    ).iterator():
+        add(name, checksum)
+        add(thumbnail)
+        add(preview)
+    # Documents et versions antérieurs aux blobs : fichier propre
+    for model in (Document, DocumentVersion):
+        for name, checksum in model.objects.exclude(file='').values_list('file', 'checksum').iterator():
+            add(name, checksum)
+    return files
+
+
+def copy_file(source, destination, name, checksum=None):
+    """
+    Copie `name` de `source` vers `destination` et retourne (nom obtenu,
+    copié ou non). Un fichier déjà présent sous ce nom avec le même contenu
+    (migration reprise) n'est pas recopié ; un fichier différent est gardé
+    et la copie prend le nom libre proposé par la destination.
+    Lève MigrationError si la copie diffère de l'original.
+    """
+    expected = checksum or storage_checksum(source, name)
+    if destination.exists(name) and storage_checksum(destination, name) == expected:
+        return name, False
+    with source.open(name, 'rb') as content:
+        new_name = destination.save(name, content)
+    if storage_checksum(destination, new_name) != expected:
+        destination.delete(new_name)
+        raise MigrationError(f"{name} : la copie diffère de l'original")
+    return new_name, True
+
+
+def update_references(names, renamed, destination):
+    """
+    Reporte en base les fichiers copiés `names` : nouveaux noms
+    ({ancien: nouveau}) et URL des documents, données par la destination.
+    """
+    with transaction.atomic():
+        documents = list(Document.objects.filter(file__in=names).only('id', 'owner_id', 'file', 'url'))
+        for document in documents:
+            document.file = renamed.get(document.file.name, document.file.name)
+            document.url = destination.url(document.file.name)
+        Document.objects.bulk_update(documents, ['file', 'url'])
+
+        if renamed:
+            versions = list(DocumentVersion.objects.filter(file__in=renamed).only('id', 'file'))
+            for version in versions:
+                version.file = renamed[version.file.name]
+            DocumentVersion.objects.bulk_update(versions, ['file'])
+            for field in ('file', 'thumbnail', 'preview'):
+                blobs = list(Blob.objects.filter(**{f'{field}__in': renamed}).only('id', field))
+                for blob in blobs:
+                    setattr(blob, field, renamed[getattr(blob, field).name])
+                Blob.objects.bulk_update(blobs, [field])
+
+        # Les tableaux de bord en cache portent les anciennes URL
+        for owner_id in {document.owner_id for document in documents}:
+            caching.invalidate(owner_id)
+
+
+def list_files(storage, path=''):
+    """
+    Noms de tous les fichiers de `storage` sous `path`, récursivement.
+    """
+    try:
+        directories, filenames = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        yield posixpath.join(path, filename)
+    for directory in directories:
+        yield from list_files(storage, posixpath.join(path, directory))
+
+
+def scan(storage, files, verify=False, workers=4):
+    """
+    Contrôle d'intégrité de `storage`, sans rien modifier : fichiers
+    référencés (`files`, voir referenced_files) absents ou, avec `verify`,
+    dont l'empreinte a changé ; fichiers présents que plus rien ne
+    référence (None si le stockage ne sait pas lister ses fichiers).
+    """
+    def check(item):
+        name, checksum = item
+        if not storage.exists(name):
+            return name, 'missing'
+        if verify and checksum and storage_checksum(storage, name) != checksum:
+            return name, 'corrupt'
+        return name, None
+
+    report = {'missing': [], 'corrupt': [], 'orphaned': None}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, problem in executor.map(check, sorted(files.items())):
+            if problem:
+                report[problem].append(name)
+    try:
+        present = {name for prefix in STORED_PREFIXES for name in list_files(storage, prefix)}
+    except NotImplementedError:
+        return report
+    report['orphaned'] = sorted(present - set(files))
+    return report
+
+
+class Checkpoint:
+    """
+    Fichier de reprise : une première ligne qui identifie la migration
+    (source et destination), puis une ligne JSON par fichier migré, ajoutée
+    une fois son lot validé en base.
+    """
+
+    def __init__(self, path, label):
+        self.path = path
+        self.done = set()
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(json.dumps(label) + '\n')
+            return
+        with open(path) as f:
+            if json.loads(f.readline() or 'null') != label:
+                raise MigrationError(f"{path} correspond à une autre migration (source ou destination différente).")
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Dernière ligne tronquée par l'interruption
+                    break
+                self.done.update((entry['name'], entry['new']))
+
+    def record(self, renamed_pairs):
+        with open(self.path, 'a') as f:
+            for name, new_name in renamed_pairs:
+                f.write(json.dumps({'name': name, 'new': new_name}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for pair in renamed_pairs:
+            self.done.update(pair)
+
+
+def migrate(source, destination, files, checkpoint, workers=4, batch_size=100, progress=None):
+    """
+    Copie les fichiers `files` absents du fichier de reprise et met à jour
+    les références, lot par lot. `progress(copiés, déjà présents, erreurs)`
+    est appelé après chaque lot. Retourne les erreurs [(nom, message)].
+    """
+    pending = [name for name in sorted(files) if name not in checkpoint.done]
+    errors = []
+
+    def copy(name):
+        try:
+            return name, copy_file(source, destination, name, files[name]), None
+        except Exception as e:
+            return name, None, str(e) or e.__class__.__name__
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), batch_size):
+            migrated, copied, present = [], 0, 0
+            for name, result, error in executor.map(copy, pending[start:start + batch_size]):
+                if error:
+                    errors.append((name, error))
+                    continue
+                new_name, was_copied = result
+                migrated.append((name, new_name))
+                copied += was_copied
+                present += not was_copied
+            if migrated:
+                update_references(
+                    [name for name, _new_name in migrated],
+                    {name: new_name for name, new_name in migrated if new_name != name},
+                    destination,
+                )
+                checkpoint.record(migrated)
+            if progress:
+                progress(copied, present, len(pending[start:start + batch_size]) - len(migrated))
+    return errors
@@ -0,0 +1,134 @@
+"""
+Exécution des traitements en arrière-plan (hors du cycle requête/réponse).
+
+Les fonctions décorées par @task sont lancées via enqueue(), après le
+commit de la transaction en cours. Le mode d'exécution est choisi par le
+réglage FILES_TASK_BACKEND :
+
+- 'thread'   : pool de threads du processus web (développement) ;
+- 'database' : file persistée en base, exécutée par manage.py run_workers
+               (production, voir files/jobs.py) ;
+- 'eager'    : exécution immédiate au commit (tests).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Tâches connues, indexées par leur nom complet (module.fonction)
+registry = {}
+
+_executor = None
+
+# Tentative en cours, par thread (voir attempt)
+_attempt = threading.local()
+
+
+def task(func):
+    """
+    Déclare `func` comme tâche exécutable en arrière-plan.
+    """
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    registry[func.task_name] = func
+    return func
+
+
+def enqueue(func, *args):
+    """
+    Programme l'exécution de la tâche `func(*args)` après le commit.
+    """
+    backend = getattr(settings, 'FILES_TASK_BACKEND', 'thread')
+    if backend == 'eager':
+        transaction.on_commit(lambda: run(func.task_name, *args))
+    elif backend == 'database':
+        # Insérée dans la transaction en cours : annulée avec elle
+        from . import jobs
+        jobs.submit(func.task_name, args)
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_thread, func.task_name, *args))
+
+
+def enqueue_local(func, *args):
+    """
+    Comme enqueue, mais toujours exécutée par le processus courant (pool de
+    threads), quel que soit le backend : tâches qui lisent un fichier du
+    disque local, que les workers 'database' ne voient pas forcément.
+    """
+    if getattr(settings, 'FILES_TASK_BACKEND', 'thread') == 'eager':
+        transaction.on_commit(lambda: run(func.task_name, *args))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_thread, func.task_name, *args))
+
+
+@contextmanager
+def attempt(final):
+    """
+    Exécution d'une tentative d'une tâche ; `final` : un échec ne sera
+    plus retenté (voir jobs.execute).
+    """
+    previous = getattr(_attempt, 'final', None)
+    _attempt.final = final
+    try:
+        yield
+    finally:
+        _attempt.final = previous
+
+
+def is_final_attempt():
+    """
+    Vrai si un échec de la tâche en cours est définitif : dernière tentative
+    d'un Job, ou backends 'thread' et 'eager', qui ne retentent jamais.
+    """
+    final = getattr(_attempt, 'final', None)
+    return True if final is None else final
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'FILES_TASK_THREADS', 2)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='files-task')
+    return _executor
+
+
+def get_task(name):
+    """
+    Tâche enregistrée sous `name`, en important son module si besoin
+    (processus worker qui n'a pas encore chargé ce module).
+    """
+    if name not in registry:
+        import_module(name.rsplit('.', 1)[0])
+    return registry[name]
+
+
+def run(name, *args):
+    """
+    Exécute la tâche `name`. Les erreurs sont journalisées, jamais propagées
+    au code appelant.
+    """
+    try:
+        return get_task(name)(*args)
+    except Exception:
+        logger.exception("Échec de la tâche %s%r", name, args)
+
+
+def _run_in_thread(name, *args):
+    # Chaque thread du pool a sa propre connexion : on la recycle comme
+    # le ferait une requête
+    close_old_connections()
+    try:
+        return run(name, *args)
+    finally:
+        close_old_connections()
+
+
+def worker_init():
+    # Processus d'un pool de workers (spawn) : Django est initialisé dans chacun
+    import django
+    django.setup()
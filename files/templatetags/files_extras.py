@@ -0,0 +1,46 @@
+"""
+Filtres de gabarit de l'application files.
+"""
+from django import template
+
+register = template.Library()
+
+# Icône Font Awesome par famille de types de contenu, dans l'ordre de test
+ICONS = [
+    ('application/pdf', 'fa-file-pdf text-danger'),
+    ('image/', 'fa-file-image text-info'),
+    ('video/', 'fa-file-video text-secondary'),
+    ('audio/', 'fa-file-audio text-secondary'),
+    ('application/msword', 'fa-file-word text-primary'),
+    ('application/vnd.openxmlformats-officedocument.wordprocessingml', 'fa-file-word text-primary'),
+    ('application/vnd.oasis.opendocument.text', 'fa-file-word text-primary'),
+    ('application/vnd.ms-excel', 'fa-file-excel text-success'),
+    ('application/vnd.openxmlformats-officedocument.spreadsheetml', 'fa-file-excel text-success'),
+    ('application/vnd.oasis.opendocument.spreadsheet', 'fa-file-excel text-success'),
+    ('text/csv', 'fa-file-csv text-success'),
+    ('application/vnd.ms-powerpoint', 'fa-file-powerpoint text-warning'),
+    ('application/vnd.openxmlformats-officedocument.presentationml', 'fa-file-powerpoint text-warning'),
+    ('application/zip', 'fa-file-archive text-muted'),
+    ('application/x-7z-compressed', 'fa-file-archive text-muted'),
+    ('application/gzip', 'fa-file-archive text-muted'),
+    ('text/', 'fa-file-alt text-primary'),
+]
+
+DEFAULT_ICON = 'fa-file text-muted'
+
+
+@register.filter
+def document_icon(content_type):
+    """
+    Classes de l'icône correspondant au type de contenu d'un document.
+    """
+    for prefix, icon in ICONS:
+        if (content_type or '').startswith(prefix):
+            return icon
+    return DEFAULT_ICON
+
+
+@register.filter
+def has_thumbnail(document):
+    blob = document.blob if document.blob_id else None
+    return blob is not None and blob.preview_status == blob.PREVIEW_READY
@@ -1,3 +1,1600 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.fields.files import FieldFile
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, benchmarks, bulk, instrumentation, previews, search, tasks, tree, uploads, usage, versions
+from .storage import SimulatedRemoteStorage, TieredStorage
+from .blobs import collect_garbage_task
+from .downloads import document_response
+from .utils import file_checksum
+from .models import Blob, Document, DocumentVersion, Folder, FolderChange, Job, StorageUsage, UploadSession
+
+# Les fichiers téléversés pendant les tests sont écrits dans un dossier temporaire
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    FILES_UPLOAD_STAGING_DIR=os.path.join(TEST_MEDIA_ROOT, 'staging'),
+    FILES_TASK_BACKEND='eager',
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    # Les invalidations passent par on_commit, jamais exécuté dans un TestCase :
+    # pas de cache par défaut (voir DashboardCacheTests)
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+)
+class FilesTestCase(TestCase):
+    """
+    Base commune : un utilisateur connecté et des helpers de création.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='motdepasse-solide')
+        self.client.force_login(self.user)
+
+    def make_folder(self, name='Dossier', parent=None, owner=None):
+        return Folder.objects.create(name=name, parent=parent, owner=owner or self.user)
+
+    def make_document(self, title='Document', folder=None, owner=None, content=b'contenu'):
+        return Document.objects.create(
+            title=title,
+            file=ContentFile(content, name=f'{title}.txt'),
+            folder=folder,
+            owner=owner or self.user,
+        )
+
+
+class FolderListingQueryTests(FilesTestCase):
+    """
+    Les listages doivent coûter un nombre constant de requêtes.
+    """
+
+    def populate(self, folder_count, documents_per_folder=7, parent=None):
+        for i in range(folder_count):
+            folder = self.make_folder(f'Dossier {i}', parent=parent)
+            for j in range(documents_per_folder):
+                self.make_document(f'doc-{i}-{j}', folder=folder)
+
+    def count_queries(self, url):
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_home_query_count_is_constant(self):
+        self.populate(2)
+        baseline = self.count_queries(reverse('home'))
+        self.populate(20)
+        self.assertEqual(self.count_queries(reverse('home')), baseline)
+
+    def test_view_folder_query_count_is_constant(self):
+        parent = self.make_folder('Parent')
+        self.populate(2, parent=parent)
+        baseline = self.count_queries(reverse('view_folder', args=[parent.id]))
+        self.populate(20, parent=parent)
+        self.assertEqual(self.count_queries(reverse('view_folder', args=[parent.id])), baseline)
+
+    def test_home_shows_preview_and_remaining_count(self):
+        self.populate(1, documents_per_folder=7)
+        response = self.client.get(reverse('home'))
+        folder = response.context['folders'][0]
+        self.assertEqual(folder.document_count, 7)
+        self.assertEqual(len(folder.preview_documents), 5)
+        self.assertContains(response, '+ 2 autres documents')
+
+
+class DocumentMetadataTests(FilesTestCase):
+    """
+    Taille, type, empreinte et URL sont relevés au téléversement.
+    """
+
+    def test_upload_records_metadata(self):
+        content = b'%PDF-1.4 contenu de test'
+        # Le document est créé par la tâche de finalisation, après la réponse
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload_document'), {
+                'title': 'Rapport',
+                'file': SimpleUploadedFile('rapport final.pdf', content, content_type='application/pdf'),
+            })
+        doc = Document.objects.get(title='Rapport')
+        self.assertEqual(doc.size, len(content))
+        self.assertEqual(doc.content_type, 'application/pdf')
+        self.assertEqual(doc.checksum, hashlib.sha256(content).hexdigest())
+        self.assertEqual(doc.url, doc.file.url)
+
+    def test_listings_do_not_touch_storage(self):
+        folder = self.make_folder()
+        self.make_document('racine')
+        self.make_document('rangé', folder=folder)
+        # Toute lecture de doc.file.size / doc.file.url pendant le rendu échoue
+        untouchable = mock.PropertyMock(side_effect=AssertionError('accès au stockage'))
+        with mock.patch.object(FieldFile, 'size', untouchable), mock.patch.object(FieldFile, 'url', untouchable):
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('view_folder', args=[folder.id])).status_code, 200)
+
+    def test_backfill_command(self):
+        doc = self.make_document('ancien', content=b'abc')
+        Document.objects.filter(pk=doc.pk).update(size=0, content_type='', checksum='', url='')
+        call_command('backfill_file_metadata', stdout=mock.MagicMock())
+        doc.refresh_from_db()
+        self.assertEqual(doc.size, 3)
+        self.assertEqual(doc.content_type, 'text/plain')
+        self.assertEqual(doc.checksum, hashlib.sha256(b'abc').hexdigest())
+        self.assertTrue(doc.url)
+
+
+@mock.patch('files.pagination.PAGE_SIZE', 3)
+class KeysetPaginationTests(FilesTestCase):
+    """
+    Les listes de documents sont paginées par curseur sur (uploaded_at, id).
+    """
+
+    def test_rows_endpoint_walks_all_pages(self):
+        folder = self.make_folder()
+        created = [self.make_document(f'doc-{i}', folder=folder) for i in range(8)]
+
+        response = self.client.get(reverse('view_folder', args=[folder.id]))
+        self.assertEqual(response.context['documents_count'], 8)
+        seen = [doc.id for doc in response.context['documents']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            data = self.client.get(reverse('document_rows'), {'folder': folder.id, 'cursor': cursor}).json()
+            seen += [int(pk) for pk in re.findall(r'/rename-document/(\d+)/', data['html'])]
+            cursor = data['next_cursor']
+
+        self.assertEqual(seen, [doc.id for doc in reversed(created)])
+
+    def test_deep_pages_cost_the_same(self):
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+
+        for i in range(12):
+            self.make_document(f'doc-{i}')
+        cursor, costs = None, []
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(reverse('document_rows'), {'cursor': cursor or ''}).json()
+            costs.append(len(ctx.captured_queries))
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(set(costs)), 1)
+
+    def test_invalid_cursor_and_foreign_folder(self):
+        other = User.objects.create_user('bob')
+        foreign = self.make_folder(owner=other)
+        self.assertEqual(self.client.get(reverse('home'), {'cursor': '!!'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('document_rows'), {'folder': foreign.id}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('document_rows'), {'folder': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('create_folder'), {'parent': 'abc'}).status_code, 404)
+
+
+class ChunkedUploadTests(FilesTestCase):
+    """
+    Téléversement par morceaux : envoi, reprise et finalisation différée.
+    """
+
+    def put_chunk(self, session_id, offset, data):
+        return self.client.put(
+            reverse('upload_session_detail', args=[session_id]), data,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def test_resumable_upload(self):
+        folder = self.make_folder()
+        content = b'0123456789' * 100
+        created = self.client.post(reverse('upload_session_create'), {
+            'title': 'Gros fichier', 'filename': 'gros fichier.bin', 'size': len(content), 'folder': folder.id,
+        })
+        self.assertEqual(created.status_code, 201)
+        session_id = created.json()['id']
+
+        self.assertEqual(self.put_chunk(session_id, 0, content[:400]).json()['offset'], 400)
+        # Un morceau envoyé à la mauvaise position est refusé avec la position courante
+        conflict = self.put_chunk(session_id, 0, content[:400])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.json()['offset'], 400)
+        # Reprise après une coupure : le client relit la position atteinte
+        offset = self.client.get(reverse('upload_session_detail', args=[session_id])).json()['offset']
+        self.put_chunk(session_id, offset, content[offset:])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_session_complete', args=[session_id]))
+        self.assertEqual(response.status_code, 202)
+
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(session.status, UploadSession.COMPLETE)
+        self.assertFalse(os.path.exists(session.part_path))
+        document = session.document
+        self.assertEqual((document.title, document.folder, document.size), ('Gros fichier', folder, len(content)))
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_incomplete_session_cannot_complete(self):
+        session_id = self.client.post(reverse('upload_session_create'), {
+            'title': 'Partiel', 'filename': 'partiel.txt', 'size': 10,
+        }).json()['id']
+        self.put_chunk(session_id, 0, b'01234')
+        response = self.client.post(reverse('upload_session_complete', args=[session_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Document.objects.exists())
+
+    def test_sessions_are_private(self):
+        session_id = self.client.post(reverse('upload_session_create'), {
+            'title': 'Privé', 'filename': 'prive.txt', 'size': 3,
+        }).json()['id']
+        self.client.force_login(User.objects.create_user('bob'))
+        self.assertEqual(self.put_chunk(session_id, 0, b'abc').status_code, 404)
+
+    def test_stuck_sessions_are_purged(self):
+        session_ids = []
+        for title in ('bloqué', 'récent'):
+            session_id = self.client.post(reverse('upload_session_create'), {
+                'title': title, 'filename': 'a.txt', 'size': 3,
+            }).json()['id']
+            self.put_chunk(session_id, 0, b'abc')
+            # Finalisation programmée après validation, donc jamais lancée ici
+            self.client.post(reverse('upload_session_complete', args=[session_id]))
+            session_ids.append(session_id)
+        UploadSession.objects.filter(pk=session_ids[0]).update(updated_at=timezone.now() - timedelta(days=2))
+        stuck = UploadSession.objects.get(pk=session_ids[0])
+        self.assertEqual(stuck.status, UploadSession.PROCESSING)
+
+        call_command('cleanup_upload_sessions', stdout=io.StringIO())
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)], [session_ids[1]])
+        self.assertFalse(os.path.exists(stuck.part_path))
+        # La tâche encore en file ne trouve plus la session
+        self.assertIsNone(uploads.finalize_session(stuck.pk))
+        self.assertFalse(Document.objects.exists())
+
+
+class DeduplicationTests(FilesTestCase):
+    """
+    Les contenus identiques sont stockés une seule fois, avec comptage de références.
+    """
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.make_document('premier', content=b'meme contenu')
+        second = self.make_document('second', content=b'meme contenu')
+        self.assertEqual(first.blob, second.blob)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        name = first.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_checksum_computed_while_receiving(self):
+        with mock.patch('files.models.file_checksum', side_effect=AssertionError('relecture')), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('upload_document'), {
+                'title': 'Flux', 'file': SimpleUploadedFile('flux.txt', b'abc'),
+            })
+        self.assertEqual(Document.objects.get().checksum, hashlib.sha256(b'abc').hexdigest())
+
+    def test_cleanup_duplicates_reconciles_legacy_documents(self):
+        checksum = hashlib.sha256(b'ancien').hexdigest()
+        names = [default_storage.save(f'documents/copie-{i}.txt', ContentFile(b'ancien')) for i in range(3)]
+        for i, name in enumerate(names):
+            Document.objects.create(title=f'copie {i}', file=name, owner=self.user, checksum=checksum, size=6)
+
+        call_command('cleanup_duplicates', stdout=mock.MagicMock())
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(set(Document.objects.values_list('file', flat=True)), {blob.file.name})
+        self.assertEqual([default_storage.exists(name) for name in names].count(True), 1)
+
+    def test_cleanup_duplicates_counts_archived_versions(self):
+        document = self.make_document('rapport', content=b'ancien')
+        versions.add_version(document, ContentFile(b'nouveau', name='rapport.txt'))
+        archived = Blob.objects.get(checksum=hashlib.sha256(b'ancien').hexdigest())
+        name = default_storage.save('documents/copie.txt', ContentFile(b'ancien'))
+        Document.objects.create(
+            title='copie', file=name, owner=self.user, checksum=archived.checksum, size=6,
+        )
+
+        call_command('cleanup_duplicates', stdout=mock.MagicMock())
+
+        # Le document adopté et la version archivée retiennent le même contenu
+        archived.refresh_from_db()
+        self.assertEqual(archived.ref_count, 2)
+        DocumentVersion.objects.get().delete()
+        archived.refresh_from_db()
+        self.assertEqual(archived.ref_count, 1)
+
+
+class DocumentVersionTests(FilesTestCase):
+    """
+    Nouvelles versions d'un document : historique, contenu inchangé ignoré,
+    listes indépendantes de l'historique.
+    """
+
+    def test_new_version_archives_previous_content(self):
+        document = self.make_document('rapport', content=b'v1')
+        old_blob = document.blob
+        archived = versions.add_version(document, ContentFile(b'v2', name='rapport.txt'))
+
+        document.refresh_from_db()
+        self.assertEqual((document.version, document.checksum), (2, hashlib.sha256(b'v2').hexdigest()))
+        self.assertEqual((archived.number, archived.blob), (1, old_blob))
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), b'v2')
+        # Le contenu remplacé reste retenu par la version archivée
+        self.assertEqual(Blob.objects.get(pk=old_blob.pk).ref_count, 1)
+
+        response = self.client.get(reverse('download_version', args=[document.id, 1]))
+        self.assertEqual(b''.join(response.streaming_content), b'v1')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rapport (v1).txt"')
+
+        # Contenu identique à la version courante : ignoré
+        self.assertIsNone(versions.add_version(document, ContentFile(b'v2', name='rapport.txt')))
+        self.assertEqual(DocumentVersion.objects.count(), 1)
+
+    def test_upload_view_stages_new_version(self):
+        document = self.make_document('rapport', content=b'v1')
+        url = reverse('document_versions', args=[document.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'file': SimpleUploadedFile('rapport.txt', b'v1')})
+        self.assertRedirects(response, url)
+        self.assertFalse(UploadSession.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'file': SimpleUploadedFile('rapport.txt', b'v2')})
+        document.refresh_from_db()
+        self.assertEqual(document.version, 2)
+        self.assertEqual(Document.objects.count(), 1)
+        # La version archivée reste stockée : elle compte dans l'usage
+        self.assertEqual(StorageUsage.objects.get(user=self.user).used_bytes, 4)
+        self.assertContains(self.client.get(url), 'v1')
+
+    def test_listings_ignore_history(self):
+        folder = self.make_folder()
+        document = self.make_document('rapport', folder=folder, content=b'v1')
+        url = reverse('view_folder', args=[folder.id])
+
+        def queries():
+            executed = []
+
+            def record(execute, sql, params, many, context):
+                executed.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(record):
+                self.client.get(url)
+            return executed
+
+        before = queries()
+        for i in range(2, 6):
+            versions.add_version(document, ContentFile(f'v{i}'.encode(), name='rapport.txt'))
+        after = queries()
+        self.assertEqual(len(after), len(before))
+        self.assertFalse(any('files_documentversion' in sql for sql in after))
+
+    def test_deleting_document_releases_all_versions(self):
+        document = self.make_document('rapport', content=b'v1')
+        versions.add_version(document, ContentFile(b'v2', name='rapport.txt'))
+        names = list(Blob.objects.values_list('file', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+
+class FolderTreeDeletionTests(FilesTestCase):
+    """
+    Suppression d'une arborescence complète, avec nettoyage différé du stockage.
+    """
+
+    def test_delete_folder_removes_whole_subtree_and_blobs(self):
+        from .tree import subtree_ids
+
+        root = self.make_folder('racine')
+        child = self.make_folder('enfant', parent=root)
+        grandchild = self.make_folder('petit-enfant', parent=child)
+        kept = self.make_folder('autre')
+        docs = [
+            self.make_document('a', folder=root, content=b'a'),
+            self.make_document('b', folder=grandchild, content=b'b'),
+            self.make_document('c', folder=grandchild, content=b'partage'),
+        ]
+        shared = self.make_document('d', folder=kept, content=b'partage')
+        self.assertEqual(sorted(subtree_ids(root)), sorted([root.id, child.id, grandchild.id]))
+
+        with mock.patch('files.tasks.enqueue', wraps=tasks.enqueue) as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('delete_folder', args=[root.id]))
+        self.assertEqual(response.status_code, 302)
+        # Un seul ramasse-miettes programmé pour toute l'arborescence
+        garbage_collections = [c for c in enqueue.call_args_list if c.args[0] is collect_garbage_task]
+        self.assertEqual(len(garbage_collections), 1)
+
+        self.assertEqual(list(Folder.objects.all()), [kept])
+        self.assertEqual(list(Document.objects.all()), [shared])
+        self.assertFalse(default_storage.exists(docs[0].file.name))
+        self.assertTrue(default_storage.exists(shared.file.name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_delete_folder_unindexes_documents_in_one_query(self):
+        from . import search
+
+        root = self.make_folder('racine')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                self.make_document(f'Rapport {i}', folder=root)
+        self.assertEqual(len(search.search_documents(self.user, 'rapport')), 3)
+
+        with mock.patch('files.search.remove_documents', wraps=search.remove_documents) as remove:
+            self.client.get(reverse('delete_folder', args=[root.id]))
+        self.assertEqual(len([c for c in remove.call_args_list if len(c.args[0]) > 1]), 1)
+        self.assertEqual(search.search_documents(self.user, 'rapport'), [])
+
+
+class MaterializedPathTests(FilesTestCase):
+    """
+    Chemin matérialisé des dossiers : ancêtres, descendants, déplacements.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.make_folder('A')
+        self.b = self.make_folder('B', parent=self.a)
+        self.c = self.make_folder('C', parent=self.b)
+
+    def test_paths_and_single_query_lookups(self):
+        self.assertEqual(self.c.path, f'{self.a.id}/{self.b.id}/{self.c.id}/')
+        self.assertEqual(self.c.depth, 2)
+        self.make_document('dans C', folder=self.c)
+        self.make_document('dans A', folder=self.a)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.c.ancestors()), [self.a, self.b])
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.a.descendants()), {self.b, self.c})
+        with self.assertNumQueries(1):
+            self.assertEqual(self.a.subtree_document_count(), 2)
+
+    def test_move_rewrites_descendant_paths(self):
+        other = self.make_folder('Autre')
+        response = self.client.post(reverse('move_folder', args=[self.b.id]), {'parent': other.id})
+        self.assertRedirects(response, reverse('view_folder', args=[self.b.id]))
+        self.c.refresh_from_db()
+        self.assertEqual(self.c.path, f'{other.id}/{self.b.id}/{self.c.id}/')
+        self.assertEqual(self.c.depth, 2)
+
+        self.client.post(reverse('move_folder', args=[self.b.id]), {'parent': ''})
+        self.c.refresh_from_db()
+        self.assertEqual((self.c.path, self.c.depth), (f'{self.b.id}/{self.c.id}/', 1))
+
+    def test_move_into_own_subtree_is_refused(self):
+        self.client.post(reverse('move_folder', args=[self.a.id]), {'parent': self.c.id})
+        self.a.refresh_from_db()
+        self.assertIsNone(self.a.parent_id)
+        self.assertEqual(self.a.path, f'{self.a.id}/')
+
+    def test_breadcrumbs_show_every_level(self):
+        response = self.client.get(reverse('view_folder', args=[self.c.id]))
+        self.assertContains(response, reverse('view_folder', args=[self.a.id]))
+        self.assertContains(response, reverse('view_folder', args=[self.b.id]))
+
+
+class FolderTreeTests(FilesTestCase):
+    """
+    Arborescence en JSON : version, requêtes conditionnelles et différences.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.make_folder('A')
+        self.b = self.make_folder('B', parent=self.a)
+        self.c = self.make_folder('C', parent=self.b)
+
+    def get_tree(self, since=None, **headers):
+        params = {'since': since} if since is not None else {}
+        return self.client.get(reverse('folder_tree'), params, **headers)
+
+    def test_full_tree(self):
+        self.make_folder('Ailleurs', owner=User.objects.create_user('bob'))
+        response = self.get_tree()
+        data = response.json()
+        self.assertEqual(data['version'], 3)
+        self.assertEqual(data['folders'], [
+            [self.a.id, None, 'A'], [self.b.id, self.a.id, 'B'], [self.c.id, self.b.id, 'C'],
+        ])
+        self.assertEqual(response['ETag'], '"tree-3"')
+
+    def test_not_modified(self):
+        etag = self.get_tree()['ETag']
+        response = self.get_tree(since=3, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.make_folder('D')
+        self.assertEqual(self.get_tree(since=3, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_since_version(self):
+        self.client.post(reverse('rename_folder', args=[self.c.id]), {'name': 'C2'})
+        d = self.make_folder('D')
+        data = self.get_tree(since=3).json()
+        self.assertEqual(data['version'], 5)
+        self.assertEqual(data['changed'], [[self.c.id, self.b.id, 'C2'], [d.id, None, 'D']])
+        self.assertEqual(data['deleted'], [])
+
+        # Sous-arbre supprimé : une seule version pour tous ses dossiers
+        tree.delete_folder_tree(self.b)
+        data = self.get_tree(since=5).json()
+        self.assertEqual(data['version'], 6)
+        self.assertEqual(data['changed'], [])
+        self.assertEqual(sorted(data['deleted']), sorted([self.b.id, self.c.id]))
+
+        # Version inconnue du serveur : arborescence complète
+        self.assertEqual(self.get_tree(since=99).json()['folders'], [[self.a.id, None, 'A'], [d.id, None, 'D']])
+
+    def test_move_page_reads_no_folders(self):
+        document = self.make_document(folder=self.c)
+        response = self.client.get(reverse('move_document', args=[document.id]))
+        self.assertContains(response, f'data-current="{self.c.id}"')
+        self.assertNotIn('folders', response.context)
+
+    def test_user_deletion(self):
+        self.user.delete()
+        self.assertFalse(FolderChange.objects.exists())
+
+
+class SearchTests(FilesTestCase):
+    """
+    Recherche plein texte indexée (titre, dossier, contenu extrait).
+    """
+
+    def test_search_ranks_title_matches_first(self):
+        folder = self.make_folder('Comptabilité')
+        with self.captureOnCommitCallbacks(execute=True):
+            in_content = self.make_document('Notes', content='Le budget prévisionnel est validé.'.encode())
+            in_title = self.make_document('Budget 2024')
+            in_folder = self.make_document('Bilan', folder=folder)
+            self.make_document('Vacances')
+
+        self.assertEqual(in_content.text.content, 'Le budget prévisionnel est validé.')
+        response = self.client.get(reverse('search'), {'q': 'budg'})
+        self.assertEqual(list(response.context['documents']), [in_title, in_content])
+
+        # Accents ignorés, et le nom du dossier est indexé
+        response = self.client.get(reverse('search'), {'q': 'comptabilite'})
+        self.assertEqual(list(response.context['documents']), [in_folder])
+
+    def test_search_is_private_and_follows_renames(self):
+        bob = User.objects.create_user('bob', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.make_document('Rapport')
+            self.make_document('Rapport', owner=bob)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('rename_document', args=[document.id]), {'title': 'Synthèse'})
+        self.assertEqual(list(self.client.get(reverse('search'), {'q': 'rapport'}).context['documents']), [])
+        self.assertEqual(list(self.client.get(reverse('search'), {'q': 'synthese'}).context['documents']), [document])
+
+        document.delete()
+        self.assertEqual(list(self.client.get(reverse('search'), {'q': 'synthese'}).context['documents']), [])
+
+    def test_owner_filter_is_part_of_the_index(self):
+        from django.db import connection
+
+        from . import search
+
+        bob = User.objects.create_user('bob', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            mine = self.make_document('Facture')
+            self.make_document('Facture', owner=bob)
+            numbered = self.make_document(f'Facture {self.user.pk}', owner=bob)
+
+        # Le filtre sur l'utilisateur est résolu par l'index FTS5, sans relire les lignes des autres
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {search.SEARCH_TABLE} WHERE {search.SEARCH_TABLE} MATCH %s",
+                [search.match_expression(self.user.pk, ['factu'])],
+            )
+            self.assertEqual([row[0] for row in cursor.fetchall()], [mine.pk])
+        # Un mot de la requête ne porte jamais sur la colonne de l'utilisateur
+        self.assertEqual(search.search_documents(bob, str(self.user.pk)), [numbered])
+        self.assertEqual(search.search_documents(self.user, str(self.user.pk)), [])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    FILES_SHARED_CACHE=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class DashboardCacheTests(FilesTestCase):
+    """
+    Tableau de bord en cache, invalidé par les écritures de l'utilisateur.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def home_titles(self):
+        response = self.client.get(reverse('home'))
+        return [doc.title for doc in response.context['documents_without_folder']]
+
+    def test_reloads_hit_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_folder('Projets')
+            self.make_document('a')
+        self.client.get(reverse('home'))
+
+        # Session et utilisateur sont eux aussi en cache : aucune requête
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual([folder.name for folder in response.context['folders']], ['Projets'])
+
+    def test_writes_invalidate_only_their_owner(self):
+        bob = User.objects.create_user('bob')
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.make_document('a')
+        self.assertEqual(self.home_titles(), ['a'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_document('b', owner=bob)
+        with self.assertNumQueries(0):
+            self.home_titles()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('rename_document', args=[document.id]), {'title': 'renommé'})
+        self.assertEqual(self.home_titles(), ['renommé'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_folder'), {'name': 'Nouveau'})
+            document.delete()
+        response = self.client.get(reverse('home'))
+        self.assertEqual(list(response.context['documents_without_folder']), [])
+        self.assertEqual([folder.name for folder in response.context['folders']], ['Nouveau'])
+
+    @override_settings(FILES_SHARED_CACHE=False)
+    def test_local_cache_is_not_used(self):
+        # Mémoire propre au processus : les autres workers ne verraient pas l'invalidation
+        self.make_document('a')
+        self.assertEqual(self.home_titles(), ['a'])
+        self.make_document('b')
+        self.assertEqual(self.home_titles(), ['b', 'a'])
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'docuspace'}},
+        FILES_SHARED_CACHE=False, SESSION_ENGINE='django.contrib.sessions.backends.db', DEBUG=True,
+    )
+    def test_development_server_uses_the_default_cache(self):
+        # Un seul processus : le cache en mémoire locale sert le tableau de bord
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.make_document('a')
+        self.assertEqual(self.home_titles(), ['a'])
+        Document.objects.filter(pk=document.pk).update(title='non invalidé')
+        self.assertEqual(self.home_titles(), ['a'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('rename_document', args=[document.id]), {'title': 'renommé'})
+        self.assertEqual(self.home_titles(), ['renommé'])
+
+
+class DownloadTests(FilesTestCase):
+    """
+    Téléchargement contrôlé : propriétaire uniquement, Range et ETag.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.document = self.make_document('rapport', content=b'0123456789')
+        self.url = reverse('download_document', args=[self.document.id])
+
+    def test_full_download_with_etag(self):
+        response = self.client.get(self.url, {'download': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], f'"{self.document.checksum}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rapport.txt"')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.document.checksum}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        # If-Range périmé : fichier complet
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"autre"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_other_users_cannot_download(self):
+        other = self.make_document('secret', owner=User.objects.create_user('bob'))
+        response = self.client.get(reverse('download_document', args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class FolderArchiveTests(FilesTestCase):
+    """
+    Archive ZIP d'un dossier, produite à la volée.
+    """
+
+    def read_archive(self, response):
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive_contains_subtree(self):
+        root = self.make_folder('Projets')
+        child = self.make_folder('Factures', parent=root)
+        self.make_folder('Vide', parent=child)
+        self.make_document('notes', folder=root, content=b'texte ' * 1000)
+        self.make_document('notes', folder=root, content=b'autre')
+        self.make_document('mars', folder=child, content=b'facture')
+        Document.objects.create(
+            title='photo', file=ContentFile(b'\xff\xd8' * 500, name='photo.jpg'), folder=child, owner=self.user,
+        )
+        self.make_document('ailleurs', folder=self.make_folder('Autre'))
+
+        response = self.client.get(reverse('download_folder', args=[root.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Projets.zip"')
+
+        archive = self.read_archive(response)
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()), [
+            'Projets/', 'Projets/Factures/', 'Projets/Factures/Vide/', 'Projets/Factures/mars.txt',
+            'Projets/Factures/photo.jpg', 'Projets/notes (2).txt', 'Projets/notes.txt',
+        ])
+        self.assertEqual(archive.read('Projets/Factures/mars.txt'), b'facture')
+        # Texte compressé, image déjà compressée stockée telle quelle
+        self.assertEqual(archive.getinfo('Projets/notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('Projets/Factures/photo.jpg').compress_type, zipfile.ZIP_STORED)
+
+    def test_archive_is_streamed_in_chunks(self):
+        root = self.make_folder('Gros')
+        self.make_document('a', folder=root, content=os.urandom(300 * 1024))
+        response = self.client.get(reverse('download_folder', args=[root.id]))
+        chunks = list(response.streaming_content)
+        # Aucun morceau ne contient le fichier entier
+        self.assertGreater(len(chunks), 3)
+        self.assertLess(max(len(chunk) for chunk in chunks), 200 * 1024)
+        self.assertEqual(len(zipfile.ZipFile(io.BytesIO(b''.join(chunks))).read('Gros/a.txt')), 300 * 1024)
+
+    def test_other_users_cannot_download(self):
+        other = self.make_folder('Secret', owner=User.objects.create_user('bob'))
+        response = self.client.get(reverse('download_folder', args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewTests(FilesTestCase):
+    """
+    Vues asynchrones (ASGI) : mêmes réponses que les vues synchrones.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+
+    def request(self, method, path, **kwargs):
+        request = getattr(self.factory, method)(path, **kwargs)
+        request.user = self.user
+        return request
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_download_streams_asynchronously(self):
+        document = await Document.objects.acreate(
+            title='rapport', file=ContentFile(b'0123456789', name='rapport.txt'), owner=self.user,
+        )
+        response = await async_views.download_document(self.request('get', '/'), document.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(await self.read(response), b'0123456789')
+
+        response = await async_views.download_document(self.request('get', '/', headers={'Range': 'bytes=2-5'}), document.id)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(await self.read(response), b'2345')
+
+    async def test_folder_archive_streams_asynchronously(self):
+        folder = await Folder.objects.acreate(name='Dossier', owner=self.user)
+        await Document.objects.acreate(
+            title='a', file=ContentFile(b'contenu', name='a.txt'), folder=folder, owner=self.user,
+        )
+        response = await async_views.download_folder(self.request('get', '/'), folder.id)
+        self.assertTrue(response.is_async)
+        archive = zipfile.ZipFile(io.BytesIO(await self.read(response)))
+        self.assertEqual(archive.read('Dossier/a.txt'), b'contenu')
+
+    async def test_document_rows(self):
+        await Document.objects.acreate(title='a', file=ContentFile(b'a', name='a.txt'), owner=self.user)
+        response = await async_views.document_rows(self.request('get', '/'))
+        data = json.loads(response.content)
+        self.assertIn('a', data['html'])
+        self.assertIsNone(data['next_cursor'])
+
+    async def test_upload_chunk(self):
+        session = await sync_to_async(uploads.start_session)(self.user, 'Gros', 'gros.bin', 6)
+        path = f'/upload/sessions/{session.id}/'
+        put = self.request('put', path, data=b'abc', content_type='application/octet-stream',
+                           headers={'Upload-Offset': '0'})
+        response = await async_views.upload_session_detail(put, session.id)
+        self.assertEqual(json.loads(response.content)['offset'], 3)
+
+        # Mauvaise position : 409 avec la position courante
+        response = await async_views.upload_session_detail(put, session.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['offset'], 3)
+        with open(session.part_path, 'rb') as part:
+            self.assertEqual(part.read(), b'abc')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'user-cache-tests'}},
+    # Un seul processus de test : la mémoire locale tient lieu de cache partagé
+    FILES_SHARED_CACHE=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class UserCacheTests(FilesTestCase):
+    """
+    Sessions en cache et utilisateur connecté gardé en cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.url = reverse('view_folder', args=[self.make_folder().id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def table_queries(self, path):
+        tables = []
+
+        def record(execute, sql, params, many, context):
+            tables.extend(name for name in ('auth_user', 'django_session') if f'"{name}"' in sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(path)
+        return response, tables
+
+    def test_authenticated_requests_skip_user_and_session_tables(self):
+        self.client.get(self.url)
+        response, tables = self.table_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, [])
+
+    def test_password_change_invalidates_cached_user(self):
+        self.client.get(self.url)
+        self.user.set_password('nouveau-mot-de-passe')
+        self.user.save()
+        response, tables = self.table_queries(self.url)
+        self.assertRedirects(response, f"{reverse('login')}?next={self.url}")
+        self.assertIn('auth_user', tables)
+
+    @override_settings(FILES_SHARED_CACHE=False)
+    def test_local_cache_is_not_trusted(self):
+        # Cache propre au processus : l'utilisateur est relu à chaque requête
+        self.client.get(self.url)
+        response, tables = self.table_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('auth_user', tables)
+
+    @override_settings(FILES_SHARED_CACHE=False, DEBUG=True)
+    def test_development_server_caches_the_user(self):
+        # Serveur de développement, un seul processus : la mémoire locale suffit
+        self.client.get(self.url)
+        response, tables = self.table_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, [])
+
+    def test_cached_sessions_require_a_shared_cache(self):
+        from .checks import check_shared_cache
+
+        with self.settings(DEBUG=False, FILES_SHARED_CACHE=False):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['files.W001'])
+            with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+                self.assertEqual(check_shared_cache(None), [])
+        with self.settings(DEBUG=False):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class TieredStorageTests(FilesTestCase):
+    """
+    Cache local devant un stockage distant (simulé) : write-through,
+    read-through et éviction LRU.
+    """
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp(dir=TEST_MEDIA_ROOT)
+        self.remote = SimulatedRemoteStorage(location=os.path.join(root, 'remote'), latency=0)
+        self.storage = TieredStorage(
+            remote=self.remote, cache_dir=os.path.join(root, 'cache'), cache_max_size=25,
+        )
+
+    def read(self, name):
+        with self.storage.open(name) as f:
+            return f.read()
+
+    def test_write_through_and_read_through(self):
+        name = self.storage.save('a.txt', ContentFile(b'0123456789'))
+        self.assertTrue(self.remote.exists(name))
+        self.assertEqual(self.read(name), b'0123456789')
+        self.assertEqual(self.storage.stats()['hits'], 1)
+
+        # Absent du cache : lu une fois depuis le stockage distant, puis gardé
+        self.storage.cache.discard(name)
+        self.assertEqual(self.read(name), b'0123456789')
+        self.assertEqual(self.read(name), b'0123456789')
+        stats = self.storage.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (2, 1, 2 / 3))
+
+        self.storage.delete(name)
+        self.assertFalse(self.remote.exists(name))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_least_recently_used_files_are_evicted(self):
+        a = self.storage.save('a.txt', ContentFile(b'a' * 10))
+        b = self.storage.save('b.txt', ContentFile(b'b' * 10))
+        self.read(a)  # a devient le plus récemment utilisé
+        self.storage.save('c.txt', ContentFile(b'c' * 10))
+
+        stats = self.storage.stats()
+        self.assertEqual((stats['entries'], stats['size'], stats['evictions']), (2, 20, 1))
+        self.assertIsNone(self.storage.cache.get(b))
+        self.assertIsNotNone(self.storage.cache.get(a))
+        # Le fichier évincé reste lisible depuis le stockage distant
+        self.assertEqual(self.read(b), b'b' * 10)
+
+    def test_download_is_served_through_the_cache(self):
+        document = self.make_document('rapport', content=b'0123456789')
+        document.file.storage = self.storage
+        self.storage.save(document.file.name, ContentFile(b'0123456789'))
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=2-5')
+        response = document_response(request, document)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+
+class StorageMigrationTests(FilesTestCase):
+    """
+    Commande migrate_storage : copie vérifiée, reprise et contrôle d'intégrité.
+    """
+
+    STORAGE = 'django.core.files.storage.FileSystemStorage'
+
+    def setUp(self):
+        super().setUp()
+        # Stockage d'origine propre au test : seuls ses fichiers y sont inventoriés
+        self.source_root, self.destination_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for root in (self.source_root, self.destination_root):
+            self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.source_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.checkpoint = os.path.join(self.destination_root, 'reprise.jsonl')
+        self.destination = FileSystemStorage(location=self.destination_root, base_url='/nouveau/')
+
+    def migrate_storage(self, **options):
+        out = io.StringIO()
+        call_command(
+            'migrate_storage', source=self.STORAGE, source_options={'location': self.source_root},
+            destination=self.STORAGE,
+            destination_options={'location': self.destination_root, 'base_url': '/nouveau/'},
+            checkpoint=self.checkpoint, stdout=out, **options,
+        )
+        return out.getvalue()
+
+    def test_copies_and_resumes(self):
+        documents = [self.make_document(f'doc {i}', content=f'contenu {i}'.encode()) for i in range(3)]
+        # Nom déjà pris par un autre contenu à la destination : la copie est renommée
+        taken = documents[0].file.name
+        self.destination.save(taken, ContentFile(b'autre chose'))
+
+        self.migrate_storage(batch_size=2, workers=2)
+        for document in documents:
+            document.refresh_from_db()
+            self.assertTrue(self.destination.exists(document.file.name))
+            self.assertEqual(document.url, self.destination.url(document.file.name))
+            with self.destination.open(document.file.name) as f:
+                self.assertEqual(file_checksum(f), document.checksum)
+        self.assertNotEqual(documents[0].file.name, taken)
+        self.assertEqual(Blob.objects.get(pk=documents[0].blob_id).file.name, documents[0].file.name)
+
+        # Relancée, la migration ne refait rien
+        with mock.patch('files.storage_migration.copy_file') as copy_file:
+            self.migrate_storage()
+        copy_file.assert_not_called()
+
+    def test_mismatched_copy_is_rejected(self):
+        document = self.make_document()
+        with mock.patch('files.storage_migration.file_checksum', return_value='altérée'):
+            with self.assertRaises(CommandError):
+                self.migrate_storage()
+        self.assertFalse(self.destination.exists(document.file.name))
+        document.refresh_from_db()
+        self.assertNotEqual(document.url, self.destination.url(document.file.name))
+
+    def test_dry_run_reports_missing_and_orphans(self):
+        missing = self.make_document('absent')
+        default_storage.delete(missing.file.name)
+        kept = self.make_document('gardé', content=b'autre contenu')
+        default_storage.save('blobs/zz/orphelin.txt', ContentFile(b'orphelin'))
+
+        output = self.migrate_storage(dry_run=True, verify=True)
+        self.assertIn(f'  - {missing.file.name}', output)
+        self.assertNotIn(f'  - {kept.file.name}', output)
+        self.assertIn('  - blobs/zz/orphelin.txt', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+@override_settings(FILES_SERVER_TIMING=True, FILES_METRICS_TOKEN='jeton-secret')
+class InstrumentationTests(FilesTestCase):
+    """
+    Mesures par requête : Server-Timing, /metrics et requêtes lentes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.registry.clear()
+
+    def test_server_timing_and_totals(self):
+        document = self.make_document('rapport')
+        response = self.client.get(reverse('home'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ SQL"')
+        self.assertIn('tpl;dur=', timing)
+
+        response = self.client.get(reverse('download_document', args=[document.id]))
+        response.close()
+        self.assertNotIn('desc="0 appels"', response['Server-Timing'])
+
+        views = instrumentation.registry.snapshot()
+        self.assertEqual(views['home']['requests'], 1)
+        self.assertGreater(views['home']['db_queries'], 0)
+        self.assertGreater(views['home']['template_seconds'], 0)
+        self.assertGreater(views['download_document']['storage_calls'], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer jeton-secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('files_request_duration_seconds_count{view="home"} 1', body)
+        self.assertIn('# TYPE files_db_queries_total counter', body)
+
+    @override_settings(FILES_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('files.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('home'))
+        self.assertIn('Requête lente GET / (home)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class StorageUsageTests(FilesTestCase):
+    """
+    Compteurs d'espace utilisé et quotas.
+    """
+
+    def usage(self):
+        return StorageUsage.objects.get(user=self.user)
+
+    def assertUsage(self, used_bytes, document_count):
+        usage = self.usage()
+        self.assertEqual((usage.used_bytes, usage.document_count), (used_bytes, document_count))
+
+    def test_counters_follow_writes(self):
+        source, target = self.make_folder('Source'), self.make_folder('Cible')
+        document = self.make_document('a', folder=source, content=b'0123456789')
+        self.make_document('b', content=b'abc')
+        self.assertUsage(13, 2)
+        source.refresh_from_db()
+        self.assertEqual(source.used_bytes, 10)
+
+        self.client.post(reverse('move_document', args=[document.id]), {'folder': target.id})
+        source.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((source.used_bytes, target.used_bytes), (0, 10))
+        self.assertUsage(13, 2)
+
+        bulk.move_documents(self.user, [document.id], None)
+        target.refresh_from_db()
+        self.assertEqual(target.used_bytes, 0)
+
+        Document.objects.get(pk=document.id).delete()
+        self.assertUsage(3, 1)
+
+    def test_tree_deletion_updates_counters_in_bulk(self):
+        parent = self.make_folder('Parent')
+        child = self.make_folder('Enfant', parent=parent)
+        for i in range(5):
+            self.make_document(f'doc{i}', folder=child if i % 2 else parent, content=b'x' * 10)
+        self.assertEqual(parent.subtree_used_bytes(), 50)
+        self.client.post(reverse('delete_folder', args=[parent.id]))
+        self.assertUsage(0, 0)
+
+    def test_recompute_repairs_drift(self):
+        folder = self.make_folder()
+        self.make_document('a', folder=folder, content=b'0123456789')
+        StorageUsage.objects.filter(user=self.user).update(used_bytes=999, document_count=7)
+        Folder.objects.filter(pk=folder.pk).update(used_bytes=-5)
+
+        call_command('recompute_usage', stdout=io.StringIO())
+        self.assertUsage(10, 1)
+        folder.refresh_from_db()
+        self.assertEqual(folder.used_bytes, 10)
+
+    def test_archived_versions_count_toward_usage(self):
+        folder = self.make_folder()
+        document = self.make_document('a', folder=folder, content=b'0123456789')
+        first = versions.add_version(document, ContentFile(b'abcde', name='a.txt'))
+        versions.add_version(document, ContentFile(b'xyz', name='a.txt'))
+        self.assertUsage(18, 1)
+        folder.refresh_from_db()
+        self.assertEqual(folder.used_bytes, 18)
+
+        # Version supprimée seule : ses octets sont rendus
+        first.delete()
+        self.assertUsage(8, 1)
+        document.refresh_from_db()
+        self.assertEqual(document.archived_size, 5)
+
+        Document.objects.filter(pk=document.pk).update(archived_size=0)
+        call_command('recompute_usage', stdout=io.StringIO())
+        self.assertUsage(8, 1)
+        document.refresh_from_db()
+        self.assertEqual(document.archived_size, 5)
+
+        Document.objects.get(pk=document.pk).delete()
+        self.assertUsage(0, 0)
+
+    @override_settings(FILES_DEFAULT_QUOTA=15)
+    def test_new_versions_are_limited_by_quota(self):
+        document = self.make_document('a', content=b'0123456789')
+        url = reverse('document_versions', args=[document.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'file': SimpleUploadedFile('a.txt', b'12345')})
+        self.assertEqual(response.status_code, 302)
+        self.assertUsage(15, 1)
+        response = self.client.post(url, {'file': SimpleUploadedFile('a.txt', b'6')})
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(FILES_DEFAULT_QUOTA=15)
+    def test_uploads_over_quota_are_rejected(self):
+        self.make_document('a', content=b'0123456789')
+        response = self.client.post(reverse('upload_document'), {
+            'title': 'Trop gros', 'file': SimpleUploadedFile('gros.txt', b'x' * 20),
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadSession.objects.exists())
+
+        response = self.client.post(reverse('upload_session_create'), {
+            'title': 'Trop gros', 'filename': 'gros.bin', 'size': 6,
+        })
+        self.assertEqual(response.status_code, 413)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_document'), {
+                'title': 'Petit', 'file': SimpleUploadedFile('petit.txt', b'12345'),
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertUsage(15, 2)
+
+    def test_dashboard_shows_usage_without_file_lookups(self):
+        self.make_document('a', content=b'x' * 2048)
+        with mock.patch.object(FieldFile, 'size', new_callable=mock.PropertyMock) as size:
+            response = self.client.get(reverse('home'))
+        size.assert_not_called()
+        self.assertContains(response, '2.0\xa0KB utilisés')
+
+
+class BulkOperationTests(FilesTestCase):
+    """
+    Opérations groupées : une requête par lot, résultat par document.
+    """
+
+    def post_json(self, name, payload):
+        return self.client.post(reverse(name), json.dumps(payload), content_type='application/json')
+
+    def test_bulk_move_checks_ownership(self):
+        folder = self.make_folder('Archives')
+        documents = [self.make_document(f'doc-{i}', content=f'{i}'.encode()) for i in range(3)]
+        foreign = self.make_document('autre', owner=User.objects.create_user('bob'))
+        ids = [doc.id for doc in documents] + [foreign.id, 999999]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_json('bulk_move_documents', {'ids': ids, 'folder': folder.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['counts'], {'ok': 3, 'not_found': 2})
+        self.assertEqual(response.json()['results'][3], {'id': foreign.id, 'status': 'not_found'})
+        self.assertEqual(folder.documents.count(), 3)
+        self.assertIsNone(Document.objects.get(id=foreign.id).folder)
+
+        # Le nom du dossier est indexé pour la recherche
+        self.assertEqual(len(search.search_documents(self.user, 'archives')), 3)
+
+        response = self.post_json('bulk_move_documents', {'ids': ids, 'folder': foreign.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_delete_uses_one_query_per_batch(self):
+        documents = [self.make_document(f'doc-{i}', content=f'{i}'.encode()) for i in range(12)]
+        ids = [doc.id for doc in documents]
+
+        with mock.patch('files.bulk.BULK_BATCH_SIZE', 5), \
+                self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.post_json('bulk_delete_documents', {'ids': ids})
+        self.assertEqual(response.json()['counts'], {'ok': 12})
+        self.assertFalse(Document.objects.exists())
+        deletes = [q for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "files_document"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(Blob.objects.exists())
+
+    def test_bulk_rename(self):
+        first, second = self.make_document('a', content=b'a'), self.make_document('b', content=b'b')
+        response = self.post_json('bulk_rename_documents', {'titles': {first.id: 'Premier', second.id: '  '}})
+        self.assertEqual(response.json()['counts'], {'ok': 1, 'invalid': 1})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.title, second.title), ('Premier', 'b'))
+
+        self.assertEqual(self.post_json('bulk_rename_documents', {'titles': ['x']}).status_code, 400)
+
+
+class PreviewTests(FilesTestCase):
+    """
+    Vignettes et aperçus générés en arrière-plan, une fois par contenu.
+    """
+
+    def png(self, color='red'):
+        from PIL import Image
+
+        output = io.BytesIO()
+        Image.new('RGBA', (800, 400), color).save(output, 'PNG')
+        return output.getvalue()
+
+    def make_image(self, title='photo', content=None):
+        return Document.objects.create(
+            title=title, file=ContentFile(content or self.png(), name=f'{title}.png'), owner=self.user,
+        )
+
+    def test_image_upload_gets_thumbnail_and_preview(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.make_image()
+        blob = Blob.objects.get()
+        self.assertEqual(blob.preview_status, Blob.PREVIEW_READY)
+        self.assertTrue(blob.thumbnail.name.endswith(f'{blob.checksum}-thumbnail.jpg'))
+
+        response = self.client.get(reverse('document_preview', args=[document.id, 'thumbnail']))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        response.close()
+        self.assertContains(self.client.get(reverse('home')), reverse('document_preview', args=[document.id, 'thumbnail']))
+
+        # Contenu identique : aperçus réutilisés, rien n'est recalculé
+        with mock.patch('files.previews.render_variant') as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_image('copie')
+        render.assert_not_called()
+
+    def test_pdf_preview_is_rendered_from_a_file(self):
+        import pymupdf
+
+        with pymupdf.open() as pdf:
+            pdf.new_page()
+            content = pdf.tobytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.create(title='rapport', file=ContentFile(content, name='rapport.pdf'), owner=self.user)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.preview_status, Blob.PREVIEW_READY)
+
+        # Stockage sans chemin local : copie temporaire, jamais lue d'un bloc
+        local_path = blob.file.path
+        remote = SimulatedRemoteStorage(location=TEST_MEDIA_ROOT, latency=0)
+        with mock.patch.object(blob.file, 'storage', remote), previews.source_path(blob.file) as path:
+            self.assertNotEqual(path, local_path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(path))
+
+    def test_unsupported_types_keep_their_icon(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.make_document('notes')
+        self.assertEqual(Blob.objects.get().preview_status, Blob.PREVIEW_UNSUPPORTED)
+        self.assertEqual(self.client.get(reverse('document_preview', args=[document.id, 'preview'])).status_code, 404)
+        self.assertContains(self.client.get(reverse('home')), 'fa-file-alt')
+
+    def test_backfill_command(self):
+        self.make_image()  # Tâches non exécutées : contenu en attente
+        call_command('generate_previews', workers=1, stdout=io.StringIO())
+        self.assertEqual(Blob.objects.get().preview_status, Blob.PREVIEW_READY)
+
+
+@tasks.task
+def flaky_task(name, failures):
+    """
+    Tâche de test : échoue `failures` fois avant de créer le dossier `name`.
+    """
+    if Job.objects.get(name=flaky_task.task_name).attempts <= failures:
+        raise RuntimeError("échec volontaire")
+    Folder.objects.create(name=name, owner=User.objects.get(username='alice'))
+
+
+@override_settings(FILES_TASK_BACKEND='database')
+class JobQueueTests(FilesTestCase):
+    """
+    File de tâches en base : enregistrement transactionnel, reprises, workers.
+    """
+
+    def run_workers(self):
+        call_command('run_workers', processes=1, once=True, stdout=io.StringIO())
+
+    def local_threads(self):
+        # Pool de threads du processus web, exécuté sur place (même connexion)
+        executor = mock.Mock(submit=lambda func, name, *args: tasks.run(name, *args))
+        return mock.patch('files.tasks.get_executor', return_value=executor)
+
+    def test_upload_is_queued_then_processed_by_workers(self):
+        storage = Blob._meta.get_field('file').storage
+        with self.captureOnCommitCallbacks() as callbacks, mock.patch.object(storage, 'save') as stored:
+            self.client.post(reverse('upload_document'), {
+                'title': 'Différé', 'file': SimpleUploadedFile('differe.txt', b'plus tard'),
+            })
+        # La requête ne fait que recevoir le fichier
+        stored.assert_not_called()
+        session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(session.part_path))
+
+        # Le worker peut tourner sur une autre machine : le processus web
+        # envoie lui-même le fichier au stockage, en arrière-plan
+        with self.local_threads(), self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        session.refresh_from_db()
+        self.assertEqual(session.blob.checksum, hashlib.sha256(b'plus tard').hexdigest())
+        self.assertFalse(os.path.exists(session.part_path))
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(Job.objects.get().name, 'files.uploads.finalize_session')
+
+        # Le worker crée le document sans renvoyer le fichier
+        with mock.patch.object(storage, 'save') as stored:
+            self.run_workers()
+        stored.assert_not_called()
+        document = Document.objects.get()
+        self.assertEqual((document.title, document.blob), ('Différé', session.blob))
+        self.assertEqual(UploadSession.objects.get().document, document)
+        # Les traitements déclenchés par la création passent aussi par la file
+        self.run_workers()
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        self.assertEqual(document.text.content, 'plus tard')
+
+    @override_settings(FILES_UPLOAD_STAGING_SHARED=True)
+    def test_failed_upload_is_retried_then_marked_failed(self):
+        storage = Blob._meta.get_field('file').storage
+        save, depth = storage.save, len(connection.atomic_blocks)
+
+        def store_outside_transaction(name, *args, **kwargs):
+            # L'envoi au stockage ne tient jamais de verrou en base
+            if name.startswith('blobs'):
+                self.assertEqual(len(connection.atomic_blocks), depth)
+            return save(name, *args, **kwargs)
+
+        def database_error(document, *args, **kwargs):
+            raise OSError('base indisponible')
+
+        self.client.post(reverse('upload_document'), {
+            'title': 'Reprise', 'file': SimpleUploadedFile('reprise.txt', b'contenu repris'),
+        })
+        with mock.patch.object(storage, 'save', side_effect=store_outside_transaction) as stored, \
+                mock.patch.object(Document, 'save', database_error):
+            self.run_workers()
+        self.assertEqual(len([c for c in stored.call_args_list if c.args[0].startswith('blobs')]), 1)
+        # Tâche reprogrammée : la session attend la prochaine tentative, son contenu est déjà stocké
+        session = UploadSession.objects.get()
+        self.assertEqual((session.status, session.error), (UploadSession.PROCESSING, 'base indisponible'))
+        self.assertEqual((session.blob.ref_count, Job.objects.get().status), (1, Job.QUEUED))
+
+        Job.objects.update(run_after=timezone.now())
+        with mock.patch.object(storage, 'save', side_effect=store_outside_transaction) as stored:
+            self.run_workers()
+        # Nouvelle tentative : le fichier n'est pas renvoyé
+        self.assertFalse([c for c in stored.call_args_list if c.args[0].startswith('blobs')])
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.blob), (UploadSession.COMPLETE, None))
+        document = Document.objects.get()
+        self.assertEqual((session.document, document.blob.ref_count), (document, 1))
+        self.assertFalse(os.path.exists(session.part_path))
+
+        # Relancée (worker disparu après la validation) : rien n'est recréé
+        uploads.finalize_session(str(session.pk))
+        self.assertEqual(Document.objects.count(), 1)
+
+        # Dernière tentative : la session est abandonnée
+        self.client.post(reverse('upload_document'), {
+            'title': 'Perdu', 'file': SimpleUploadedFile('perdu.txt', b'jamais stocke'),
+        })
+        Job.objects.filter(status=Job.QUEUED).update(max_attempts=1)
+        with mock.patch.object(storage, 'save', side_effect=OSError('stockage indisponible')):
+            self.run_workers()
+        lost = UploadSession.objects.get(title='Perdu')
+        self.assertEqual((lost.status, lost.error), (UploadSession.FAILED, 'stockage indisponible'))
+
+    def test_rolled_back_writes_enqueue_nothing(self):
+        from django.db import transaction
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            tasks.enqueue(flaky_task, 'jamais', 0)
+            raise RuntimeError()
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_are_retried_with_backoff(self):
+        from . import jobs
+
+        tasks.enqueue(flaky_task, 'reprise', 1)
+        self.run_workers()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('échec volontaire', job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + jobs.RETRY_BASE_DELAY / 2)
+
+        Job.objects.update(run_after=timezone.now())
+        self.run_workers()
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertTrue(Folder.objects.filter(name='reprise').exists())
+
+        tasks.enqueue(flaky_task, 'abandon', 99)
+        job = Job.objects.get(status=Job.QUEUED)
+        for _ in range(job.max_attempts):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, job.max_attempts))
+
+    def test_idle_workers_sweep_stale_jobs_on_a_timer(self):
+        from . import jobs
+
+        for i in range(3):
+            tasks.enqueue(flaky_task, f'tâche {i}', 0)
+        with mock.patch('files.jobs.requeue_stale') as requeue_stale:
+            self.assertEqual(jobs.work(once=True), 3)
+        # Une seule écriture de balayage pour toute la boucle, et non une par interrogation
+        requeue_stale.assert_called_once()
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        from . import jobs
+
+        tasks.enqueue(flaky_task, 'longue', 0)
+        tasks.enqueue(flaky_task, 'orpheline', 0)
+        alive, dead = jobs.claim('web:1', limit=2)
+        Job.objects.update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        # Worker encore vivant : son thread rafraîchit le verrou
+        self.assertEqual(jobs.refresh_lock(alive), 1)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=dead.pk).status, Job.QUEUED)
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, Job.RUNNING)
+
+
+class BenchmarkTests(FilesTestCase):
+    """
+    Outils de la commande benchmark : données synthétiques et détection
+    des régressions.
+    """
+
+    def test_seed_tree(self):
+        folders = benchmarks.seed_tree(self.user, depth=3, fan_out=2)
+        self.assertEqual(len(folders), 2 + 4 + 8)
+        self.assertEqual(max(folder.depth for folder in Folder.objects.filter(owner=self.user)), 2)
+
+    def test_compare_reports_regressions(self):
+        baseline = {'scenarios': {'home': {'p50': 10.0, 'p99': 20.0, 'queries': 5}}}
+        results = {'scenarios': {'home': {'p50': 12.0, 'p99': 30.0, 'queries': 6}}}
+        regressions = benchmarks.compare(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('6 requêtes SQL', regressions[0])
+        self.assertEqual(benchmarks.compare(baseline, baseline), [])
+        # Latences signalées à part, sans faire échouer la commande
+        slowdowns = benchmarks.slowdowns(results, baseline, threshold=0.3)
+        self.assertEqual(len(slowdowns), 1)
+        self.assertIn('p99', slowdowns[0])
+
+        # Référence mesurée avec d'autres caches
+        baseline['config'] = {'session_engine': 'django.contrib.sessions.backends.cached_db', 'user_cache': True}
+        results = dict(baseline, config={'session_engine': 'django.contrib.sessions.backends.db', 'user_cache': False})
+        self.assertEqual(len(benchmarks.compare(results, baseline)), 2)
+
+    def test_profile_counts_writes(self):
+        measures = benchmarks.profile(lambda: self.make_folder('mesuré'))
+        self.assertGreaterEqual(measures['writes'], 1)
+        self.assertGreaterEqual(measures['queries'], measures['writes'])
+
+    def test_index_benchmark_refuses_to_run_without_debug(self):
+        with self.assertRaises(CommandError), mock.patch('files.benchmarks.purge') as purge:
+            call_command('benchmark_indexes', documents=1, users=1, stdout=mock.MagicMock())
+        purge.assert_not_called()
+
+
+class SQLiteSettingsTests(TestCase):
+    """
+    Profil SQLite de production : pragmas posés à l'ouverture de chaque
+    connexion et transactions BEGIN IMMEDIATE.
+    """
+
+    def open_connection(self, **options):
+        from .backends.sqlite3.base import DatabaseWrapper
+
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(workdir, 'db.sqlite3'), OPTIONS=options)
+        wrapper = DatabaseWrapper(settings_dict, alias='sqlite_settings_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(FILES_SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000})
+    def test_pragmas_applied_on_connect(self):
+        wrapper = self.open_connection()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+
+    def test_transaction_mode(self):
+        wrapper = self.open_connection(transaction_mode='immediate')
+        statements = []
+        wrapper.ensure_connection()
+        with wrapper.execute_wrapper(lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)):
+            # Ce qu'appelle transaction.atomic() sous SQLite
+            wrapper._start_transaction_under_autocommit()
+        self.assertTrue(wrapper.connection.in_transaction)
+        wrapper.connection.rollback()
+        self.assertEqual(statements, ['BEGIN IMMEDIATE'])
+
+    def test_invalid_transaction_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.open_connection(transaction_mode='LAZY').ensure_connection()
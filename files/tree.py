@@ -0,0 +1,66 @@
+"""
+Opérations sur l'arborescence des dossiers.
+"""
+from django.db import transaction
+
+from .blobs import deferred_release
+from .folder_tree import deferred_changes
+from .search import deferred_removal
+from .usage import deferred_usage
+from .models import Document, Folder
+
+# Nombre de documents supprimés par requête DELETE
+DELETE_BATCH_SIZE = 500
+
+
+def subtree_ids(folder):
+    """
+    Identifiants de `folder` et de tous ses descendants, en une seule
+    requête indexée sur le chemin matérialisé.
+    """
+    if not folder.path:
+        # Un préfixe vide désignerait tous les dossiers de l'utilisateur
+        raise ValueError(f"Chemin matérialisé manquant pour le dossier {folder.pk}")
+    return list(
+        Folder.objects.filter(owner_id=folder.owner_id, path__startswith=folder.path)
+        .values_list('pk', flat=True)
+    )
+
+
+def move_folder(folder, new_parent):
+    """
+    Déplace `folder` (et tout son sous-arbre) sous `new_parent`, ou à la
+    racine si None. Lève ValidationError si le déplacement créerait un cycle.
+    """
+    with transaction.atomic():
+        folder.parent = new_parent
+        folder.save()
+    return folder
+
+
+def delete_folder_tree(folder, batch_size=DELETE_BATCH_SIZE):
+    """
+    Supprime `folder`, ses sous-dossiers et tous leurs documents.
+
+    Les documents sont supprimés par lots ; leurs références sur les blobs
+    sont libérées en une fois et les fichiers sont supprimés du stockage en
+    arrière-plan ; ils sont retirés de l'index de recherche en une requête
+    par lot ; les dossiers supprimés forment une seule version de
+    l'arborescence. Retourne le nombre de documents supprimés.
+    """
+    folder_ids = subtree_ids(folder)
+    documents = Document.objects.filter(owner_id=folder.owner_id, folder_id__in=folder_ids)
+    deleted = 0
+
+    with transaction.atomic(), deferred_release(), deferred_usage(), deferred_changes(), deferred_removal():
+        while True:
+            batch = list(documents.values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            Document.objects.filter(pk__in=batch).delete()
+            deleted += len(batch)
+
+        # Plus aucun document : la cascade sur les dossiers reste légère
+        Folder.objects.filter(pk__in=folder_ids).delete()
+
+    return deleted
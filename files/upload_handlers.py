@@ -0,0 +1,90 @@
+"""
+Gestionnaires de téléversement :
+
+- QuotaUploadHandler arrête la réception d'un fichier qui dépasse l'espace
+  restant de l'utilisateur, sans lire le reste du corps de la requête ;
+- les gestionnaires Checksum* calculent l'empreinte SHA-256 du fichier
+  pendant sa réception, morceau par morceau, pour éviter de le relire ensuite.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    FileUploadHandler, MemoryFileUploadHandler, StopUpload, TemporaryFileUploadHandler,
+)
+
+# Marge accordée à l'enveloppe multipart (autres champs, en-têtes) quand la
+# taille annoncée de la requête est comparée à l'espace restant
+MULTIPART_ALLOWANCE = 64 * 1024
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+    Refuse un fichier plus gros que l'espace restant (voir usage.py) : dès
+    le début du fichier d'après la taille annoncée de la requête, sinon au
+    premier morceau qui dépasse. La connexion est alors coupée et la vue
+    trouve request.upload_quota_exceeded à True.
+
+    À placer en tête de FILE_UPLOAD_HANDLERS.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        from .usage import get_usage
+        self.remaining = None
+        self.received = 0
+        self.request_length = content_length
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            # Gardé sur la requête pour la vérification finale de la vue
+            self.request.storage_usage = get_usage(user)
+            self.remaining = self.request.storage_usage.remaining_bytes
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.remaining is not None and self.request_length > self.remaining + MULTIPART_ALLOWANCE:
+            self.reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.remaining is not None and self.received > self.remaining:
+            self.reject()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def reject(self):
+        self.request.upload_quota_exceeded = True
+        raise StopUpload(connection_reset=True)
+
+
+class ChecksumMixin:
+    """
+    Ajoute l'attribut `checksum` aux fichiers produits par le gestionnaire.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Avant l'appel parent, qui peut lever StopFutureHandlers
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        result = super().receive_data_chunk(raw_data, start)
+        # None : le morceau a été conservé par ce gestionnaire (et non
+        # transmis au suivant), c'est donc lui qui doit le compter
+        if result is None:
+            self.digest.update(raw_data)
+        return result
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.checksum = self.digest.hexdigest()
+        return uploaded_file
+
+
+class ChecksumMemoryFileUploadHandler(ChecksumMixin, MemoryFileUploadHandler):
+    pass
+
+
+class ChecksumTemporaryFileUploadHandler(ChecksumMixin, TemporaryFileUploadHandler):
+    pass
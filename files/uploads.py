@@ -0,0 +1,326 @@
+"""
+Téléversement par morceaux (chunked upload) avec reprise.
+
+Le client crée une UploadSession, envoie ses morceaux dans l'ordre en
+indiquant leur position (en-tête Upload-Offset), puis demande la
+finalisation. Après une coupure, il relit la position atteinte et reprend
+à partir de là. Le transfert vers le stockage (Cloudinary en production)
+se fait dans une tâche d'arrière-plan, hors de la requête : la requête ne
+fait que recevoir et enregistrer les octets.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.utils import timezone
+
+from . import tasks, versions
+from .blobs import acquire_blob, release_blobs
+from .models import Document, UploadSession
+from .utils import file_checksum, guess_content_type
+
+# Taille des blocs copiés du flux de la requête vers le fichier partiel
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Morceau refusé ; `status` est le code HTTP à renvoyer au client.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def clean_filename(filename):
+    # Même nettoyage que le formulaire classique (espaces remplacés par _)
+    return os.path.basename(filename or '').replace(' ', '_') or 'fichier'
+
+
+def start_session(owner, title, filename, total_size, folder=None, document=None):
+    """
+    Ouvre une session et crée son fichier partiel vide. Avec `document`,
+    le fichier reçu en deviendra la nouvelle version (voir versions.py).
+    """
+    os.makedirs(settings.FILES_UPLOAD_STAGING_DIR, exist_ok=True)
+    session = UploadSession.objects.create(
+        owner=owner,
+        folder=folder,
+        title=title,
+        filename=clean_filename(filename),
+        total_size=total_size,
+        document=document,
+    )
+    open(session.part_path, 'wb').close()
+    return session
+
+
+def stage_upload(owner, title, uploaded_file, folder=None, document=None):
+    """
+    Téléversement classique (formulaire) : le fichier reçu est placé dans la
+    zone de transit puis transmis au stockage en arrière-plan, comme une
+    session par morceaux complète. La requête ne fait que recevoir les octets.
+    """
+    session = start_session(owner, title, uploaded_file.name, uploaded_file.size, folder=folder, document=document)
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # Fichier déjà sur disque : simple déplacement, sans copie
+        file_move_safe(uploaded_file.temporary_file_path(), session.part_path, allow_overwrite=True)
+    else:
+        with open(session.part_path, 'wb') as part:
+            for chunk in uploaded_file.chunks():
+                part.write(chunk)
+    session.received_size = session.total_size
+    # Empreinte déjà calculée pendant la réception (voir upload_handlers.py)
+    session.checksum = getattr(uploaded_file, 'checksum', None) or ''
+    UploadSession.objects.filter(pk=session.pk).update(
+        received_size=session.received_size, checksum=session.checksum,
+    )
+    return complete_session(session)
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Ajoute au fichier partiel les `length` octets lus depuis `stream`, qui
+    doivent commencer à la position `offset`.
+
+    Le morceau n'est accepté que s'il reprend exactement là où le précédent
+    s'est arrêté : un client qui se trompe de position reçoit un 409 et
+    relit la position courante.
+    """
+    check_chunk(session, offset, length)
+    write_chunk(session, offset, stream, length)
+    return record_chunk(session, offset, length)
+
+
+def check_chunk(session, offset, length):
+    if session.status != UploadSession.UPLOADING:
+        raise UploadError("Ce téléversement n'accepte plus de données.", status=409)
+    if offset != session.received_size:
+        raise UploadError("Position inattendue.", status=409)
+    if length > settings.FILES_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError("Morceau trop volumineux.", status=413)
+    if offset + length > session.total_size:
+        raise UploadError("Le morceau dépasse la taille annoncée.", status=400)
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Écrit le morceau dans le fichier partiel (aucun accès à la base).
+    """
+    written = 0
+    with open(session.part_path, 'r+b') as part:
+        # On réécrit à partir de `offset` : un morceau interrompu en cours de
+        # route est simplement écrasé par la tentative suivante
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+        part.truncate()
+
+    if written != length:
+        raise UploadError("Morceau incomplet, veuillez le renvoyer.", status=400)
+
+
+def record_chunk(session, offset, length):
+    # Mise à jour conditionnelle : deux envois concurrents du même morceau
+    # ne peuvent pas avancer la position deux fois
+    updated = UploadSession.objects.filter(
+        pk=session.pk, received_size=offset, status=UploadSession.UPLOADING,
+    ).update(received_size=offset + length, updated_at=timezone.now())
+    if not updated:
+        raise UploadError("Position inattendue.", status=409)
+    session.received_size = offset + length
+    return session
+
+
+def complete_session(session):
+    """
+    Marque la session comme reçue et programme son transfert vers le stockage.
+    """
+    if session.status != UploadSession.UPLOADING:
+        return session
+    if not session.is_complete:
+        raise UploadError("Le fichier n'a pas été entièrement reçu.", status=409)
+
+    with transaction.atomic():
+        session.status = UploadSession.PROCESSING
+        session.save(update_fields=['status', 'updated_at'])
+        if shares_staging():
+            tasks.enqueue(finalize_session, str(session.pk))
+        else:
+            # Workers sur une autre machine : ce processus, le seul à voir le
+            # fichier partiel, l'envoie au stockage en arrière-plan
+            tasks.enqueue_local(transfer_session, str(session.pk))
+    return session
+
+
+def shares_staging():
+    """
+    Vrai si la tâche de finalisation lit le fichier partiel sur le disque
+    local : exécutée par ce processus (backends 'thread' et 'eager'), ou
+    dossier de transit partagé avec les workers (FILES_UPLOAD_STAGING_SHARED).
+    """
+    return (
+        getattr(settings, 'FILES_TASK_BACKEND', 'thread') != 'database'
+        or getattr(settings, 'FILES_UPLOAD_STAGING_SHARED', False)
+    )
+
+
+def store_part(session):
+    """
+    Envoie le fichier partiel au stockage (blob) et en retourne le blob. À
+    appeler hors transaction : l'envoi peut être long (Cloudinary).
+    """
+    with open(session.part_path, 'rb') as part:
+        content = File(part, name=session.filename)
+        checksum = session.checksum or file_checksum(content)
+        if session.document is not None and session.document.checksum == checksum:
+            # Nouvelle version identique au contenu courant : rien à envoyer
+            return None
+        return acquire_blob(content, checksum, guess_content_type(session.filename))
+
+
+def upload_part(session):
+    """
+    Envoie le fichier partiel au stockage, hors transaction, et note son
+    blob dans la session, qui en retient la référence. Retourne None si le
+    contenu n'a pas été envoyé (nouvelle version identique).
+    """
+    blob = store_part(session)
+    if blob is not None and not UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.PROCESSING, blob__isnull=True,
+    ).update(blob=blob, updated_at=timezone.now()):
+        # Une autre exécution a déjà envoyé le fichier
+        release_blobs([blob.pk])
+    return blob
+
+
+def record_failure(session_id, error):
+    # La session reste PROCESSING tant que la tâche sera retentée
+    failed = {'status': UploadSession.FAILED} if tasks.is_final_attempt() else {}
+    UploadSession.objects.filter(pk=session_id, status=UploadSession.PROCESSING).update(
+        error=str(error), updated_at=timezone.now(), **failed,
+    )
+
+
+@tasks.task
+def transfer_session(session_id):
+    """
+    Envoie au stockage le fichier partiel d'une session depuis le processus
+    qui l'a reçu, puis confie la création du document aux workers
+    (FILES_TASK_BACKEND='database' sans dossier de transit partagé).
+    """
+    session = UploadSession.objects.select_related('document').filter(pk=session_id).first()
+    if session is None or session.status != UploadSession.PROCESSING:
+        return
+    try:
+        blob = upload_part(session)
+    except Exception as e:
+        record_failure(session_id, e)
+        raise
+    if blob is None:
+        # Nouvelle version identique au contenu courant : rien à confier aux workers
+        finalize_session(session_id)
+        return
+    discard_part(session)
+    tasks.enqueue(finalize_session, session_id)
+
+
+@tasks.task
+def finalize_session(session_id):
+    """
+    Crée le Document (ou sa nouvelle version) à partir du fichier partiel
+    puis supprime ce dernier.
+
+    Le fichier est d'abord envoyé au stockage, hors transaction, et son blob
+    noté dans la session (déjà fait par transfer_session si les workers ne
+    voient pas le fichier partiel). Une transaction courte, session
+    verrouillée, crée ensuite le document et passe la session à COMPLETE :
+    une tâche relancée (nouvelle tentative, worker disparu) ne renvoie pas
+    le fichier et ne crée jamais le document deux fois. En cas d'échec, la
+    session reste PROCESSING tant que la tâche sera retentée, et ne passe à
+    FAILED qu'à la dernière tentative.
+    """
+    session = UploadSession.objects.select_related('document').filter(pk=session_id).first()
+    if session is None:
+        # Session bloquée purgée entre-temps (voir purge_stale_sessions)
+        return None
+    if session.status != UploadSession.PROCESSING:
+        return session.document
+
+    try:
+        if session.blob_id is None:
+            upload_part(session)
+
+        with transaction.atomic():
+            session = (
+                UploadSession.objects.select_for_update()
+                .select_related('folder', 'document', 'blob').filter(pk=session_id).first()
+            )
+            if session is None or session.status != UploadSession.PROCESSING:
+                return session.document if session else None
+            document, blob = session.document, session.blob
+            content_type = guess_content_type(session.filename)
+            if blob is None:
+                # Nouvelle version identique au contenu courant : ignorée
+                pass
+            elif document is not None:
+                # Nouvelle version : la référence de la session passe au document
+                versions.replace_content(document, blob, content_type)
+            else:
+                document = Document(
+                    title=session.title,
+                    folder=session.folder,
+                    owner_id=session.owner_id,
+                    blob=blob,
+                    file=blob.file.name,
+                    size=blob.size,
+                    content_type=content_type,
+                    checksum=blob.checksum,
+                )
+                document.save()
+            session.status = UploadSession.COMPLETE
+            session.document = document
+            session.blob = None
+            session.save(update_fields=['status', 'document', 'blob', 'updated_at'])
+    except Exception as e:
+        record_failure(session_id, e)
+        raise
+
+    discard_part(session)
+    return document
+
+
+def discard_part(session):
+    try:
+        os.remove(session.part_path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_sessions(max_age=timedelta(days=1)):
+    """
+    Supprime les sessions sans activité depuis `max_age` et leurs fichiers
+    partiels : téléversements abandonnés, terminés ou en échec, mais aussi
+    finalisations restées PROCESSING (tâche perdue avec un worker 'thread'
+    redémarré, par exemple). Retourne le nombre de sessions supprimées.
+    """
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for session in stale.iterator():
+        # Ligne inchangée depuis sa lecture seulement : une finalisation
+        # qui vient d'aboutir ou d'échouer n'est pas supprimée sous elle
+        deleted, _ = UploadSession.objects.filter(
+            pk=session.pk, status=session.status, updated_at=session.updated_at,
+        ).delete()
+        if deleted:
+            discard_part(session)
+            count += 1
+    return count
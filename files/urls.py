@@ -1,22 +1,45 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Sous ASGI, versions asynchrones des vues d'entrées/sorties (voir async_views.py)
+io_views = async_views if settings.FILES_ASYNC_VIEWS else views
 
 urlpatterns = [
     # URLs principales
-    path('', views.home, name='home'),
+    path('', io_views.home, name='home'),
     
     # Gestion des documents
-    path('upload/', views.upload_document, name='upload_document'),
+    path('upload/', io_views.upload_document, name='upload_document'),
+    path('upload/sessions/', views.upload_session_create, name='upload_session_create'),
+    path('upload/sessions/<uuid:session_id>/', io_views.upload_session_detail, name='upload_session_detail'),
+    path('upload/sessions/<uuid:session_id>/complete/', views.upload_session_complete, name='upload_session_complete'),
+    path('document/<int:document_id>/', io_views.download_document, name='download_document'),
+    path('document/<int:document_id>/versions/', views.document_versions, name='document_versions'),
+    path('document/<int:document_id>/versions/<int:number>/', views.download_version, name='download_version'),
+    path('document/<int:document_id>/<str:variant>/', views.document_preview, name='document_preview'),
     path('delete-document/<int:doc_id>/', views.delete_document, name='delete_document'),
     path('rename-document/<int:document_id>/', views.rename_document, name='rename_document'),
+    path('documents/rows/', io_views.document_rows, name='document_rows'),
+    path('documents/bulk/move/', views.bulk_move_documents, name='bulk_move_documents'),
+    path('documents/bulk/delete/', views.bulk_delete_documents, name='bulk_delete_documents'),
+    path('documents/bulk/rename/', views.bulk_rename_documents, name='bulk_rename_documents'),
+    path('search/', views.search, name='search'),
     
     # Gestion des dossiers
+    path('folders/tree/', views.folder_tree, name='folder_tree'),
     path('folder/<int:folder_id>/', views.view_folder, name='view_folder'),
+    path('folder/<int:folder_id>/download/', io_views.download_folder, name='download_folder'),
     path('create-folder/', views.create_folder, name='create_folder'),
     path('delete-folder/<int:folder_id>/', views.delete_folder, name='delete_folder'),
     path('rename-folder/<int:folder_id>/', views.rename_folder, name='rename_folder'),
+    path('move-folder/<int:folder_id>/', views.move_folder, name='move_folder'),
     path('move-document/<int:document_id>/', views.move_document, name='move_document'),
     
+    # Exploitation
+    path('storage/stats/', views.storage_stats, name='storage_stats'),
+    path('metrics', views.metrics, name='metrics'),
+
     # Authentification
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
@@ -0,0 +1,245 @@
+"""
+Comptabilité de l'espace utilisé, par utilisateur (StorageUsage) et par
+dossier (Folder.used_bytes).
+
+Les compteurs sont ajustés par différence à chaque écriture (création,
+suppression, déplacement ou changement de taille d'un document, voir
+signals.py) : lire l'usage ne parcourt jamais les documents et n'interroge
+jamais le stockage. Un document occupe sa taille plus celle de ses versions
+archivées (Document.stored_size), qui restent stockées : envoyer de
+nouvelles versions consomme le quota. Les opérations en masse regroupent
+leurs ajustements (voir deferred_usage) ; la commande recompute_usage
+recalcule tous les totaux par agrégats en cas de dérive.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Document, DocumentVersion, Folder, StorageUsage
+
+# Nombre de dossiers ajustés par requête UPDATE
+FOLDER_BATCH_SIZE = 500
+
+# Ajustements en attente, par thread (voir deferred_usage)
+_pending = threading.local()
+
+
+class QuotaExceeded(Exception):
+    """
+    Le fichier ne tient pas dans l'espace restant de l'utilisateur.
+    """
+
+    def __init__(self, usage, size):
+        self.usage = usage
+        self.size = size
+        super().__init__(
+            f"Espace insuffisant : {size} octets demandés, {usage.remaining_bytes} disponibles."
+        )
+
+
+def get_usage(user):
+    """
+    Usage de `user` (non enregistré et à zéro s'il n'a encore rien stocké).
+    """
+    return StorageUsage.objects.filter(user=user).first() or StorageUsage(user=user)
+
+
+def check_quota(user, size, usage=None):
+    """
+    Lève QuotaExceeded si `size` octets supplémentaires dépassent le quota.
+    `usage` évite de relire l'usage déjà chargé pendant la requête.
+    """
+    usage = usage or get_usage(user)
+    remaining = usage.remaining_bytes
+    if remaining is not None and size > remaining:
+        raise QuotaExceeded(usage, size)
+    return usage
+
+
+def record(owner_id, folder_id, size, count):
+    """
+    Ajoute `size` octets et `count` documents à l'usage de `owner_id` et
+    du dossier `folder_id` (None : racine). Valeurs négatives pour retirer.
+    """
+    record_many(owner_id, size, count, {folder_id: size} if folder_id else {})
+
+
+def record_many(owner_id, size, count, folders):
+    """
+    Comme record, avec des ajustements distincts par dossier :
+    `folders` associe un identifiant de dossier à des octets.
+    """
+    pending = getattr(_pending, 'deltas', None)
+    if pending is not None:
+        pending['users'][owner_id][0] += size
+        pending['users'][owner_id][1] += count
+        for folder_id, folder_size in folders.items():
+            pending['folders'][folder_id] += folder_size
+        return
+    apply({owner_id: [size, count]}, folders)
+
+
+def apply(users, folders):
+    """
+    Applique les ajustements regroupés : {owner_id: [octets, documents]} et
+    {folder_id: octets}, avec un UPDATE par valeur distincte.
+    """
+    by_delta = defaultdict(list)
+    for owner_id, (size, count) in users.items():
+        if size or count:
+            by_delta[(size, count)].append(owner_id)
+    for (size, count), owner_ids in by_delta.items():
+        updated = StorageUsage.objects.filter(user_id__in=owner_ids).update(
+            used_bytes=F('used_bytes') + size, document_count=F('document_count') + count,
+        )
+        if updated < len(owner_ids):
+            create_missing(owner_ids, size, count)
+
+    # Dossiers : un seul UPDATE par lot, chaque dossier avec son ajustement
+    folders = [(folder_id, size) for folder_id, size in folders.items() if size]
+    for start in range(0, len(folders), FOLDER_BATCH_SIZE):
+        batch = folders[start:start + FOLDER_BATCH_SIZE]
+        Folder.objects.filter(pk__in=[folder_id for folder_id, _size in batch]).update(used_bytes=Case(
+            *[When(pk=folder_id, then=F('used_bytes') + size) for folder_id, size in batch],
+            output_field=BigIntegerField(),
+        ))
+
+
+def create_missing(owner_ids, size, count):
+    # Premier document d'un utilisateur : la ligne d'usage est créée
+    existing = set(StorageUsage.objects.filter(user_id__in=owner_ids).values_list('user_id', flat=True))
+    for owner_id in set(owner_ids) - existing:
+        try:
+            with transaction.atomic():
+                StorageUsage.objects.create(user_id=owner_id, used_bytes=size, document_count=count)
+        except IntegrityError:
+            # Créée en parallèle : on ajoute simplement l'ajustement
+            StorageUsage.objects.filter(user_id=owner_id).update(
+                used_bytes=F('used_bytes') + size, document_count=F('document_count') + count,
+            )
+
+
+@contextmanager
+def deferred_usage():
+    """
+    Regroupe les ajustements du bloc (suppressions ou déplacements en
+    masse) et les applique en une fois à la sortie.
+    """
+    if getattr(_pending, 'deltas', None) is not None:
+        # Déjà dans un bloc différé : c'est lui qui appliquera
+        yield
+        return
+    _pending.deltas = {'users': defaultdict(lambda: [0, 0]), 'folders': defaultdict(int)}
+    try:
+        yield
+        deltas = _pending.deltas
+    finally:
+        _pending.deltas = None
+    apply(deltas['users'], deltas['folders'])
+
+
+def document_saved(document, created):
+    """
+    Reporte la création, le déplacement ou le changement de taille de
+    `document` (contenu courant ou versions archivées) sur les compteurs.
+    """
+    if created:
+        record(document.owner_id, document.folder_id, document.stored_size, 1)
+        document._saved_usage = (document.folder_id, document.stored_size)
+        return
+    saved = getattr(document, '_saved_usage', None)
+    if saved is None or saved[1] is None:
+        return
+    folder_id, size = saved
+    if (folder_id, size) != (document.folder_id, document.stored_size):
+        # Le total de l'utilisateur ne change que de la différence de taille
+        folders = defaultdict(int)
+        if folder_id:
+            folders[folder_id] -= size
+        if document.folder_id:
+            folders[document.folder_id] += document.stored_size
+        record_many(document.owner_id, document.stored_size - size, 0, folders)
+    document._saved_usage = (document.folder_id, document.stored_size)
+
+
+def document_deleted(document):
+    # Ses versions archivées disparaissent avec lui
+    record(document.owner_id, document.folder_id, -document.stored_size, -1)
+
+
+def version_deleted(version):
+    """
+    Version archivée supprimée seule (et non avec son document) : ses
+    octets sont retirés du document et des compteurs.
+    """
+    document = Document.objects.filter(pk=version.document_id).values('owner_id', 'folder_id').first()
+    if document is None:
+        return
+    Document.objects.filter(pk=version.document_id).update(archived_size=F('archived_size') - version.size)
+    record(document['owner_id'], document['folder_id'], -version.size, 0)
+
+
+def documents_moved(owner_id, ids, folder_id):
+    """
+    Ajustements d'un déplacement groupé (UPDATE sans signal) : à appeler
+    avant l'UPDATE, tant que les documents sont encore à leur place.
+    """
+    rows = (
+        Document.objects.filter(owner_id=owner_id, pk__in=ids).exclude(folder_id=folder_id)
+        .values('folder_id').annotate(total=Sum(F('size') + F('archived_size'))).order_by()
+    )
+    folders = defaultdict(int)
+    for row in rows:
+        total = row['total'] or 0
+        if row['folder_id']:
+            folders[row['folder_id']] -= total
+        if folder_id:
+            folders[folder_id] += total
+    record_many(owner_id, 0, 0, folders)
+
+
+def recompute(user_ids=None, batch_size=500):
+    """
+    Recalcule les compteurs par agrégats (tous les utilisateurs, ou ceux de
+    `user_ids`). Retourne le nombre d'utilisateurs et de dossiers mis à jour.
+    """
+    documents = Document.objects.all()
+    folders = Folder.objects.all()
+    if user_ids is not None:
+        documents = documents.filter(owner_id__in=user_ids)
+        folders = folders.filter(owner_id__in=user_ids)
+
+    with transaction.atomic():
+        # Octets des versions archivées, recalculés eux aussi
+        documents.update(archived_size=Coalesce(Subquery(
+            DocumentVersion.objects.filter(document=OuterRef('pk'))
+            .values('document').annotate(total=Sum('size')).values('total')
+        ), Value(0)))
+        stored_size = Sum(F('size') + F('archived_size'))
+        totals = documents.values('owner_id').annotate(size=stored_size, count=Count('id')).order_by()
+        usages = [
+            StorageUsage(user_id=row['owner_id'], used_bytes=row['size'] or 0, document_count=row['count'])
+            for row in totals
+        ]
+        # Remise à zéro, puis totaux des utilisateurs qui ont des documents
+        usage_scope = StorageUsage.objects.all()
+        if user_ids is not None:
+            usage_scope = usage_scope.filter(user_id__in=user_ids)
+        usage_scope.update(used_bytes=0, document_count=0)
+        StorageUsage.objects.bulk_create(
+            usages, batch_size=batch_size, update_conflicts=True,
+            unique_fields=['user'], update_fields=['used_bytes', 'document_count'],
+        )
+
+        folders.update(used_bytes=0)
+        folder_totals = [
+            Folder(pk=row['folder_id'], used_bytes=row['size'] or 0)
+            for row in documents.filter(folder__isnull=False)
+            .values('folder_id').annotate(size=stored_size).order_by()
+        ]
+        Folder.objects.bulk_update(folder_totals, ['used_bytes'], batch_size=batch_size)
+    return {'users': len(usages), 'folders': len(folder_totals)}
@@ -0,0 +1,71 @@
+"""
+Utilisateur connecté gardé en cache entre les requêtes.
+
+Sans cache, chaque requête authentifiée relit l'utilisateur en base
+(django.contrib.auth.get_user) avant même d'entrer dans la vue. Ici,
+l'utilisateur est rangé dans le cache de settings.CACHES sous son
+identifiant ; la session reste vérifiée à chaque requête (empreinte du mot
+de passe, HASH_SESSION_KEY), comme le fait Django.
+
+L'entrée est effacée à chaque enregistrement ou suppression de
+l'utilisateur (voir signals.py) : changement de mot de passe, compte
+désactivé, dernière connexion...
+
+Effacer l'entrée n'a d'effet que si tous les processus voient le même
+cache : sans settings.FILES_SHARED_CACHE (mémoire locale), l'utilisateur
+est relu en base à chaque requête, sauf sur le serveur de développement
+(DEBUG), qui n'a qu'un processus.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+
+
+def user_key(user_id):
+    return f'files:user:{user_id}'
+
+
+def user_timeout():
+    return getattr(settings, 'FILES_USER_CACHE_TIMEOUT', 300)
+
+
+def enabled():
+    return settings.DEBUG or getattr(settings, 'FILES_SHARED_CACHE', False)
+
+
+def get_user(request):
+    """
+    Équivalent de django.contrib.auth.get_user, servi par le cache quand
+    l'utilisateur de la session y est.
+    """
+    if not enabled():
+        return auth.get_user(request)
+    try:
+        user_id = get_user_model()._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+
+    user = cache.get(user_key(user_id)) if backend_path in settings.AUTHENTICATION_BACKENDS else None
+    if user is not None:
+        session_hash = request.session.get(HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+            user.backend = backend_path
+            return user
+
+    # Absent du cache ou session à vérifier en détail (clés de repli,
+    # session périmée) : chemin habituel, qui vide la session si besoin
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(user_key(user.pk), user, timeout=user_timeout())
+    return user
+
+
+def invalidate(user_id):
+    # Effacée tout de suite, puis après validation : une requête parallèle
+    # ne peut pas remettre en cache l'état d'avant la transaction
+    cache.delete(user_key(user_id))
+    transaction.on_commit(lambda: cache.delete(user_key(user_id)))
@@ -0,0 +1,28 @@
+"""
+Fonctions utilitaires autour des fichiers téléversés.
+"""
+import hashlib
+import mimetypes
+
+# Type MIME utilisé quand on ne peut pas deviner le type d'un fichier
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def file_checksum(file, algorithm='sha256'):
+    """
+    Calcule l'empreinte d'un fichier Django en le lisant par morceaux,
+    sans jamais le charger entièrement en mémoire.
+    """
+    digest = hashlib.new(algorithm)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def guess_content_type(name, fallback=None):
+    """
+    Devine le type MIME à partir du nom de fichier, sinon utilise `fallback`
+    (par exemple le type annoncé par le navigateur).
+    """
+    content_type, _ = mimetypes.guess_type(name or '')
+    return content_type or fallback or DEFAULT_CONTENT_TYPE
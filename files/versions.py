@@ -0,0 +1,76 @@
+"""
+Versions successives d'un document.
+
+Envoyer un nouveau fichier pour un document existant remplace son contenu
+au lieu de créer un autre document : l'ancien contenu est archivé dans une
+DocumentVersion, le document porte le nouveau et son numéro de version.
+
+- Un contenu identique au contenu courant (même empreinte) est ignoré.
+- Les contenus sont stockés une seule fois, sous leur empreinte (blobs) :
+  revenir à un contenu déjà connu ne renvoie rien au stockage.
+- La référence du blob remplacé passe du document à la version archivée,
+  sans écriture supplémentaire sur le blob.
+"""
+from django.db import transaction
+
+from . import previews, search, tasks
+from .blobs import acquire_blob, release_blobs
+from .models import Document, DocumentVersion
+from .utils import file_checksum, guess_content_type
+
+
+def add_version(document, content, checksum=None):
+    """
+    Remplace le contenu de `document` par `content` (fichier ouvert).
+    Retourne la version archivée, ou None si le contenu n'a pas changé.
+    """
+    checksum = checksum or getattr(content, 'checksum', None) or file_checksum(content)
+    if checksum == document.checksum:
+        return None
+    content_type = guess_content_type(content.name, fallback=getattr(content, 'content_type', None))
+    # Envoi au stockage hors transaction (voir acquire_blob)
+    blob = acquire_blob(content, checksum, content_type)
+    return replace_content(document, blob, content_type)
+
+
+def replace_content(document, blob, content_type):
+    """
+    Remplace le contenu de `document` par celui de `blob`, déjà stocké et
+    dont l'appelant détient une référence, transmise au document (ou
+    libérée si le contenu n'a pas changé). Seulement des écritures en base :
+    peut s'exécuter dans la transaction de l'appelant.
+    """
+    with transaction.atomic():
+        # Verrou sur le document : deux envois simultanés se suivent
+        current = Document.objects.select_for_update().get(pk=document.pk)
+        if current.checksum == blob.checksum:
+            release_blobs([blob.pk])
+            return None
+        archived = DocumentVersion.objects.create(
+            document=current,
+            number=current.version,
+            blob_id=current.blob_id,
+            file=current.file.name,
+            size=current.size,
+            content_type=current.content_type,
+            checksum=current.checksum,
+        )
+        current.blob = blob
+        current.file = blob.file.name
+        current.url = current.file.url
+        current.size = blob.size
+        current.content_type = content_type
+        current.checksum = blob.checksum
+        current.version += 1
+        # Le contenu remplacé reste stocké : il compte toujours dans l'usage
+        current.archived_size += archived.size
+        current.save()
+
+    # Nouveau contenu : texte à extraire et aperçus à produire
+    tasks.enqueue(search.extract_document_text, current.pk)
+    previews.schedule(blob)
+    # L'instance de l'appelant reflète le nouveau contenu
+    for field in ('blob', 'file', 'url', 'size', 'content_type', 'checksum', 'version', 'archived_size'):
+        setattr(document, field, getattr(current, field))
+    document._saved_usage = current._saved_usage
+    return archived
@@ -1,14 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django import forms
 from django.forms import ModelForm
 from django.contrib import messages
-from django.http import HttpResponseForbidden, HttpResponseRedirect, Http404
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, Http404, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
-from .models import Document, Folder
+from .models import Document, DocumentVersion, Folder, UploadSession
+from .archives import folder_zip_response
+from .caching import cached_dashboard
+from .downloads import derived_file_response, document_response
+from .folder_tree import get_version as tree_version, tree_etag, tree_payload
+from .listings import folder_listing, move_targets
+from .pagination import InvalidCursor, keyset_page
+from .instrumentation import prometheus_text
+from .search import search_documents
+from .storage import default_storage_stats
+from .tree import delete_folder_tree, move_folder as move_folder_tree
+from . import bulk, previews, uploads, usage
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.utils.http import parse_etags
+from django.utils.crypto import constant_time_compare
 from django.utils.text import slugify
+import json
 import os
 from django.conf import settings
 
@@ -18,16 +36,33 @@ def home(request):
     Vue sécurisée pour la page d'accueil.
     Affiche uniquement les dossiers et documents de l'utilisateur connecté.
     """
-    # Récupère uniquement les dossiers racine (sans parent) appartenant à l'utilisateur connecté
-    folders = Folder.objects.filter(owner=request.user, parent__isnull=True)
+    cursor = request.GET.get('cursor')
+
+    def build():
+        # Récupère uniquement les dossiers racine (sans parent) appartenant à l'utilisateur connecté,
+        # avec leur nombre de documents et un aperçu des plus récents
+        folders = list(folder_listing(request.user))
+
+        # Récupère uniquement les documents sans dossier appartenant à l'utilisateur connecté,
+        # page par page (la suite est chargée au défilement via document_rows)
+        root_documents = Document.objects.filter(owner=request.user, folder__isnull=True).select_related('blob')
+        page = keyset_page(root_documents, cursor)
+        return {
+            'folders': folders,
+            'documents_without_folder': page.documents,
+            'documents_count': root_documents.count(),
+            'next_cursor': page.next_cursor,
+            'move_targets': move_targets(request.user),
+            'usage': usage.get_usage(request.user),
+        }
 
-    # Récupère uniquement les documents sans dossier appartenant à l'utilisateur connecté
-    documents_without_folder = Document.objects.filter(owner=request.user, folder__isnull=True)
+    try:
+        # Seule la première page, de loin la plus demandée, est mise en cache
+        context = build() if cursor else cached_dashboard(request.user.pk, build)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur de pagination invalide.")
 
-    return render(request, 'files/home.html', {
-        'folders': folders,
-        'documents_without_folder': documents_without_folder
-    })
+    return render(request, 'files/home.html', context)
 
 @login_required(login_url='login')
 def upload_document(request):
@@ -35,31 +70,132 @@ def upload_document(request):
     Vue sécurisée pour l'upload de documents.
     Vérifie que l'utilisateur ne peut uploader que dans ses propres dossiers.
     """
+    # Fichier refusé pendant sa réception (request.FILES déclenche l'analyse
+    # du corps) : il dépasse l'espace restant, voir upload_handlers.py
+    if request.method == 'POST' and not request.FILES and getattr(request, 'upload_quota_exceeded', False):
+        return quota_exceeded(request)
+
     if request.method == 'POST' and request.FILES.get('file'):
         title = request.POST['title']
         folder_id = request.POST.get('folder')
         
         # Vérification de sécurité : s'assurer que le dossier appartient bien à l'utilisateur
-        folder = Folder.objects.filter(owner=request.user, id=folder_id).first() if folder_id else None
+        folder = Folder.objects.filter(owner=request.user, id=folder_id).first() if folder_id and folder_id.isdigit() else None
         uploaded_file = request.FILES['file']
+        try:
+            usage.check_quota(request.user, uploaded_file.size, getattr(request, 'storage_usage', None))
+        except usage.QuotaExceeded:
+            return quota_exceeded(request)
 
         # Nettoyer le nom du fichier (remplacer les espaces par _)
         uploaded_file.name = uploaded_file.name.replace(" ", "_")
 
-        # Créer le document en s'assurant qu'il appartient à l'utilisateur
-        Document.objects.create(
-            title=title,
-            file=uploaded_file,
-            folder=folder,
-            owner=request.user  # L'utilisateur connecté est toujours le propriétaire
-        )
+        # Le document est créé en arrière-plan, au nom de l'utilisateur connecté
+        # (transfert vers le stockage, empreinte, indexation, aperçus)
+        uploads.stage_upload(request.user, title, uploaded_file, folder=folder)
 
-        messages.success(request, "Document téléversé avec succès !")
+        messages.success(request, "Document reçu, il apparaîtra dans quelques instants.")
         return redirect('home')
 
-    # Afficher uniquement les dossiers de l'utilisateur connecté
-    folders = Folder.objects.filter(owner=request.user)
-    return render(request, 'files/upload.html', {'folders': folders})
+    return upload_form(request)
+
+
+def upload_form(request, status=200):
+    # Afficher uniquement les dossiers de l'utilisateur connecté, dans l'ordre de l'arborescence
+    folders = Folder.objects.filter(owner=request.user).order_by('path')
+    return render(request, 'files/upload.html', {
+        'folders': folders,
+        'usage': usage.get_usage(request.user),
+    }, status=status)
+
+
+def quota_exceeded(request):
+    messages.error(request, "Espace de stockage insuffisant pour ce fichier.")
+    return upload_form(request, status=413)
+
+
+def upload_session_payload(session):
+    return {
+        'id': str(session.pk),
+        'offset': session.received_size,
+        'size': session.total_size,
+        'status': session.status,
+        'chunk_size': settings.FILES_UPLOAD_CHUNK_SIZE,
+        'document': session.document_id,
+        'error': session.error,
+    }
+
+
+@login_required(login_url='login')
+@require_POST
+def upload_session_create(request):
+    """
+    Ouvre une session de téléversement par morceaux.
+    Attend title, filename, size et éventuellement folder.
+    """
+    title = (request.POST.get('title') or '').strip()
+    filename = request.POST.get('filename') or ''
+    try:
+        total_size = int(request.POST.get('size', ''))
+    except ValueError:
+        total_size = -1
+    if not title or not filename or total_size < 0:
+        return JsonResponse({'error': "Titre, nom de fichier et taille sont obligatoires."}, status=400)
+
+    # Vérification de sécurité : s'assurer que le dossier appartient bien à l'utilisateur
+    folder_id = request.POST.get('folder')
+    folder = Folder.objects.filter(owner=request.user, id=folder_id).first() if folder_id and folder_id.isdigit() else None
+
+    # Refus immédiat si le fichier annoncé ne tient pas dans l'espace restant
+    try:
+        usage.check_quota(request.user, total_size)
+    except usage.QuotaExceeded as e:
+        return JsonResponse({'error': str(e)}, status=413)
+
+    session = uploads.start_session(request.user, title, filename, total_size, folder=folder)
+    return JsonResponse(upload_session_payload(session), status=201)
+
+
+@login_required(login_url='login')
+@require_http_methods(['GET', 'PUT'])
+def upload_session_detail(request, session_id):
+    """
+    GET : position atteinte, pour reprendre après une coupure.
+    PUT : ajoute le morceau contenu dans le corps, à la position Upload-Offset.
+    """
+    session = get_object_or_404(UploadSession, id=session_id, owner=request.user)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': "En-tête Upload-Offset manquant."}, status=400)
+        try:
+            uploads.append_chunk(session, offset, request, length)
+        except uploads.UploadError as e:
+            session.refresh_from_db()
+            return JsonResponse(dict(upload_session_payload(session), error=str(e)), status=e.status)
+
+    return JsonResponse(upload_session_payload(session))
+
+
+@login_required(login_url='login')
+@require_POST
+def upload_session_complete(request, session_id):
+    """
+    Termine la session : le fichier est transmis au stockage en arrière-plan.
+    """
+    session = get_object_or_404(UploadSession, id=session_id, owner=request.user)
+    try:
+        # D'autres téléversements ont pu se terminer depuis l'ouverture de la session
+        usage.check_quota(request.user, session.total_size)
+        uploads.complete_session(session)
+    except usage.QuotaExceeded as e:
+        return JsonResponse(dict(upload_session_payload(session), error=str(e)), status=413)
+    except uploads.UploadError as e:
+        return JsonResponse(dict(upload_session_payload(session), error=str(e)), status=e.status)
+    return JsonResponse(upload_session_payload(session), status=202)
 
 
 
@@ -126,6 +262,8 @@ def create_folder(request):
     parent_id = request.GET.get('parent')
     parent_folder = None
     if parent_id:
+        if not parent_id.isdigit():
+            raise Http404("Dossier introuvable.")
         parent_folder = get_object_or_404(Folder, id=parent_id, owner=request.user)
     
     if request.method == 'POST':
@@ -180,10 +318,10 @@ def delete_folder(request, folder_id):
     if not folder:
         return HttpResponseForbidden("Vous n'êtes pas autorisé à supprimer ce dossier.")
     
-    # Supprimer tous les documents du dossier puis le dossier lui-même
+    # Supprimer le dossier, ses sous-dossiers et tous leurs documents ;
+    # les fichiers sont retirés du stockage en arrière-plan
     folder_name = folder.name
-    folder.documents.all().delete()
-    folder.delete()
+    delete_folder_tree(folder)
     
     messages.success(request, f"Le dossier '{folder_name}' et son contenu ont été supprimés avec succès.")
     return HttpResponseRedirect(reverse('home'))
@@ -237,17 +375,252 @@ def rename_folder(request, folder_id):
 def view_folder(request, folder_id):
     folder = get_object_or_404(Folder, id=folder_id)
 
-    if folder.owner != request.user:
+    if folder.owner_id != request.user.pk:
         return HttpResponseForbidden("Interdit.")
 
-    # Récupère les documents et les sous-dossiers
-    documents = Document.objects.filter(folder=folder, owner=request.user)
-    subfolders = Folder.objects.filter(parent=folder, owner=request.user)
+    # Récupère la première page de documents et les sous-dossiers
+    folder_documents = Document.objects.filter(owner=request.user, folder=folder).select_related('blob')
+    try:
+        page = keyset_page(folder_documents, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur de pagination invalide.")
+    subfolders = folder_listing(request.user, parent=folder, preview=0)
 
     return render(request, 'files/folder_detail.html', {
         'folder': folder,
-        'documents': documents,
-        'subfolders': subfolders
+        'ancestors': folder.ancestors(),
+        'subtree_document_count': folder.subtree_document_count(),
+        'subtree_used_bytes': folder.subtree_used_bytes(),
+        'documents': page.documents,
+        'documents_count': folder_documents.count(),
+        'next_cursor': page.next_cursor,
+        'subfolders': subfolders,
+        'move_targets': move_targets(request.user),
+    })
+
+
+@login_required(login_url='login')
+def document_rows(request):
+    """
+    Fragment JSON pour le chargement progressif des listes de documents.
+    Retourne les lignes HTML de la page suivant `cursor`, pour la racine
+    ou pour le dossier `folder` de l'utilisateur connecté.
+    """
+    folder = None
+    folder_id = request.GET.get('folder')
+    if folder_id:
+        # Identifiant non numérique : introuvable plutôt qu'une erreur de conversion
+        if not folder_id.isdigit():
+            raise Http404("Dossier introuvable.")
+        folder = get_object_or_404(Folder, id=folder_id, owner=request.user)
+
+    documents = Document.objects.filter(owner=request.user, folder=folder).select_related('blob')
+    try:
+        page = keyset_page(documents, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Curseur de pagination invalide.")
+
+    html = render_to_string('files/partials/document_rows.html', {'documents': page.documents}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+
+@login_required(login_url='login')
+@require_GET
+def folder_tree(request):
+    """
+    Arborescence des dossiers de l'utilisateur connecté en JSON (voir
+    folder_tree.py). Avec ?since=N, seulement les changements depuis la
+    version N ; 304 si l'ETag envoyé correspond à la version courante.
+    """
+    version = tree_version(request.user.pk)
+    etag = tree_etag(version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        since = request.GET.get('since', '')
+        payload = tree_payload(request.user.pk, int(since) if since.isdigit() else None, version=version)
+        response = JsonResponse(payload)
+    response['ETag'] = etag
+    # Toujours revalidé : la réponse change à chaque écriture sur les dossiers
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required(login_url='login')
+def download_document(request, document_id):
+    """
+    Vue pour ouvrir ou télécharger (?download=1) un document.
+    Seul le propriétaire du document peut y accéder.
+    """
+    document = get_object_or_404(Document, id=document_id, owner=request.user)
+    return document_response(request, document, as_attachment='download' in request.GET)
+
+
+@login_required(login_url='login')
+def download_folder(request, folder_id):
+    """
+    Télécharge un dossier et tout son contenu dans une archive ZIP,
+    produite au fil de l'envoi.
+    """
+    folder = get_object_or_404(Folder, id=folder_id, owner=request.user)
+    return folder_zip_response(folder)
+
+
+@login_required(login_url='login')
+def document_versions(request, document_id):
+    """
+    Historique des versions d'un document ; POST : envoi d'une nouvelle
+    version, créée en arrière-plan comme un téléversement classique.
+    """
+    document = get_object_or_404(Document, id=document_id, owner=request.user)
+
+    if request.method == 'POST':
+        uploaded_file = request.FILES.get('file')
+        # Fichier refusé pendant sa réception, voir upload_handlers.py
+        if getattr(request, 'upload_quota_exceeded', False):
+            return version_quota_exceeded(request, document)
+        if uploaded_file is None:
+            messages.error(request, "Aucun fichier reçu.")
+            return redirect('document_versions', document.id)
+        # Contenu identique (empreinte calculée à la réception) : rien à envoyer
+        if getattr(uploaded_file, 'checksum', None) == document.checksum:
+            messages.info(request, "Ce fichier est identique à la version actuelle : aucune version créée.")
+            return redirect('document_versions', document.id)
+        try:
+            usage.check_quota(request.user, uploaded_file.size, getattr(request, 'storage_usage', None))
+        except usage.QuotaExceeded:
+            return version_quota_exceeded(request, document)
+
+        uploaded_file.name = uploaded_file.name.replace(" ", "_")
+        uploads.stage_upload(request.user, document.title, uploaded_file, document=document)
+        messages.success(request, "Nouvelle version reçue, elle sera disponible dans quelques instants.")
+        return redirect('document_versions', document.id)
+
+    return render(request, 'files/document_versions.html', {
+        'document': document, 'versions': document.versions.all(),
+    })
+
+
+def version_quota_exceeded(request, document):
+    messages.error(request, "Espace de stockage insuffisant pour ce fichier.")
+    return render(request, 'files/document_versions.html', {
+        'document': document, 'versions': document.versions.all(),
+    }, status=413)
+
+
+@login_required(login_url='login')
+def download_version(request, document_id, number):
+    """
+    Téléchargement d'une version remplacée, pour le propriétaire du document.
+    """
+    version = get_object_or_404(
+        DocumentVersion.objects.select_related('document'),
+        document_id=document_id, document__owner=request.user, number=number,
+    )
+    return document_response(request, version, as_attachment=True)
+
+
+@login_required(login_url='login')
+def document_preview(request, document_id, variant):
+    """
+    Vignette ou aperçu d'un document, pour son propriétaire uniquement.
+    """
+    if variant not in previews.VARIANTS:
+        raise Http404("Variante d'aperçu inconnue.")
+    document = get_object_or_404(Document.objects.select_related('blob'), id=document_id, owner=request.user)
+    blob = document.blob
+    if blob is None or blob.preview_status != blob.PREVIEW_READY:
+        raise Http404("Aucun aperçu pour ce document.")
+    return derived_file_response(getattr(blob, variant))
+
+
+def bulk_request(request):
+    """
+    Corps JSON d'une opération groupée, ou None s'il est invalide.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    return payload
+
+
+def bulk_ids(values):
+    """
+    Liste d'identifiants entiers, ou None si `values` n'en est pas une.
+    """
+    if not isinstance(values, list) or not 0 < len(values) <= bulk.MAX_BULK_ITEMS:
+        return None
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required(login_url='login')
+@require_POST
+def bulk_move_documents(request):
+    """
+    Déplace plusieurs documents : {"ids": [...], "folder": id ou null}.
+    """
+    payload = bulk_request(request) or {}
+    ids = bulk_ids(payload.get('ids'))
+    if ids is None:
+        return JsonResponse({'error': "Liste d'identifiants invalide."}, status=400)
+
+    # Vérification de sécurité : s'assurer que le dossier appartient bien à l'utilisateur
+    folder = None
+    if payload.get('folder'):
+        folder_id = str(payload['folder'])
+        folder = Folder.objects.filter(owner=request.user, id=folder_id).first() if folder_id.isdigit() else None
+        if folder is None:
+            return JsonResponse({'error': "Dossier introuvable."}, status=400)
+
+    return JsonResponse(bulk.move_documents(request.user, ids, folder))
+
+
+@login_required(login_url='login')
+@require_POST
+def bulk_delete_documents(request):
+    """
+    Supprime plusieurs documents : {"ids": [...]}.
+    """
+    ids = bulk_ids((bulk_request(request) or {}).get('ids'))
+    if ids is None:
+        return JsonResponse({'error': "Liste d'identifiants invalide."}, status=400)
+    return JsonResponse(bulk.delete_documents(request.user, ids))
+
+
+@login_required(login_url='login')
+@require_POST
+def bulk_rename_documents(request):
+    """
+    Renomme plusieurs documents : {"titles": {"id": "nouveau titre", ...}}.
+    """
+    titles = (bulk_request(request) or {}).get('titles')
+    ids = bulk_ids(list(titles)) if isinstance(titles, dict) else None
+    if ids is None:
+        return JsonResponse({'error': "Liste de titres invalide."}, status=400)
+    titles = {pk: title if isinstance(title, str) else '' for pk, title in zip(ids, titles.values())}
+    return JsonResponse(bulk.rename_documents(request.user, titles))
+
+
+@login_required(login_url='login')
+def search(request):
+    """
+    Recherche plein texte dans les documents de l'utilisateur connecté
+    (titre, nom du dossier et contenu extrait), par ordre de pertinence.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return redirect('home')
+
+    return render(request, 'files/search.html', {
+        'documents': search_documents(request.user, query),
+        'search_query': query,
+        'move_targets': move_targets(request.user),
     })
 
 
@@ -293,13 +666,63 @@ def move_document(request, document_id):
             )
             return redirect('home')
 
-    # GET : Affiche le formulaire de déplacement
-    # Définition du dossier courant du document
-    current_folder = document.folder
-    folders = Folder.objects.filter(owner=request.user).exclude(id=document.folder.id if document.folder else None)
-    
+    # GET : Affiche le formulaire de déplacement ; les destinations
+    # viennent de l'arborescence gardée en cache par le navigateur (folder_tree)
     return render(request, 'files/move_document.html', {
         'document': document,
-        'folders': folders,
-        'current_folder': current_folder
+        'current_folder': document.folder,
     })
+
+
+@login_required(login_url='login')
+def move_folder(request, folder_id):
+    """
+    Vue pour déplacer un dossier (avec tout son contenu) sous un autre dossier.
+    Seul le propriétaire peut le déplacer, et jamais dans son propre sous-arbre.
+    """
+    folder = get_object_or_404(Folder, id=folder_id, owner=request.user)
+
+    if request.method == 'POST':
+        parent_id = request.POST.get('parent')
+        if parent_id and not parent_id.isdigit():
+            raise Http404("Dossier introuvable.")
+        new_parent = get_object_or_404(Folder, id=parent_id, owner=request.user) if parent_id else None
+        try:
+            move_folder_tree(folder, new_parent)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect('move_folder', folder_id=folder.id)
+
+        messages.success(request, f"Le dossier « {folder.name} » a été déplacé avec succès.")
+        return redirect('view_folder', folder_id=folder.id)
+
+    # Destinations possibles (tous les dossiers hors du sous-arbre déplacé) :
+    # filtrées dans le navigateur depuis l'arborescence en cache (folder_tree)
+    return render(request, 'files/move_folder.html', {'folder': folder})
+
+
+@staff_member_required
+def storage_stats(request):
+    """
+    Statistiques du cache local du stockage (taux de succès, taille),
+    pour le processus qui répond. Réservé à l'équipe.
+    """
+    return JsonResponse({'cache': default_storage_stats()})
+
+
+def metrics(request):
+    """
+    Mesures par vue au format Prometheus (voir instrumentation.py), pour le
+    processus qui répond. Accessible à l'équipe ou avec le jeton
+    FILES_METRICS_TOKEN (Authorization: Bearer ...).
+    """
+    token = getattr(settings, 'FILES_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(authorization, f'Bearer {token}')
+    )
+    if not authorized:
+        return HttpResponseForbidden("Accès réservé.")
+    return HttpResponse(
+        prometheus_text(default_storage_stats()), content_type='text/plain; version=0.0.4; charset=utf-8',
+    )